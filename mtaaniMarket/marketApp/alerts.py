@@ -0,0 +1,185 @@
+# marketApp/alerts.py
+import atexit
+import logging
+import threading
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import Notification, Wishlist
+from .notifications import get_config as get_notification_config, write_notifications
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    'ASYNC': True,              # match on a background thread, not in the request
+    'FLUSH_INTERVAL': 2,        # seconds changes are buffered before matching
+    'MIN_DROP_PERCENT': 0,      # smaller price drops don't alert
+    'PRODUCT_BATCH': 200,       # products per Wishlist join
+    # At most MAX_PER_USER wishlist alerts per user per RATE_WINDOW_HOURS,
+    # later ones are dropped
+    'MAX_PER_USER': 5,
+    'RATE_WINDOW_HOURS': 24,
+}
+
+ALERT_TYPES = ['price_drop', 'wishlist_available']
+
+# Product fields the alerts are computed from
+WATCHED_FIELDS = ['price', 'status', 'quantity']
+
+
+def get_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'MARKET_WISHLIST_ALERTS', {}))
+    return config
+
+
+def product_alerts(previous, product, config=None):
+    """
+    Alerts for a saved product given its previous price/status/quantity:
+    a price drop while active, and coming back to active with stock.
+    """
+    config = config or get_config()
+    alerts = []
+    available = product.status == 'active' and product.quantity > 0
+    was_available = previous['status'] == 'active' and previous['quantity'] > 0
+
+    if available and not was_available:
+        alerts.append({
+            'product_id': product.pk,
+            'notification_type': 'wishlist_available',
+            'title': 'Wishlist item available',
+            'message': f'{product.title} from your wishlist is available again at Ksh {product.price}',
+        })
+    elif available and product.price < previous['price']:
+        drop = (previous['price'] - product.price) * 100 / previous['price'] if previous['price'] else 0
+        if drop >= config['MIN_DROP_PERCENT']:
+            alerts.append({
+                'product_id': product.pk,
+                'notification_type': 'price_drop',
+                'title': 'Price drop on your wishlist',
+                'message': f'{product.title} dropped from Ksh {previous["price"]} to Ksh {product.price}',
+            })
+    return alerts
+
+
+def match_alerts(alerts, config=None):
+    """
+    Turn product alerts into notifications for everyone wishlisting the
+    products: one Wishlist join per PRODUCT_BATCH products, then per-user
+    rate limits and write_notifications() per chunk of users.
+    Returns {'notified', 'coalesced', 'rate_limited'}.
+    """
+    config = config or get_config()
+    chunk_size = get_notification_config()['CHUNK_SIZE']
+    # A product changed twice before matching alerts once per type, with the latest text
+    latest = {(alert['product_id'], alert['notification_type']): alert for alert in alerts}
+    by_product = defaultdict(list)
+    for alert in latest.values():
+        by_product[alert['product_id']].append(alert)
+    totals = Counter(notified=0, coalesced=0, rate_limited=0)
+
+    product_ids = sorted(by_product)
+    for start in range(0, len(product_ids), config['PRODUCT_BATCH']):
+        batch = product_ids[start:start + config['PRODUCT_BATCH']]
+        per_user = defaultdict(list)
+        for product_id, user_id in Wishlist.objects.filter(product_id__in=batch).order_by().values_list(
+            'product_id', 'user_id'
+        ):
+            per_user[user_id].extend(by_product[product_id])
+
+        user_ids = sorted(per_user)
+        for offset in range(0, len(user_ids), chunk_size):
+            chunk = user_ids[offset:offset + chunk_size]
+            since = timezone.now() - timedelta(hours=config['RATE_WINDOW_HOURS'])
+            recent = dict(
+                Notification.objects.filter(
+                    user_id__in=chunk, notification_type__in=ALERT_TYPES, created_at__gte=since
+                ).values_list('user_id').annotate(n=Count('pk')).order_by()
+            )
+            notifications = []
+            for user_id in chunk:
+                allowed = max(config['MAX_PER_USER'] - recent.get(user_id, 0), 0)
+                user_alerts = per_user[user_id]
+                totals['rate_limited'] += max(len(user_alerts) - allowed, 0)
+                notifications.extend(
+                    Notification(
+                        user_id=user_id, notification_type=alert['notification_type'],
+                        title=alert['title'], message=alert['message'],
+                        related_object_id=alert['product_id'], related_content_type='product',
+                    )
+                    for alert in user_alerts[:allowed]
+                )
+            created, coalesced = write_notifications(notifications)
+            totals['notified'] += created
+            totals['coalesced'] += coalesced
+    return dict(totals)
+
+
+class AlertMatcher:
+    """
+    Write-behind wishlist alert matching, like the view counter. record()
+    buffers the alerts of a committed product change; a worker thread
+    matches everything buffered every FLUSH_INTERVAL seconds, so a seller
+    repricing many products costs one Wishlist join per batch.
+    """
+
+    def __init__(self):
+        self._pending = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._worker = None
+
+    def record(self, alerts):
+        config = get_config()
+        if not config['ASYNC']:
+            match_alerts(alerts, config)
+            return
+        with self._lock:
+            self._pending.extend(alerts)
+        self._ensure_worker(config)
+
+    def flush(self):
+        """Match every buffered alert now, returns match_alerts()'s totals"""
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return {}
+        return match_alerts(batch)
+
+    def _ensure_worker(self, config):
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(
+                target=self._run, args=(config['FLUSH_INTERVAL'],),
+                name='wishlist-alerts', daemon=True
+            )
+            self._worker.start()
+
+    def _run(self, interval):
+        while True:
+            self._wakeup.wait(interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Failed to match wishlist alerts')
+            finally:
+                close_old_connections()
+
+
+alert_matcher = AlertMatcher()
+
+
+@atexit.register
+def _flush_on_exit():
+    try:
+        alert_matcher.flush()
+    except Exception:
+        logger.exception('Failed to match wishlist alerts on exit')
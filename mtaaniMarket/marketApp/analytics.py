@@ -0,0 +1,161 @@
+# marketApp/analytics.py
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import Analytics, Order, Product, WhatsAppContact
+
+
+def get_watermark():
+    """Last day that has been rolled up, or None before the first run"""
+    return Analytics.objects.aggregate(last=Max('date'))['last']
+
+
+def _first_activity_date():
+    dates = [
+        Order.objects.aggregate(first=Min('created_at'))['first'],
+        WhatsAppContact.objects.aggregate(first=Min('contact_time'))['first'],
+    ]
+    dates = [timezone.localdate(d) for d in dates if d]
+    return min(dates) if dates else None
+
+
+def rollup_analytics(since=None, until=None):
+    """
+    Fill Analytics with one row per seller per day.
+
+    Only days after the watermark (the newest Analytics.date) are processed
+    unless `since` is given. `until` defaults to yesterday, so the current,
+    still-changing day is never rolled up. Each source table is read with
+    a single grouped query over the whole range, and rows are upserted, so
+    re-running a range is safe.
+
+    Product views are only stored as a running total, not per day, so all
+    the views gained since the previous rollup are attributed to the last
+    processed day: a catch-up over several days shows them on `end` alone.
+
+    Returns (start, end, rows_written); start is None when there is nothing to do.
+    """
+    end = until or timezone.localdate() - timedelta(days=1)
+    if since:
+        start = since
+    else:
+        watermark = get_watermark()
+        start = watermark + timedelta(days=1) if watermark else _first_activity_date()
+    if start is None or start > end:
+        return None, end, 0
+
+    rows = {}
+
+    def row(seller_id, day):
+        key = (seller_id, day)
+        if key not in rows:
+            rows[key] = Analytics(seller_id=seller_id, date=day)
+        return rows[key]
+
+    # Completed orders count as sales on the day they were completed
+    sales = Order.objects.filter(
+        status='completed',
+        completed_at__date__gte=start,
+        completed_at__date__lte=end,
+    ).annotate(day=TruncDate('completed_at')).values('seller_id', 'day').annotate(
+        sold=Count('pk'),
+        revenue=Sum(F('agreed_price') * F('quantity')),
+    ).order_by()
+    for item in sales:
+        analytics = row(item['seller_id'], item['day'])
+        analytics.products_sold = item['sold']
+        analytics.total_revenue = item['revenue'] or Decimal('0')
+
+    # New interests, used for the conversion rate
+    interests = Order.objects.filter(
+        created_at__date__gte=start,
+        created_at__date__lte=end,
+    ).annotate(day=TruncDate('created_at')).values('seller_id', 'day').annotate(
+        created=Count('pk'),
+    ).order_by()
+    created_by_day = {(item['seller_id'], item['day']): item['created'] for item in interests}
+    for key in created_by_day:
+        row(*key)
+
+    contacts = WhatsAppContact.objects.filter(
+        contact_time__date__gte=start,
+        contact_time__date__lte=end,
+    ).annotate(day=TruncDate('contact_time')).values('seller_id', 'day').annotate(
+        contacts=Count('pk'),
+    ).order_by()
+    for item in contacts:
+        row(item['seller_id'], item['day']).whatsapp_contacts = item['contacts']
+
+    # Views gained since the rollups before `end`
+    totals = Product.objects.values('seller_id').annotate(views=Coalesce(Sum('views'), 0)).order_by()
+    counted = dict(
+        Analytics.objects.filter(date__lt=end).values('seller_id').annotate(
+            views=Coalesce(Sum('products_viewed'), 0)
+        ).values_list('seller_id', 'views').order_by()
+    )
+    for item in totals:
+        gained = item['views'] - counted.get(item['seller_id'], 0)
+        if gained > 0:
+            row(item['seller_id'], end).products_viewed = gained
+
+    # Re-processed earlier days keep the views they were given at the time
+    stored_views = Analytics.objects.filter(
+        date__gte=start, date__lt=end, products_viewed__gt=0
+    ).values_list('seller_id', 'date', 'products_viewed')
+    for seller_id, day, views in stored_views:
+        row(seller_id, day).products_viewed = views
+
+    for (seller_id, day), analytics in rows.items():
+        created = created_by_day.get((seller_id, day), 0)
+        if created:
+            rate = Decimal(analytics.products_sold * 100) / created
+            analytics.conversion_rate = min(rate, Decimal('100')).quantize(Decimal('0.01'))
+
+    with transaction.atomic():
+        Analytics.objects.bulk_create(
+            rows.values(),
+            batch_size=500,
+            update_conflicts=True,
+            unique_fields=['seller', 'date'],
+            update_fields=[
+                'products_viewed', 'products_sold', 'total_revenue',
+                'whatsapp_contacts', 'conversion_rate',
+            ],
+        )
+    return start, end, len(rows)
+
+
+def seller_time_series(seller, days=30):
+    """
+    Daily rollups for the last `days` rolled-up days (up to yesterday), with
+    missing days filled with zeros. Reads at most `days` rows via the
+    (seller, date) unique index.
+    """
+    end = timezone.localdate() - timedelta(days=1)
+    start = end - timedelta(days=days - 1)
+    stored = {
+        a.date: a for a in Analytics.objects.filter(seller=seller, date__gte=start, date__lte=end)
+    }
+    series = []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        series.append(stored.get(day) or Analytics(seller=seller, date=day))
+    return series
+
+
+def seller_totals(seller, since=None):
+    """Sum the rollups of a seller, optionally from a given day"""
+    rollups = Analytics.objects.filter(seller=seller)
+    if since:
+        rollups = rollups.filter(date__gte=since)
+    return rollups.aggregate(
+        views=Coalesce(Sum('products_viewed'), 0),
+        sales=Coalesce(Sum('products_sold'), 0),
+        revenue=Coalesce(Sum('total_revenue'), Decimal('0')),
+        contacts=Coalesce(Sum('whatsapp_contacts'), 0),
+    )
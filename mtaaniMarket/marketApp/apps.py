@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class MarketappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'marketApp'
+
+    def ready(self):
+        from . import database, signals  # noqa: F401
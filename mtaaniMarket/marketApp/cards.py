@@ -0,0 +1,122 @@
+# marketApp/cards.py
+"""
+Denormalized product card fields. Product rows carry everything a card
+renders (primary image and its variants, seller name and rating, interest
+and wishlist counts) so listings read a single table. The signal handlers
+keep them current, rebuild_product_cards repairs them after bulk writes.
+Every helper writes with update() or bulk_update(), which send no
+post_save, so each invalidates the 'products' page cache tag itself.
+"""
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import Order, Product, ProductImage, ProductImageVariant, Profile, Wishlist
+from .page_cache import invalidate_tags
+
+
+def _ids(values):
+    return sorted({value for value in values if value is not None})
+
+
+def refresh_card_images(*product_ids):
+    """Copy the first image in display order, with its variants, onto each product"""
+    product_ids = _ids(product_ids)
+    if not product_ids:
+        return
+    first = {}
+    images = ProductImage.objects.filter(product_id__in=product_ids).order_by(
+        'product_id', '-is_primary', 'uploaded_at', 'pk'
+    ).values_list('product_id', 'pk', 'image')
+    for product_id, image_id, name in images:
+        first.setdefault(product_id, (image_id, name))
+
+    variants = {}
+    rows = ProductImageVariant.objects.filter(
+        image_id__in=[image_id for image_id, _ in first.values()]
+    ).order_by('format', 'width').values_list('image_id', 'format', 'width', 'file')
+    for image_id, image_format, width, name in rows:
+        variants.setdefault(image_id, []).append([image_format, width, name])
+
+    products = []
+    for product_id in product_ids:
+        image_id, name = first.get(product_id, (None, ''))
+        products.append(Product(pk=product_id, card_image=name, card_image_variants=variants.get(image_id, [])))
+    Product.objects.bulk_update(products, ['card_image', 'card_image_variants'])
+    invalidate_tags('products')
+
+
+def refresh_seller_cards(*user_ids, products=None):
+    """Copy seller usernames and ratings onto their products"""
+    if products is None:
+        user_ids = _ids(user_ids)
+        if not user_ids:
+            return
+        products = Product.objects.filter(seller_id__in=user_ids)
+    usernames = User.objects.filter(pk=OuterRef('seller_id')).values('username')[:1]
+    ratings = Profile.objects.filter(user_id=OuterRef('seller_id')).values('rating')[:1]
+    if products.update(
+        seller_name=Subquery(usernames),
+        seller_rating=Coalesce(
+            Subquery(ratings), Value(Decimal('0')), output_field=models.DecimalField(max_digits=3, decimal_places=2)
+        ),
+    ):
+        invalidate_tags('products')
+
+
+def copy_seller_rating(user_id, rating):
+    """Called when a profile is saved; only touches products whose snapshot is stale"""
+    rating = Decimal(rating).quantize(Decimal('0.01'))
+    if Product.objects.filter(seller_id=user_id).exclude(seller_rating=rating).update(seller_rating=rating):
+        invalidate_tags('products')
+
+
+def copy_seller_name(user_id, username):
+    if Product.objects.filter(seller_id=user_id).exclude(seller_name=username).update(seller_name=username):
+        invalidate_tags('products')
+
+
+def _count(model):
+    return Coalesce(Subquery(
+        model.objects.filter(product=OuterRef('pk')).order_by().values('product').annotate(
+            n=Count('pk')
+        ).values('n')
+    ), 0)
+
+
+def refresh_interest_counts(*product_ids, products=None):
+    """Recount orders per product; a recount rather than +1/-1 so drift heals itself"""
+    if products is None:
+        products = Product.objects.filter(pk__in=_ids(product_ids))
+    if products.update(interest_count=_count(Order)):
+        invalidate_tags('products')
+
+
+def refresh_wishlist_counts(*product_ids, products=None):
+    if products is None:
+        products = Product.objects.filter(pk__in=_ids(product_ids))
+    if products.update(wishlist_count=_count(Wishlist)):
+        invalidate_tags('products')
+
+
+def rebuild_product_cards(batch_size=1000):
+    """Recompute the card fields of every product, batch by batch; returns the number of products"""
+    rebuilt = 0
+    last_pk = 0
+    while True:
+        batch = list(
+            Product.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size]
+        )
+        if not batch:
+            break
+        last_pk = batch[-1]
+        products = Product.objects.filter(pk__in=batch)
+        refresh_seller_cards(products=products)
+        refresh_interest_counts(products=products)
+        refresh_wishlist_counts(products=products)
+        refresh_card_images(*batch)
+        rebuilt += len(batch)
+    return rebuilt
@@ -0,0 +1,130 @@
+# marketApp/categories.py
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from .models import Category
+
+# Seconds a built tree stays cached; changes invalidate it earlier
+DEFAULT_TIMEOUT = 3600
+
+VERSION_KEY = 'categories:version'
+
+
+class CategoryNode:
+    """A cached category with its children and product counts rolled up from subcategories"""
+
+    def __init__(self, id, name, description, icon, is_featured, parent_id, own_products, own_active_products):
+        self.id = self.pk = id
+        self.name = name
+        self.description = description
+        self.icon = icon
+        self.is_featured = is_featured
+        self.parent_id = parent_id
+        self.own_products = own_products
+        self.own_active_products = own_active_products
+        self.total_products = own_products
+        self.active_products = own_active_products
+        self.depth = 0
+        self.children = []
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        return f'<CategoryNode {self.id}: {self.name}>'
+
+
+class CategoryTree:
+    """The whole category hierarchy, iterates depth-first with parents before children"""
+
+    def __init__(self, nodes):
+        self.nodes = {node.id: node for node in nodes}
+        self.roots = []
+        for node in nodes:
+            parent = self.nodes.get(node.parent_id)
+            if parent:
+                parent.children.append(node)
+            else:
+                self.roots.append(node)
+
+        self._ordered = []
+        seen = set()
+
+        def visit(node, depth):
+            # Guards against a parent cycle saved through the admin
+            if node.id in seen:
+                return
+            seen.add(node.id)
+            node.depth = depth
+            self._ordered.append(node)
+            for child in node.children:
+                visit(child, depth + 1)
+
+        for root in self.roots:
+            visit(root, 0)
+
+        # Roll the counts up, deepest categories first
+        for node in sorted(self._ordered, key=lambda n: n.depth, reverse=True):
+            parent = self.nodes.get(node.parent_id)
+            if parent and parent.id in seen and parent.depth < node.depth:
+                parent.total_products += node.total_products
+                parent.active_products += node.active_products
+
+    def __iter__(self):
+        return iter(self._ordered)
+
+    def __len__(self):
+        return len(self._ordered)
+
+    def get(self, pk):
+        return self.nodes.get(int(pk)) if str(pk).isdigit() else None
+
+    def featured(self):
+        return [node for node in self._ordered if node.is_featured]
+
+    def choices(self, empty_label=None):
+        """(id, label) pairs for a select, subcategories indented under their parent"""
+        choices = [('', empty_label)] if empty_label is not None else []
+        for node in self._ordered:
+            choices.append((node.id, f"{'— ' * node.depth}{node.name}"))
+        return choices
+
+
+def build_category_tree():
+    """Load every category with its product counts in a single query"""
+    rows = Category.objects.order_by('name').annotate(
+        own_products=Count('products'),
+        own_active_products=Count('products', filter=Q(products__status='active')),
+    ).values_list(
+        'id', 'name', 'description', 'icon', 'is_featured', 'parent_id',
+        'own_products', 'own_active_products',
+    )
+    return CategoryTree([CategoryNode(*row) for row in rows])
+
+
+def get_category_tree():
+    """The cached category tree, rebuilt after any Category or Product change"""
+    timeout = getattr(settings, 'MARKET_CATEGORY_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+    if not timeout:
+        return build_category_tree()
+
+    version = cache.get(VERSION_KEY, 1)
+    key = f'categories:tree:{version}'
+    tree = cache.get(key)
+    if tree is None:
+        tree = build_category_tree()
+        cache.set(key, tree, timeout)
+    return tree
+
+
+def get_category_version():
+    """Changes whenever the cached tree is invalidated"""
+    return cache.get(VERSION_KEY, 1)
+
+
+def invalidate_category_tree():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 2, None)
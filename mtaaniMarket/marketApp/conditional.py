@@ -0,0 +1,59 @@
+# marketApp/conditional.py
+import hashlib
+
+from django.contrib import messages
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .models import Product, ProductImage, Review
+
+
+def make_etag(*parts):
+    """A quoted ETag from anything whose repr changes when the page does"""
+    return quote_etag(hashlib.md5(repr(parts).encode()).hexdigest())
+
+
+def set_validators(response, etag, last_modified=None):
+    """
+    Add ETag/Last-Modified and make browsers revalidate instead of reusing
+    the page blindly; private because pages differ per user.
+    """
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def not_modified(request, etag, last_modified=None):
+    """Return a 304 when the client's copy is still current, otherwise None"""
+    # Pending flash messages would never be shown on a cached page
+    if request.method not in ('GET', 'HEAD') or len(messages.get_messages(request)):
+        return None
+    headers = set_validators(HttpResponse(), etag, last_modified)
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp, response=headers)
+    return response if response is not headers else None
+
+
+def product_validators(product_id):
+    """
+    (fingerprint, last_modified) of a product page from the product, its
+    images and its reviews in a single query, or None if it doesn't exist.
+    """
+    images = ProductImage.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    reviews = Review.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    row = Product.objects.filter(pk=product_id).annotate(
+        image_count=Coalesce(Subquery(images.annotate(n=Count('pk')).values('n')), 0),
+        last_image=Subquery(images.annotate(last=Max('uploaded_at')).values('last')),
+        review_count=Coalesce(Subquery(reviews.annotate(n=Count('pk')).values('n')), 0),
+        last_review=Subquery(reviews.annotate(last=Max('updated_at')).values('last')),
+    ).values_list('updated_at', 'image_count', 'last_image', 'review_count', 'last_review').first()
+    if row is None:
+        return None
+    # Counts catch deletions, which leave the newest timestamp unchanged
+    last_modified = max(value for value in (row[0], row[2], row[4]) if value)
+    return row, last_modified
@@ -1,10 +1,13 @@
 # marketApp/context_processors.py
-from .models import Category
+from django.utils.functional import SimpleLazyObject
+
+from .categories import get_category_tree
 
 def categories_processor(request):
     """
-    Makes categories available in all templates
+    Makes categories available in all templates, read from the cached
+    category tree only when a template actually uses them
     """
     return {
-        'all_categories': Category.objects.all()
-    }
\ No newline at end of file
+        'all_categories': SimpleLazyObject(get_category_tree)
+    }
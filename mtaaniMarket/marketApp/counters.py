@@ -0,0 +1,60 @@
+# marketApp/counters.py
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+# Seconds a user's dashboard counts stay cached, 0 disables the cache
+DEFAULT_TIMEOUT = 300
+
+
+def status_counts(queryset, field='status', values=None, **extra_filters):
+    """
+    Count rows per value of `field` with a single conditional-aggregate query.
+
+    Returns a dict with 'total', one key per value (defaults to the field's
+    choices) and one key per extra Q filter, e.g.
+    status_counts(orders, pending=~Q(status__in=['completed', 'cancelled']))
+    """
+    if values is None:
+        values = [value for value, _ in queryset.model._meta.get_field(field).choices]
+
+    aggregates = {'total': Count('pk')}
+    for value in values:
+        aggregates[value] = Count('pk', filter=Q(**{field: value}))
+    for name, condition in extra_filters.items():
+        aggregates[name] = Count('pk', filter=condition)
+    return queryset.aggregate(**aggregates)
+
+
+def _version_key(user_id):
+    return f'counts:version:{user_id}'
+
+
+def invalidate_user_counts(*user_ids):
+    """Drop every cached count of the given users by bumping their version"""
+    for user_id in user_ids:
+        if user_id is None:
+            continue
+        key = _version_key(user_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 2, None)
+
+
+def cached_user_counts(user, name, compute):
+    """
+    Return compute() for a user, cached until one of the user's orders,
+    products, notifications or wishlist items changes.
+    """
+    timeout = getattr(settings, 'MARKET_COUNTER_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+    if not timeout:
+        return compute()
+
+    version = cache.get(_version_key(user.pk), 1)
+    key = f'counts:{name}:{user.pk}:{version}'
+    counts = cache.get(key)
+    if counts is None:
+        counts = compute()
+        cache.set(key, counts, timeout)
+    return counts
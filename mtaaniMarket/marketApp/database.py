@@ -0,0 +1,58 @@
+# marketApp/database.py
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+DEFAULTS = {
+    'ENABLED': True,
+    # 'WAL' lets readers and writers stop blocking each other. Opt-in: it is
+    # persistent, rewrites the database header and keeps -wal/-shm files
+    # next to it, which a database file checked into git should not get
+    'JOURNAL_MODE': None,
+    # Milliseconds a connection waits for a lock before "database is locked"
+    'BUSY_TIMEOUT': 5000,
+    # 'NORMAL' is safe with WAL (only the last transactions can be lost on
+    # power failure), keep SQLite's FULL with the rollback journal
+    'SYNCHRONOUS': None,
+    'MMAP_SIZE': 128 * 1024 * 1024,
+    # Negative values are KiB, so about 64 MB of page cache per connection
+    'CACHE_SIZE': -64000,
+    'TEMP_STORE': 'MEMORY',
+}
+
+
+def get_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'MARKET_SQLITE_PRAGMAS', {}))
+    return config
+
+
+def pragma_statements(config):
+    """PRAGMA statements for a config, settings set to None are left at SQLite's default"""
+    pragmas = {
+        'journal_mode': config['JOURNAL_MODE'],
+        'busy_timeout': config['BUSY_TIMEOUT'],
+        'synchronous': config['SYNCHRONOUS'],
+        'mmap_size': config['MMAP_SIZE'],
+        'cache_size': config['CACHE_SIZE'],
+        'temp_store': config['TEMP_STORE'],
+    }
+    return [f'PRAGMA {name} = {value}' for name, value in pragmas.items() if value is not None]
+
+
+def apply_pragmas(dbapi_connection, config=None):
+    """Run the configured pragmas on a raw sqlite3 connection"""
+    config = config or get_config()
+    for statement in pragma_statements(config):
+        dbapi_connection.execute(statement)
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    """Tune every new SQLite connection, see MARKET_SQLITE_PRAGMAS"""
+    if connection.vendor != 'sqlite':
+        return
+    config = get_config()
+    if config['ENABLED']:
+        # The raw connection keeps the pragmas out of connection.queries
+        apply_pragmas(connection.connection, config)
@@ -2,6 +2,17 @@
 from django.shortcuts import redirect
 from functools import wraps
 from django.contrib import messages
+from django.core.exceptions import ObjectDoesNotExist
+
+def get_profile(request):
+    """
+    Profile of the logged in user, or None. ProfileBackend loads it with the
+    user, so this and every template access share one object and no query.
+    """
+    try:
+        return request.user.profile
+    except (AttributeError, ObjectDoesNotExist):
+        return None
 
 def role_required(allowed_roles=[]):
     def decorator(view_func):
@@ -11,11 +22,12 @@ def role_required(allowed_roles=[]):
                 messages.warning(request, 'Please login to access this page.')
                 return redirect('login')
             
-            if not hasattr(request.user, 'profile'):
+            profile = get_profile(request)
+            if profile is None:
                 messages.error(request, 'Your account profile is incomplete. Please update your profile.')
                 return redirect('profile')
             
-            user_role = request.user.profile.role
+            user_role = profile.role
             
             if user_role in allowed_roles:
                 return view_func(request, *args, **kwargs)
@@ -46,13 +58,14 @@ def buyer_required(view_func):
             messages.warning(request, 'Please login to access this page.')
             return redirect('login')
         
-        if not hasattr(request.user, 'profile'):
+        profile = get_profile(request)
+        if profile is None:
             messages.error(request, 'Your account profile is incomplete.')
             return redirect('profile')
         
-        if request.user.profile.role != 'buyer':
+        if profile.role != 'buyer':
             messages.error(request, 'This page is only accessible to buyers.')
-            return redirect('seller_home' if request.user.profile.role == 'seller' else 'home')
+            return redirect('seller_home' if profile.role == 'seller' else 'home')
         
         return view_func(request, *args, **kwargs)
     
@@ -70,13 +83,14 @@ def seller_required(view_func):
             messages.warning(request, 'Please login to access this page.')
             return redirect('login')
         
-        if not hasattr(request.user, 'profile'):
+        profile = get_profile(request)
+        if profile is None:
             messages.error(request, 'Your account profile is incomplete.')
             return redirect('profile')
         
-        if request.user.profile.role != 'seller':
+        if profile.role != 'seller':
             messages.error(request, 'This page is only accessible to sellers.')
-            return redirect('buyer_home' if request.user.profile.role == 'buyer' else 'home')
+            return redirect('buyer_home' if profile.role == 'buyer' else 'home')
         
         return view_func(request, *args, **kwargs)
     
@@ -94,15 +108,16 @@ def admin_required(view_func):
             messages.warning(request, 'Please login to access this page.')
             return redirect('login')
         
-        if not hasattr(request.user, 'profile'):
+        profile = get_profile(request)
+        if profile is None:
             messages.error(request, 'Your account profile is incomplete.')
             return redirect('profile')
         
-        if request.user.profile.role != 'admin':
+        if profile.role != 'admin':
             messages.error(request, 'Access denied. Admin privileges required.')
-            if request.user.profile.role == 'buyer':
+            if profile.role == 'buyer':
                 return redirect('buyer_home')
-            elif request.user.profile.role == 'seller':
+            elif profile.role == 'seller':
                 return redirect('seller_home')
             else:
                 return redirect('home')
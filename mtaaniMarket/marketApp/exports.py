@@ -0,0 +1,135 @@
+# marketApp/exports.py
+import csv
+import datetime
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from .models import Order, WhatsAppContact
+
+# Rows fetched from the database per round trip
+CHUNK_SIZE = 2000
+
+FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+# (column, value of one row) pairs per export
+ORDER_COLUMNS = [
+    ('order_number', lambda o: o.order_number),
+    ('created_at', lambda o: o.created_at),
+    ('updated_at', lambda o: o.updated_at),
+    ('status', lambda o: o.status),
+    ('product_id', lambda o: o.product_id),
+    ('product', lambda o: o.product.title),
+    ('buyer', lambda o: o.buyer.username),
+    ('seller', lambda o: o.seller.username),
+    ('quantity', lambda o: o.quantity),
+    ('agreed_price', lambda o: o.agreed_price),
+    ('total_price', lambda o: o.get_total_price()),
+    ('buyer_contact', lambda o: o.buyer_contact),
+    ('whatsapp_contacted', lambda o: o.whatsapp_contacted),
+    ('meeting_preference', lambda o: o.meeting_preference),
+    ('message', lambda o: o.message),
+    ('notes', lambda o: o.notes),
+]
+
+CONTACT_COLUMNS = [
+    ('id', lambda c: c.pk),
+    ('contact_time', lambda c: c.contact_time),
+    ('product_id', lambda c: c.product_id),
+    ('product', lambda c: c.product.title),
+    ('buyer', lambda c: c.buyer.username),
+    ('seller', lambda c: c.seller.username),
+    ('order_id', lambda c: c.order_id),
+    ('message_sent', lambda c: c.message_sent),
+    ('is_responded', lambda c: c.is_responded),
+    ('responded_at', lambda c: c.responded_at),
+    ('response_time_seconds', lambda c: c.response_time_seconds),
+]
+
+
+def _start_of(date):
+    return timezone.make_aware(datetime.datetime.combine(date, datetime.time.min))
+
+
+def filter_by_form(queryset, cleaned_data, date_field, status_field='status'):
+    """
+    Apply OrderFilterForm's status and date range. Dates become datetime
+    bounds rather than __date lookups so the created_at indexes still apply.
+    """
+    if cleaned_data.get('status'):
+        queryset = queryset.filter(**{status_field: cleaned_data['status']})
+    if cleaned_data.get('date_from'):
+        queryset = queryset.filter(**{f'{date_field}__gte': _start_of(cleaned_data['date_from'])})
+    if cleaned_data.get('date_to'):
+        end = _start_of(cleaned_data['date_to'] + datetime.timedelta(days=1))
+        queryset = queryset.filter(**{f'{date_field}__lt': end})
+    return queryset
+
+
+def order_export(cleaned_data, **filters):
+    """Orders to export with everything the columns read joined in"""
+    orders = Order.objects.filter(**filters).select_related('product', 'buyer', 'seller').order_by('-created_at')
+    return filter_by_form(orders, cleaned_data, 'created_at'), ORDER_COLUMNS
+
+
+def contact_export(cleaned_data, **filters):
+    """WhatsApp contacts to export, the status filter applies to their order"""
+    contacts = WhatsAppContact.objects.filter(**filters).select_related(
+        'product', 'buyer', 'seller'
+    ).order_by('-contact_time')
+    return filter_by_form(contacts, cleaned_data, 'contact_time', 'order__status'), CONTACT_COLUMNS
+
+
+class Echo:
+    """A write-only file that hands back what is written, for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows, columns):
+    writer = csv.writer(Echo())
+    yield writer.writerow([name for name, _ in columns])
+    for row in rows:
+        yield writer.writerow([_csv_value(value(row)) for _, value in columns])
+
+
+def jsonl_lines(rows, columns):
+    for row in rows:
+        record = {name: value(row) for name, value in columns}
+        yield json.dumps(record, cls=DjangoJSONEncoder) + '\n'
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime.datetime):
+        return timezone.localtime(value).isoformat() if timezone.is_aware(value) else value.isoformat()
+    return value
+
+
+def export_lines(queryset, columns, file_format, chunk_size=CHUNK_SIZE):
+    """
+    The lines of an export. The queryset is read with iterator(), so only
+    chunk_size rows are in memory at any time whatever the size of the export.
+    """
+    rows = queryset.iterator(chunk_size=chunk_size)
+    if file_format == 'jsonl':
+        return jsonl_lines(rows, columns)
+    return csv_lines(rows, columns)
+
+
+def export_response(queryset, columns, file_format, filename):
+    """A download streamed row by row instead of rendered in one go"""
+    response = StreamingHttpResponse(
+        export_lines(queryset, columns, file_format),
+        content_type=FORMATS[file_format],
+    )
+    stamp = timezone.localtime().strftime('%Y%m%d-%H%M')
+    response['Content-Disposition'] = f'attachment; filename="{filename}-{stamp}.{file_format}"'
+    return response
@@ -1,8 +1,11 @@
 # marketApp/forms.py - CORRECTED VERSION
+import zipfile
+
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
 from .models import Profile, Product, ProductImage, Category, Review, Order, Report
+from .categories import get_category_tree
 
 # Custom widget for multiple file uploads - ACTUALLY USE THIS
 class MultipleFileInput(forms.ClearableFileInput):
@@ -73,8 +76,62 @@ class ProductForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.fields['category'].queryset = Category.objects.all()
+        # Options come from the cached tree, the queryset is only used to validate
+        self.fields['category'].choices = get_category_tree().choices(empty_label='---------')
         self.fields['original_price'].required = False
 
+class ProductImportForm(ProductForm):
+    """ProductForm rules for one row of a bulk import, without a category query per row"""
+    
+    def __init__(self, *args, categories=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        del self.fields['images']
+        # Preloaded {pk: Category}, shared by every row of the import
+        categories = categories if categories is not None else Category.objects.in_bulk()
+        self.fields['category'] = forms.TypedChoiceField(
+            choices=[(pk, category.name) for pk, category in categories.items()],
+            coerce=lambda pk: categories[int(pk)],
+        )
+
+    def _get_validation_exclusions(self):
+        # The category is one of the preloaded ones, skip the model's exists() query
+        exclude = super()._get_validation_exclusions()
+        exclude.add('category')
+        return exclude
+
+class BulkProductImportForm(forms.Form):
+    FORMAT_CHOICES = (
+        ('csv', 'CSV'),
+        ('jsonl', 'JSON Lines'),
+    )
+    
+    file = forms.FileField(
+        label='Products file',
+        help_text='One product per row or line, with the same fields as the Add Product form'
+    )
+    file_format = forms.ChoiceField(choices=FORMAT_CHOICES, required=False,
+                                    help_text='Detected from the file extension when left empty')
+    images_zip = forms.FileField(required=False, label='Images (zip)',
+                                 help_text='Referenced by file name in the images column')
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        upload = cleaned_data.get('file')
+        if upload and not cleaned_data.get('file_format'):
+            extension = upload.name.rsplit('.', 1)[-1].lower()
+            if extension == 'csv':
+                cleaned_data['file_format'] = 'csv'
+            elif extension in ('jsonl', 'ndjson', 'json'):
+                cleaned_data['file_format'] = 'jsonl'
+            else:
+                self.add_error('file_format', 'Choose the file format, it could not be detected')
+        images_zip = cleaned_data.get('images_zip')
+        if images_zip:
+            if not zipfile.is_zipfile(images_zip):
+                self.add_error('images_zip', 'Images must be uploaded as a .zip file')
+            images_zip.seek(0)
+        return cleaned_data
+
 # OPTION 2: Simple single image (COMMENT THIS OUT if using Option 1)
 # class ProductForm(forms.ModelForm):
 #     # Single image upload - simpler approach
@@ -245,6 +302,10 @@ class SearchForm(forms.Form):
         required=False,
         initial='-created_at'
     )
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['category'].choices = get_category_tree().choices(empty_label='All Categories')
 
 class MessageForm(forms.Form):
     content = forms.CharField(
@@ -0,0 +1,149 @@
+# marketApp/images.py
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'WIDTHS': [200, 400, 800],
+    'FORMATS': ['webp', 'jpeg'],
+    'QUALITY': 80,
+    'WORKERS': 2,
+    'ASYNC': True,   # generate in a process pool instead of inline
+}
+
+VARIANTS_DIR = 'product_images/variants'
+
+PIL_FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+EXTENSIONS = {'webp': 'webp', 'jpeg': 'jpg'}
+
+
+def get_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'MARKET_IMAGE_VARIANTS', {}))
+    return config
+
+
+def render_variants(source_path, media_root, base_name, widths, formats, quality):
+    """
+    Resize one original into every width/format pair and write the files.
+
+    Runs inside a worker process, so it only touches Pillow and the
+    filesystem. Returns a list of dicts describing the written files.
+    """
+    from PIL import Image, ImageOps
+
+    results = []
+    with Image.open(source_path) as original:
+        original = ImageOps.exif_transpose(original)
+        if original.mode not in ('RGB', 'L'):
+            original = original.convert('RGB')
+
+        # Never upscale: widths larger than the original collapse into one variant
+        target_widths = sorted({min(width, original.width) for width in widths})
+        os.makedirs(os.path.join(media_root, VARIANTS_DIR), exist_ok=True)
+
+        for width in target_widths:
+            height = max(1, round(original.height * width / original.width))
+            resized = original.resize((width, height), Image.LANCZOS)
+            for image_format in formats:
+                name = f"{VARIANTS_DIR}/{base_name}_{width}.{EXTENSIONS[image_format]}"
+                resized.save(
+                    os.path.join(media_root, name),
+                    PIL_FORMATS[image_format],
+                    quality=quality,
+                    optimize=True,
+                )
+                results.append({'format': image_format, 'width': width, 'height': height, 'name': name})
+    return results
+
+
+def _render_args(product_image):
+    config = get_config()
+    base_name = f"{product_image.pk}_{os.path.splitext(os.path.basename(product_image.image.name))[0]}"
+    return (
+        product_image.image.path, str(settings.MEDIA_ROOT), base_name,
+        config['WIDTHS'], config['FORMATS'], config['QUALITY'],
+    )
+
+
+def record_variants(product_image_id, results):
+    """Replace the variant rows of an image with freshly rendered files"""
+    from .models import ProductImage, ProductImageVariant
+
+    names = [result['name'] for result in results]
+    variants = ProductImageVariant.objects.filter(image_id=product_image_id)
+    with transaction.atomic():
+        # Only stale rows are deleted: re-rendered files keep their names,
+        # and deleting a row also deletes its file
+        variants.exclude(file__in=names).delete()
+        existing = set(variants.values_list('file', flat=True))
+        ProductImageVariant.objects.bulk_create([
+            ProductImageVariant(
+                image_id=product_image_id,
+                format=result['format'],
+                width=result['width'],
+                height=result['height'],
+                file=result['name'],
+            )
+            for result in results if result['name'] not in existing
+        ])
+    # bulk_create skips the signal handlers, and cards show the smallest variant
+    from .cards import refresh_card_images
+    product_id = ProductImage.objects.filter(pk=product_image_id).values_list('product_id', flat=True).first()
+    refresh_card_images(product_id)
+
+
+def generate_variants(product_image):
+    """Render and record the variants of one image in the current process"""
+    results = render_variants(*_render_args(product_image))
+    record_variants(product_image.pk, results)
+    return results
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Process pool shared by every request in this process"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=get_config()['WORKERS'])
+        return _executor
+
+
+def _on_rendered(product_image_id, future):
+    try:
+        record_variants(product_image_id, future.result())
+    except Exception:
+        logger.exception('Failed to generate variants for product image %s', product_image_id)
+    finally:
+        close_old_connections()
+
+
+def schedule_variants(product_image):
+    """
+    Generate variants for an image once the current transaction commits.
+    The resizing runs in the process pool, off the request path.
+    """
+    def submit():
+        # Runs after the commit, where raising would only break the caller:
+        # a missing or unreadable original is logged and skipped
+        try:
+            if not get_config()['ASYNC']:
+                generate_variants(product_image)
+                return
+            future = get_executor().submit(render_variants, *_render_args(product_image))
+        except Exception:
+            logger.exception('Failed to generate variants for product image %s', product_image.pk)
+            return
+        future.add_done_callback(lambda f: _on_rendered(product_image.pk, f))
+
+    transaction.on_commit(submit)
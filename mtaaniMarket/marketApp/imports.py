@@ -0,0 +1,455 @@
+# marketApp/imports.py
+import atexit
+import codecs
+import csv
+import http.client
+import io
+import ipaddress
+import json
+import logging
+import os
+import queue
+import socket
+import threading
+import time
+import uuid
+import zipfile
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.utils.text import slugify
+
+from .cards import refresh_card_images
+from .categories import invalidate_category_tree
+from .counters import invalidate_user_counts
+from .forms import ProductImportForm
+from .images import schedule_variants
+from .models import Category, Product, ProductImage
+from .page_cache import invalidate_tags
+from .search import get_search_backend
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'CHUNK_SIZE': 200,                  # products per bulk_create
+    'MAX_ERRORS': 100,                  # row errors kept for the report, the rest are only counted
+    'MAX_IMAGES_PER_ROW': 10,
+    'MAX_IMAGE_BYTES': 5 * 1024 * 1024,
+    'DOWNLOAD_TIMEOUT': 10,             # seconds per image URL
+    'ASYNC': True,                      # attach images in a background thread instead of inline
+    # Zips left in MEDIA_ROOT/imports by an import that never finished are
+    # removed once they are this old
+    'ARCHIVE_MAX_AGE_HOURS': 24,
+}
+
+ARCHIVES_DIR = 'imports'
+
+# Columns besides the ProductForm fields
+IMAGES_COLUMN = 'images'
+IMAGE_SEPARATOR = '|'
+
+BOOLEAN_FIELDS = {'is_negotiable', 'is_featured'}
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'on'}
+
+
+def get_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'MARKET_PRODUCT_IMPORT', {}))
+    return config
+
+
+def read_rows(uploaded_file, file_format):
+    """
+    Yield (line number, row dict, error) from a CSV or JSONL upload one line
+    at a time, so the file is never loaded whole.
+    """
+    lines = codecs.iterdecode(uploaded_file, 'utf-8-sig')
+    if file_format == 'csv':
+        reader = csv.DictReader(lines)
+        try:
+            for row in reader:
+                yield reader.line_num, row, None
+        except (csv.Error, UnicodeDecodeError) as error:
+            yield reader.line_num, None, f'Unreadable CSV: {error}'
+        return
+
+    number = 0
+    try:
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as error:
+                yield number, None, f'Invalid JSON: {error}'
+                continue
+            if not isinstance(row, dict):
+                yield number, None, 'Each line must be a JSON object'
+                continue
+            yield number, row, None
+    except UnicodeDecodeError as error:
+        yield number + 1, None, f'Unreadable file: {error}'
+
+
+def image_refs(value):
+    """Image names or URLs from a row, a '|' separated string or a JSON list"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(IMAGE_SEPARATOR)
+    return [str(ref).strip() for ref in value if str(ref).strip()]
+
+
+def is_url(ref):
+    return urlparse(ref).scheme in ('http', 'https')
+
+
+def public_address(hostname):
+    """
+    The address to download from, None for hosts that would make the
+    server fetch from its own network. The download connects to this
+    address rather than resolving the name again, which could answer differently.
+    """
+    try:
+        addresses = [address[4][0] for address in socket.getaddrinfo(hostname, None)]
+    except (socket.gaierror, UnicodeError):
+        return None
+    if not addresses or not all(ipaddress.ip_address(address).is_global for address in addresses):
+        return None
+    return addresses[0]
+
+
+class PinnedHTTPConnection(http.client.HTTPConnection):
+    """Connects to `address`, already checked, while the Host header keeps the name"""
+    address = None
+
+    def connect(self):
+        self.sock = socket.create_connection((self.address, self.port), self.timeout)
+
+
+class PinnedHTTPSConnection(http.client.HTTPSConnection, PinnedHTTPConnection):
+    """The certificate is still checked against the name (SNI) given as host"""
+
+
+class ImportResult:
+    """What a bulk import did, with the first MAX_ERRORS row errors"""
+
+    def __init__(self, max_errors):
+        self.max_errors = max_errors
+        self.created = 0
+        self.images_queued = 0
+        self.error_count = 0
+        self.errors = []
+
+    def add_error(self, line, messages):
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line, 'messages': messages})
+
+    @property
+    def errors_truncated(self):
+        return self.error_count > len(self.errors)
+
+
+class ProductImporter:
+    """
+    Validate rows with ProductForm rules and insert them in chunks with
+    bulk_create. Images are fetched from the zip or their URLs afterwards,
+    off the request, by attach_images().
+    """
+
+    def __init__(self, seller, image_archive=None, config=None):
+        self.seller = seller
+        self.config = config or get_config()
+        self.result = ImportResult(self.config['MAX_ERRORS'])
+        # One query for every row's category, looked up by id or by name
+        self.categories = Category.objects.in_bulk()
+        self.categories_by_name = {c.name.strip().lower(): c for c in self.categories.values()}
+        self.archive_path = None
+        self.archive_names = set()
+        if image_archive is not None:
+            self.archive_path, self.archive_names = self._store_archive(image_archive)
+        self.images_submitted = False
+
+    def _store_archive(self, image_archive):
+        """Copy the uploaded zip somewhere that outlives the request"""
+        directory = os.path.join(settings.MEDIA_ROOT, ARCHIVES_DIR)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'{uuid.uuid4().hex}.zip')
+        with open(path, 'wb') as destination:
+            for chunk in image_archive.chunks():
+                destination.write(chunk)
+        try:
+            with zipfile.ZipFile(path) as archive:
+                names = {info.filename for info in archive.infolist() if not info.is_dir()}
+        except zipfile.BadZipFile:
+            os.remove(path)
+            raise
+        return path, names
+
+    def form_data(self, row):
+        data = {}
+        for name, value in row.items():
+            if name is None or name == IMAGES_COLUMN:
+                continue
+            name = name.strip()
+            if value is None:
+                value = ''
+            if name in BOOLEAN_FIELDS:
+                value = str(value).strip().lower() in TRUE_VALUES
+            elif name == 'category':
+                value = str(value).strip()
+                category = self.categories_by_name.get(value.lower())
+                if category and not value.isdigit():
+                    value = category.pk
+            else:
+                value = str(value).strip()
+            data[name] = value
+        return data
+
+    def check_images(self, refs):
+        errors = []
+        if len(refs) > self.config['MAX_IMAGES_PER_ROW']:
+            errors.append(f"At most {self.config['MAX_IMAGES_PER_ROW']} images per product")
+        for ref in refs:
+            if is_url(ref):
+                continue
+            if ref not in self.archive_names:
+                errors.append(f'Image "{ref}" is not a URL and is not in the zip')
+        return errors
+
+    def run(self, rows):
+        pending = []
+        for line, row, error in rows:
+            if error:
+                self.result.add_error(line, [error])
+                continue
+
+            refs = image_refs(row.get(IMAGES_COLUMN))
+            form = ProductImportForm(self.form_data(row), categories=self.categories)
+            errors = self.check_images(refs)
+            if not form.is_valid():
+                errors = [
+                    f'{name}: {message}' if name != '__all__' else message
+                    for name, messages in form.errors.items() for message in messages
+                ] + errors
+            if errors:
+                self.result.add_error(line, errors)
+                continue
+
+            product = form.save(commit=False)
+            product.seller = self.seller
+            # What Product.save() would do, without a query per row
+            product.slug = f"{slugify(product.title)}-{uuid.uuid4().hex[:8]}"
+            product.copy_seller_snapshot()
+            pending.append((product, refs))
+            if len(pending) >= self.config['CHUNK_SIZE']:
+                self.flush(pending)
+                pending = []
+
+        if pending:
+            self.flush(pending)
+        self.finish()
+        return self.result
+
+    def flush(self, pending):
+        products = [product for product, refs in pending]
+        with transaction.atomic():
+            Product.objects.bulk_create(products)
+            # bulk_create skips the post_save signals, so index here
+            get_search_backend().index_products(products)
+        self.result.created += len(products)
+
+        jobs = [(product.pk, refs) for product, refs in pending if refs]
+        self.result.images_queued += sum(len(refs) for _, refs in jobs)
+        if jobs:
+            self.queue_images(jobs)
+
+    def queue_images(self, jobs):
+        if not self.config['ASYNC']:
+            attach_images(jobs, self.archive_path, self.config)
+            return
+        image_attacher.submit(jobs, self.archive_path, self.config)
+        self.images_submitted = True
+
+    def finish(self):
+        # The signal handlers bulk_create skipped
+        invalidate_category_tree()
+        invalidate_tags('products')
+        invalidate_user_counts(self.seller.pk)
+        if self.images_submitted:
+            # Removed once the jobs queued before it are done
+            image_attacher.release(self.archive_path)
+        else:
+            remove_archive(self.archive_path)
+
+
+def download(url, limit, timeout):
+    """
+    Up to `limit` bytes of a public URL. Redirects are refused rather
+    than followed, their target would skip the public address check.
+    """
+    address = public_address(url.hostname)
+    if address is None:
+        raise ValueError(f'{url.geturl()} is not a public address')
+    connection_class = PinnedHTTPSConnection if url.scheme == 'https' else PinnedHTTPConnection
+    connection = connection_class(url.hostname, port=url.port, timeout=timeout)
+    connection.address = address
+    try:
+        path = (url.path or '/') + (f'?{url.query}' if url.query else '')
+        connection.request('GET', path)
+        response = connection.getresponse()
+        if response.status != 200:
+            raise ValueError(f'{url.geturl()} answered {response.status} {response.reason}')
+        return response.read(limit)
+    finally:
+        connection.close()
+
+
+def read_image(ref, archive, config):
+    """The bytes and file name of one image, from the zip or downloaded"""
+    limit = config['MAX_IMAGE_BYTES']
+    if is_url(ref):
+        url = urlparse(ref)
+        data = download(url, limit + 1, config['DOWNLOAD_TIMEOUT'])
+        name = os.path.basename(url.path) or 'image.jpg'
+    else:
+        info = archive.getinfo(ref)
+        if info.file_size > limit:
+            raise ValueError(f'{ref} is larger than {limit} bytes')
+        with archive.open(info) as member:
+            data = member.read(limit + 1)
+        name = os.path.basename(ref)
+    if len(data) > limit:
+        raise ValueError(f'{ref} is larger than {limit} bytes')
+
+    from PIL import Image
+    with Image.open(io.BytesIO(data)) as image:
+        image.verify()
+    return data, name
+
+
+def attach_images(jobs, archive_path, config):
+    """Save the images of freshly imported products, the first one becomes primary"""
+    archive = zipfile.ZipFile(archive_path) if archive_path else None
+    try:
+        attached = []
+        for product_id, refs in jobs:
+            images = []
+            for ref in refs:
+                try:
+                    data, name = read_image(ref, archive, config)
+                except Exception as error:
+                    logger.warning('Skipping image %s of imported product %s: %s', ref, product_id, error)
+                    continue
+                image = ProductImage(product_id=product_id, is_primary=not images)
+                image.image.save(name, ContentFile(data), save=False)
+                images.append(image)
+            if images:
+                ProductImage.objects.bulk_create(images)
+                attached.append(product_id)
+                for image in images:
+                    schedule_variants(image)
+        # Refreshing the card images also invalidates the cached pages
+        refresh_card_images(*attached)
+    finally:
+        if archive is not None:
+            archive.close()
+
+
+def remove_archive(archive_path):
+    if archive_path and os.path.exists(archive_path):
+        os.remove(archive_path)
+
+
+def remove_stale_archives(max_age_hours=None):
+    """Delete import zips older than ARCHIVE_MAX_AGE_HOURS, returns how many were removed"""
+    if max_age_hours is None:
+        max_age_hours = get_config()['ARCHIVE_MAX_AGE_HOURS']
+    directory = os.path.join(settings.MEDIA_ROOT, ARCHIVES_DIR)
+    if not os.path.isdir(directory):
+        return 0
+    cutoff = time.time() - max_age_hours * 3600
+    removed = 0
+    for entry in os.scandir(directory):
+        if entry.is_file() and entry.name.endswith('.zip') and entry.stat().st_mtime < cutoff:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+            removed += 1
+    return removed
+
+
+class ImageAttacher:
+    """
+    Attaches imported images on one worker thread shared by every import in
+    the process, in the order they were queued. Whatever is still queued at
+    exit is attached by the atexit drain, so neither the jobs nor their zip
+    are left behind; zips of imports killed mid-way are swept by
+    remove_stale_archives() when the worker starts.
+    """
+
+    def __init__(self):
+        self._jobs = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def submit(self, jobs, archive_path, config):
+        self._jobs.put((jobs, archive_path, config))
+        self._ensure_worker()
+
+    def release(self, archive_path):
+        """Remove an import's zip once every job queued before it is done"""
+        if archive_path:
+            self._jobs.put((None, archive_path, None))
+            self._ensure_worker()
+
+    def drain(self):
+        """Handle every queued job in the calling thread, returns how many there were"""
+        handled = 0
+        while True:
+            try:
+                item = self._jobs.get_nowait()
+            except queue.Empty:
+                return handled
+            self._handle(*item)
+            handled += 1
+
+    def _handle(self, jobs, archive_path, config):
+        if jobs is None:
+            remove_archive(archive_path)
+            return
+        try:
+            attach_images(jobs, archive_path, config)
+        except Exception:
+            logger.exception('Failed to attach imported product images')
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(target=self._run, name='import-images', daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        try:
+            remove_stale_archives()
+        except OSError:
+            logger.exception('Failed to remove stale import archives')
+        while True:
+            item = self._jobs.get()
+            try:
+                self._handle(*item)
+            finally:
+                close_old_connections()
+
+
+image_attacher = ImageAttacher()
+
+
+@atexit.register
+def _drain_on_exit():
+    image_attacher.drain()
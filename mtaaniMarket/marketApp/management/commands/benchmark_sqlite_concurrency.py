@@ -0,0 +1,158 @@
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+from marketApp.database import apply_pragmas, get_config
+
+SCHEMA = [
+    'CREATE TABLE product (id INTEGER PRIMARY KEY, title TEXT, status TEXT, views INTEGER, created_at REAL)',
+    'CREATE INDEX product_status_created ON product (status, created_at)',
+    'CREATE TABLE notification (id INTEGER PRIMARY KEY, user_id INTEGER, is_read INTEGER, message TEXT, created_at REAL)',
+    'CREATE INDEX notification_user_unread ON notification (user_id, is_read, created_at)',
+]
+
+# Roughly what shop and the notification badge read
+READ_QUERIES = [
+    "SELECT id, title, views FROM product WHERE status = 'active' ORDER BY created_at DESC LIMIT 12",
+    'SELECT COUNT(*) FROM notification WHERE user_id = ? AND is_read = 0',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure reads against a scratch SQLite database while writer threads keep '
+        'write transactions in flight, with SQLite defaults, MARKET_SQLITE_PRAGMAS and WAL'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--duration', type=float, default=5.0, help='Seconds per scenario')
+        parser.add_argument('--rows', type=int, default=20000, help='Products seeded into the scratch database')
+        parser.add_argument('--write-hold', type=float, default=0.005,
+                            help='Seconds each write transaction stays open, like a view doing work mid-transaction')
+
+    def handle(self, *args, **options):
+        scenarios = [
+            ('sqlite defaults', {'JOURNAL_MODE': 'DELETE', 'BUSY_TIMEOUT': None, 'SYNCHRONOUS': None,
+                                 'MMAP_SIZE': None, 'CACHE_SIZE': None, 'TEMP_STORE': None}),
+            ('MARKET_SQLITE_PRAGMAS', get_config()),
+            ('with WAL', {**get_config(), 'JOURNAL_MODE': 'WAL', 'SYNCHRONOUS': 'NORMAL'}),
+        ]
+        self.stdout.write(
+            f"{'scenario':<24}{'reads/s':>9}{'writes/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}"
+            f"{'reads during writes':>21}{'lock errors':>13}"
+        )
+        for name, config in scenarios:
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'bench.sqlite3')
+                self.seed(path, options['rows'])
+                result = self.run_scenario(path, config, options)
+            self.stdout.write(
+                f"{name:<24}{result['reads'] / options['duration']:>9.0f}"
+                f"{result['writes'] / options['duration']:>10.0f}"
+                f"{result['p50']:>9.2f}{result['p95']:>9.2f}{result['max']:>9.2f}"
+                f"{result['overlapping']:>21}{result['errors']:>13}"
+            )
+
+    def seed(self, path, rows):
+        connection = sqlite3.connect(path)
+        for statement in SCHEMA:
+            connection.execute(statement)
+        now = time.time()
+        connection.executemany(
+            'INSERT INTO product (title, status, views, created_at) VALUES (?, ?, 0, ?)',
+            ((f'Product {i}', 'active' if i % 5 else 'sold', now - i) for i in range(rows)),
+        )
+        connection.commit()
+        connection.close()
+
+    def connect(self, path, config):
+        # Python's sqlite3 waits 5s by default, the same as Django without OPTIONS['timeout']
+        connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        apply_pragmas(connection, config)
+        return connection
+
+    def run_scenario(self, path, config, options):
+        stop = threading.Event()
+        lock = threading.Lock()
+        state = {'writes': 0, 'errors': 0, 'open_writes': 0, 'overlapping': 0}
+        latencies = []
+
+        def writer(number):
+            connection = self.connect(path, config)
+            rng = random.Random(number)
+            while not stop.is_set():
+                try:
+                    connection.execute('BEGIN IMMEDIATE')
+                    with lock:
+                        state['open_writes'] += 1
+                    try:
+                        connection.execute('UPDATE product SET views = views + 1 WHERE id = ?',
+                                           (rng.randint(1, options['rows']),))
+                        connection.execute(
+                            'INSERT INTO notification (user_id, is_read, message, created_at) VALUES (?, 0, ?, ?)',
+                            (rng.randint(1, 100), 'benchmark', time.time()),
+                        )
+                        time.sleep(options['write_hold'])
+                        connection.execute('COMMIT')
+                        with lock:
+                            state['writes'] += 1
+                    finally:
+                        with lock:
+                            state['open_writes'] -= 1
+                except sqlite3.OperationalError:
+                    with lock:
+                        state['errors'] += 1
+                    if connection.in_transaction:
+                        connection.execute('ROLLBACK')
+            connection.close()
+
+        def reader(number):
+            connection = self.connect(path, config)
+            rng = random.Random(1000 + number)
+            own = []
+            overlapping = errors = 0
+            while not stop.is_set():
+                started = time.perf_counter()
+                during_write = state['open_writes'] > 0
+                try:
+                    connection.execute(READ_QUERIES[0]).fetchall()
+                    connection.execute(READ_QUERIES[1], (rng.randint(1, 100),)).fetchone()
+                except sqlite3.OperationalError:
+                    errors += 1
+                    continue
+                own.append((time.perf_counter() - started) * 1000)
+                if during_write or state['open_writes'] > 0:
+                    overlapping += 1
+            connection.close()
+            with lock:
+                latencies.extend(own)
+                state['overlapping'] += overlapping
+                state['errors'] += errors
+
+        threads = [threading.Thread(target=writer, args=(i,)) for i in range(options['writers'])]
+        threads += [threading.Thread(target=reader, args=(i,)) for i in range(options['readers'])]
+        for thread in threads:
+            thread.start()
+        time.sleep(options['duration'])
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        latencies.sort()
+        return {
+            'reads': len(latencies),
+            'writes': state['writes'],
+            'errors': state['errors'],
+            'overlapping': state['overlapping'],
+            'p50': statistics.median(latencies) if latencies else 0,
+            'p95': latencies[int(len(latencies) * 0.95)] if latencies else 0,
+            'max': latencies[-1] if latencies else 0,
+        }
@@ -0,0 +1,108 @@
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from marketApp.alerts import WATCHED_FIELDS, get_config, match_alerts, product_alerts
+from marketApp.models import Product, Profile, Wishlist
+
+PREFIX = 'alertbench'
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure wishlist alert detection and matching for products wishlisted by many users. '
+        'Everything runs in a transaction that is rolled back, nothing is kept'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wishlisters', type=int, default=50000, help='Users wishlisting every product')
+        parser.add_argument('--products', type=int, default=2)
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk_create while seeding')
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.config = get_config()
+        self.stdout.write(
+            f"{options['products']} products x {options['wishlisters']} wishlisters, "
+            f"MAX_PER_USER={self.config['MAX_PER_USER']} per {self.config['RATE_WINDOW_HOURS']}h"
+        )
+        try:
+            with transaction.atomic():
+                products = self.seed()
+                self.stdout.write(f"{'step':<34}{'seconds':>9}{'queries':>9}{'notified':>10}"
+                                  f"{'coalesced':>11}{'limited':>9}")
+                self.run(products)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def seed(self):
+        started = time.perf_counter()
+        size = self.options['batch_size']
+        seller = User.objects.create(username=f'{PREFIX}_seller', password='!')
+        Profile.objects.create(user=seller, role='seller')
+        products = [
+            Product.objects.create(
+                seller=seller, title=f'Alert benchmark product {i}', description='-',
+                price=Decimal('1000.00'), location='Nairobi',
+            )
+            for i in range(self.options['products'])
+        ]
+        users = User.objects.bulk_create(
+            [User(username=f'{PREFIX}_{i}', password='!') for i in range(self.options['wishlisters'])],
+            batch_size=size,
+        )
+        if users[0].pk is None:
+            users = list(User.objects.filter(username__startswith=f'{PREFIX}_').exclude(pk=seller.pk))
+        Profile.objects.bulk_create([Profile(user=user) for user in users], batch_size=size)
+        Wishlist.objects.bulk_create(
+            [Wishlist(user=user, product=product) for product in products for user in users], batch_size=size
+        )
+        self.stdout.write(f'Seeded in {time.perf_counter() - started:.1f}s')
+        return products
+
+    def measure(self, name, function):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            result = function()
+            seconds = time.perf_counter() - started
+        result = result or {}
+        self.stdout.write(
+            f"{name:<34}{seconds:>9.3f}{len(queries):>9}{result.get('notified', ''):>10}"
+            f"{result.get('coalesced', ''):>11}{result.get('rate_limited', ''):>9}"
+        )
+        return result
+
+    def change(self, products, **values):
+        """Save changes the way edit_product does; returns the alerts the hooks hand to the matcher"""
+        alerts = []
+        for product in products:
+            previous = {field: getattr(product, field) for field in WATCHED_FIELDS}
+            for field, value in values.items():
+                setattr(product, field, value)
+            product.save()
+            alerts.extend(product_alerts(previous, product, self.config))
+        return alerts
+
+    def run(self, products):
+        first = products[0]
+        self.measure('save, no watched field', lambda: first.save(update_fields=['views']))
+        self.measure('save, price change (hook)', lambda: self.change([first], price=Decimal('990.00')) and None)
+
+        drops = self.change(products, price=Decimal('900.00'))
+        self.measure('price drop', lambda: match_alerts(drops, self.config))
+        drops = self.change(products, price=Decimal('850.00'))
+        self.measure('second drop (coalesced)', lambda: match_alerts(drops, self.config))
+
+        self.change(products, status='sold')
+        available = self.change(products, status='active')
+        self.measure('back in stock', lambda: match_alerts(available, self.config))
+        self.measure('all again (rate limited)', lambda: match_alerts(drops + available, self.config))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from marketApp.imports import get_config, remove_stale_archives
+
+
+class Command(BaseCommand):
+    help = 'Delete image zips left in MEDIA_ROOT/imports by bulk imports that never finished'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=None,
+                            help="Minimum age of a removed zip, defaults to MARKET_PRODUCT_IMPORT['ARCHIVE_MAX_AGE_HOURS']")
+
+    def handle(self, *args, **options):
+        hours = options['hours'] if options['hours'] is not None else get_config()['ARCHIVE_MAX_AGE_HOURS']
+        removed = remove_stale_archives(hours)
+        self.stdout.write(self.style.SUCCESS(f'Removed {removed} import archives older than {hours:g} hours'))
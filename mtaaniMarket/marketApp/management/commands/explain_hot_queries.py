@@ -0,0 +1,176 @@
+import logging
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+from django.test import Client
+from django.urls import reverse
+
+from marketApp import urls as market_urls
+from marketApp.models import Category, Conversation, Notification, Order, Product, Report
+
+# Views that end the session or only redirect to external sites
+SKIP_URLS = {'logout'}
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Request every marketApp view as a buyer and a seller, run EXPLAIN on each '
+        'SELECT it issued and flag full table scans and temporary sorts'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--buyer', help='Username of the buyer to browse as (default: first buyer)')
+        parser.add_argument('--seller', help='Username of the seller to browse as (default: first seller)')
+        parser.add_argument('--url', action='append', dest='urls',
+                            help='Only check this URL name, can be repeated')
+        parser.add_argument('--show-all', action='store_true',
+                            help='Print the plan of every query, not only flagged ones')
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            raise CommandError(f'EXPLAIN parsing is not implemented for {connection.vendor}')
+
+        users = [
+            self.get_user('buyer', options['buyer']),
+            self.get_user('seller', options['seller']),
+        ]
+        patterns = [
+            pattern for pattern in market_urls.urlpatterns
+            if pattern.name and pattern.name not in SKIP_URLS
+            and (not options['urls'] or pattern.name in options['urls'])
+        ]
+
+        # Views with missing templates would log a traceback per request
+        request_logger = logging.getLogger('django.request')
+        level = request_logger.level
+        request_logger.setLevel(logging.CRITICAL)
+        try:
+            self.explain_all(users, patterns, options['show_all'])
+        finally:
+            request_logger.setLevel(level)
+
+    def explain_all(self, users, patterns, show_all):
+        seen = set()
+        scans = sorts = total = 0
+        for user in users:
+            for pattern in patterns:
+                kwargs = self.sample_kwargs(pattern, user)
+                if kwargs is None:
+                    self.stdout.write(f'  skip {pattern.name}: no sample data for {user.username}')
+                    continue
+                url = reverse(pattern.name, kwargs=kwargs)
+                queries = self.capture(url, user)
+
+                for sql, params in queries:
+                    if sql in seen:
+                        continue
+                    seen.add(sql)
+                    total += 1
+                    plan = self.explain(sql, params)
+                    full_scans = [line for line in plan if self.is_full_scan(line)]
+                    temp_sorts = [line for line in plan if self.is_temp_sort(line)]
+                    scans += bool(full_scans)
+                    sorts += bool(temp_sorts)
+
+                    if full_scans:
+                        self.stdout.write(self.style.ERROR(f'FULL SCAN {url} ({user.username})'))
+                    elif temp_sorts:
+                        self.stdout.write(self.style.WARNING(f'TEMP SORT {url} ({user.username})'))
+                    elif show_all:
+                        self.stdout.write(self.style.SUCCESS(f'OK {url} ({user.username})'))
+                    else:
+                        continue
+                    self.stdout.write(f'  {sql}')
+                    for line in plan:
+                        self.stdout.write(f'    {line}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Explained {total} distinct queries: {scans} with full table scans, '
+            f'{sorts} with temporary sorts.'
+        ))
+
+    def get_user(self, role, username):
+        users = User.objects.select_related('profile')
+        user = users.filter(username=username).first() if username else users.filter(profile__role=role).first()
+        if user is None:
+            raise CommandError(f'No {role} found, pass --{role} or create one first')
+        return user
+
+    def sample_kwargs(self, pattern, user):
+        """Fill URL arguments with rows the user can actually see"""
+        own_orders = Order.objects.filter(Q(buyer=user) | Q(seller=user))
+        samples = {
+            'pk': lambda: Product.objects.filter(status='active').first(),
+            'product_id': lambda: (
+                Product.objects.filter(seller=user).first() or Product.objects.filter(status='active').first()
+            ),
+            'category_id': lambda: Category.objects.first(),
+            'order_id': lambda: own_orders.first(),
+            'notification_id': lambda: Notification.objects.filter(user=user).first(),
+            'conversation_id': lambda: Conversation.objects.filter(participants=user).first(),
+            'report_id': lambda: Report.objects.first(),
+            'user_id': lambda: User.objects.exclude(pk=user.pk).first(),
+            'username': lambda: user.username,
+        }
+        kwargs = {}
+        for name in pattern.pattern.converters:
+            if name not in samples:
+                return None
+            value = samples[name]()
+            if value is None:
+                return None
+            kwargs[name] = value if isinstance(value, str) else value.pk
+        return kwargs
+
+    def capture(self, url, user):
+        """GET the URL inside a rolled back transaction and return its (sql, params) SELECTs"""
+        queries = []
+
+        def record(execute, sql, params, many, context):
+            if sql.lstrip().upper().startswith('SELECT'):
+                queries.append((sql, params))
+            return execute(sql, params, many, context)
+
+        host = next((h.lstrip('.') for h in settings.ALLOWED_HOSTS if h != '*'), 'localhost')
+        client = Client(SERVER_NAME=host)
+        client.force_login(user)
+        try:
+            with transaction.atomic():
+                with connection.execute_wrapper(record):
+                    try:
+                        client.get(url)
+                    except Exception as error:
+                        # Missing templates and the like still leave the queries to explain
+                        self.stdout.write(f'  {url}: {error.__class__.__name__}: {error}')
+                # Some GET views write, never keep their changes
+                raise Rollback
+        except Rollback:
+            pass
+        return queries
+
+    def explain(self, sql, params):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+                return [row[-1] for row in cursor.fetchall()]
+            cursor.execute(f'EXPLAIN {sql}', params)
+            return [row[0] for row in cursor.fetchall()]
+
+    def is_full_scan(self, line):
+        if connection.vendor == 'sqlite':
+            # Scans of subqueries/CTEs read rows already narrowed down by an index
+            return (line.lstrip().startswith('SCAN ') and 'INDEX' not in line
+                    and not line.lstrip().startswith(('SCAN (', 'SCAN qualify', 'SCAN subquery', 'SCAN CONSTANT')))
+        return 'Seq Scan' in line
+
+    def is_temp_sort(self, line):
+        if connection.vendor == 'sqlite':
+            return 'USE TEMP B-TREE' in line
+        return line.lstrip().startswith('Sort ') or '-> Sort ' in line
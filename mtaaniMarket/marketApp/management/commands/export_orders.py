@@ -0,0 +1,54 @@
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from marketApp.exports import CHUNK_SIZE, FORMATS, contact_export, export_lines, order_export
+from marketApp.forms import OrderFilterForm
+
+
+class Command(BaseCommand):
+    help = 'Stream orders or WhatsApp contacts to CSV/JSONL, a few thousand rows in memory at a time'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=['orders', 'whatsapp-contacts'])
+        parser.add_argument('--format', dest='file_format', choices=sorted(FORMATS), default='csv')
+        parser.add_argument('--status', default='', help='Order status (of the contact\'s order for contacts)')
+        parser.add_argument('--date-from', default='', help='YYYY-MM-DD, inclusive')
+        parser.add_argument('--date-to', default='', help='YYYY-MM-DD, inclusive')
+        parser.add_argument('--seller', help='Only this seller\'s rows (username)')
+        parser.add_argument('--output', help='File to write (default: stdout)')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        form = OrderFilterForm({
+            'status': options['status'],
+            'date_from': options['date_from'],
+            'date_to': options['date_to'],
+        })
+        if not form.is_valid():
+            errors = '; '.join(f'{name}: {" ".join(messages)}' for name, messages in form.errors.items())
+            raise CommandError(f'Invalid filters: {errors}')
+
+        filters = {}
+        if options['seller']:
+            seller = User.objects.filter(username=options['seller']).first()
+            if seller is None:
+                raise CommandError(f"No user named {options['seller']}")
+            filters['seller'] = seller
+
+        build = order_export if options['dataset'] == 'orders' else contact_export
+        queryset, columns = build(form.cleaned_data, **filters)
+        lines = export_lines(queryset, columns, options['file_format'], options['chunk_size'])
+
+        output = open(options['output'], 'w', newline='', encoding='utf-8') if options['output'] else sys.stdout
+        count = -1 if options['file_format'] == 'csv' else 0
+        try:
+            for line in lines:
+                output.write(line)
+                count += 1
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        if options['output']:
+            self.stderr.write(self.style.SUCCESS(f"Wrote {count} rows to {options['output']}"))
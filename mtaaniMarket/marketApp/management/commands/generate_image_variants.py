@@ -0,0 +1,58 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+
+from marketApp.images import _render_args, get_config, record_variants, render_variants
+from marketApp.models import ProductImage
+
+
+class Command(BaseCommand):
+    help = 'Generate thumbnail and WebP/JPEG variants for existing product images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Regenerate variants even for images that already have them')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Number of worker processes (defaults to MARKET_IMAGE_VARIANTS["WORKERS"])')
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help='Images submitted to the pool at a time')
+
+    def handle(self, *args, **options):
+        images = ProductImage.objects.order_by('pk')
+        if not options['all']:
+            images = images.filter(variants__isnull=True)
+
+        workers = options['workers'] or get_config()['WORKERS']
+        done = failed = 0
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            batch = []
+            for product_image in images.iterator(chunk_size=options['batch_size']):
+                batch.append(product_image)
+                if len(batch) >= options['batch_size']:
+                    ok, bad = self.process_batch(executor, batch)
+                    done, failed = done + ok, failed + bad
+                    batch = []
+            ok, bad = self.process_batch(executor, batch)
+            done, failed = done + ok, failed + bad
+
+        self.stdout.write(self.style.SUCCESS(f'Generated variants for {done} images ({failed} failed)'))
+
+    def process_batch(self, executor, batch):
+        futures = {}
+        for product_image in batch:
+            try:
+                futures[executor.submit(render_variants, *_render_args(product_image))] = product_image
+            except (ValueError, OSError) as exc:
+                self.stderr.write(f'Skipping image #{product_image.pk}: {exc}')
+
+        done = 0
+        failed = len(batch) - len(futures)
+        for future in as_completed(futures):
+            product_image = futures[future]
+            try:
+                record_variants(product_image.pk, future.result())
+                done += 1
+            except Exception as exc:
+                failed += 1
+                self.stderr.write(f'Failed image #{product_image.pk} ({product_image.image.name}): {exc}')
+        return done, failed
@@ -0,0 +1,458 @@
+import itertools
+import os
+import random
+import uuid
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from marketApp.cards import rebuild_product_cards
+from marketApp.categories import invalidate_category_tree
+from marketApp.models import (
+    Category, Conversation, ConversationParticipant, Message, Notification, Order, Product,
+    ProductImage, Profile, Review, Wishlist
+)
+from marketApp.page_cache import invalidate_tags
+from marketApp.search import get_search_backend
+
+ROOT_CATEGORIES = [
+    ('Electronics', 'fa-tv'), ('Phones & Tablets', 'fa-mobile-alt'), ('Fashion', 'fa-tshirt'),
+    ('Home & Kitchen', 'fa-blender'), ('Furniture', 'fa-couch'), ('Agriculture', 'fa-seedling'),
+    ('Vehicles', 'fa-car'), ('Books', 'fa-book'), ('Sports', 'fa-futbol'), ('Beauty', 'fa-spa'),
+    ('Baby & Kids', 'fa-baby'), ('Services', 'fa-tools'),
+]
+SUBCATEGORY_WORDS = ['Accessories', 'Parts', 'New', 'Used', 'Premium', 'Budget', 'Outdoor', 'Kids', 'Women', 'Men']
+ADJECTIVES = ['Brand new', 'Slightly used', 'Durable', 'Original', 'Affordable', 'Classic', 'Compact',
+              'Portable', 'Heavy duty', 'Stylish', 'Refurbished', 'Handmade']
+NOUNS = ['phone', 'laptop', 'sofa', 'jacket', 'blender', 'bicycle', 'water tank', 'school bag', 'TV',
+         'fridge', 'dining table', 'sneakers', 'maize sheller', 'solar panel', 'gas cooker', 'novel',
+         'football', 'hair dryer', 'baby stroller', 'wheelbarrow', 'mattress', 'radio', 'camera', 'dress']
+BRANDS = ['Samsung', 'Tecno', 'Infinix', 'HP', 'Lenovo', 'Ramtons', 'Von', 'Hotpoint', 'Nike', 'Adidas',
+          'Bata', 'Sony', 'LG', 'Mika', 'Armco', None, None, None]
+LOCATIONS = ['Nairobi', 'Mombasa', 'Kisumu', 'Nakuru', 'Eldoret', 'Thika', 'Machakos', 'Nyeri', 'Kitale',
+             'Malindi', 'Kakamega', 'Meru', 'Embu', 'Naivasha']
+
+PRODUCT_STATUSES = (['active', 'sold', 'pending', 'inactive', 'draft'], [75, 12, 4, 5, 4])
+CONDITIONS = ([value for value, _ in Product.CONDITION_CHOICES], [25, 25, 30, 15, 5])
+ORDER_STATUSES = (['interested', 'contacted', 'negotiating', 'confirmed', 'completed', 'cancelled', 'rejected'],
+                  [30, 15, 10, 10, 25, 7, 3])
+RATINGS = ([1, 2, 3, 4, 5], [5, 7, 15, 33, 40])
+NOTIFICATION_TYPES = [value for value, _ in Notification.TYPE_CHOICES]
+
+PLACEHOLDER_DIR = 'product_images/synthetic'
+PLACEHOLDER_COLORS = ['#2e7d32', '#1565c0', '#c62828', '#f9a825', '#6a1b9a', '#00838f', '#4e342e', '#37474f']
+
+
+class Skewed:
+    """Pick items with Zipf-like popularity: a few are picked far more often than the rest"""
+
+    def __init__(self, items, rng, exponent=1.0):
+        self.items = list(items)
+        # Shuffled so popularity doesn't follow insertion order
+        rng.shuffle(self.items)
+        self.rng = rng
+        self.cum_weights = list(itertools.accumulate(1 / (rank + 1) ** exponent for rank in range(len(self.items))))
+
+    def pick(self, k=1):
+        return self.rng.choices(self.items, cum_weights=self.cum_weights, k=k)
+
+    def one(self):
+        return self.pick()[0]
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Let bulk_create keep the generated auto_now/auto_now_add values instead of now()"""
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = (
+        'Fill the database with synthetic users, categories, products, orders, reviews, '
+        'notifications and conversations with realistic skew, for load testing'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--seller-share', type=float, default=0.15, help='Fraction of users who sell')
+        parser.add_argument('--categories', type=int, default=40, help='Total categories, nested up to 3 levels')
+        parser.add_argument('--products', type=int, default=10000)
+        parser.add_argument('--max-images', type=int, default=4, help='Images per product, 1 to this many')
+        parser.add_argument('--orders', type=int, default=20000)
+        parser.add_argument('--reviews', type=int, default=5000, help='Taken from completed orders')
+        parser.add_argument('--wishlist', type=int, default=10000)
+        parser.add_argument('--notifications', type=int, default=50000)
+        parser.add_argument('--conversations', type=int, default=3000)
+        parser.add_argument('--messages', type=int, default=8, help='Average messages per conversation')
+        parser.add_argument('--days', type=int, default=365, help='History spread over this many days')
+        parser.add_argument('--prefix', default='load', help='Prefix of generated usernames and category names')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.rng = random.Random(options['seed'])
+        self.now = timezone.now()
+        self.batch_size = options['batch_size']
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=f'{prefix}_').exists():
+            raise CommandError(f'Users prefixed "{prefix}_" already exist, pass another --prefix')
+
+        models = [Profile, Category, Product, ProductImage, Order, Review, Wishlist,
+                  Notification, Conversation, Message]
+        with explicit_timestamps(*models):
+            buyers, sellers = self.step('users', self.create_users)
+            categories = self.step('categories', self.create_categories)
+            products = self.step('products', self.create_products, sellers, categories)
+            self.step('images', self.create_images, products)
+            completed = self.step('orders', self.create_orders, buyers, products)
+            ratings = self.step('reviews', self.create_reviews, completed)
+            self.step('wishlist', self.create_wishlist, buyers, products)
+            unread = self.step('notifications', self.create_notifications, buyers + sellers)
+            self.step('conversations', self.create_conversations, buyers, products)
+            self.step('profile counters', self.update_profiles, ratings, unread)
+
+        # bulk_create skipped every signal handler
+        self.step('product cards', rebuild_product_cards, self.batch_size)
+        self.step('search index', get_search_backend().rebuild)
+        invalidate_category_tree()
+        invalidate_tags('products', 'categories')
+        self.stdout.write(self.style.SUCCESS('Done.'))
+
+    def step(self, name, function, *args):
+        started = timezone.now()
+        result = function(*args)
+        seconds = (timezone.now() - started).total_seconds()
+        self.stdout.write(f'  {name:<18} {seconds:7.1f}s')
+        return result
+
+    def insert(self, model, objects):
+        """bulk_create in batches, one transaction per batch; returns the created objects' pks"""
+        pks = []
+        for batch in batched(objects, self.batch_size):
+            with transaction.atomic():
+                pks.extend(obj.pk for obj in model.objects.bulk_create(batch))
+        return pks
+
+    def moment(self, after=None):
+        """A random time in the last --days, most of them recent"""
+        moment = self.now - timedelta(seconds=self.options['days'] * 86400 * self.rng.random() ** 2)
+        if after and moment < after:
+            moment = after + (self.now - after) * self.rng.random()
+        return moment
+
+    def create_users(self):
+        prefix, total = self.options['prefix'], self.options['users']
+        seller_count = max(1, int(total * self.options['seller_share']))
+        # Hashing is slow on purpose, every generated user shares one hash
+        password = make_password('password')
+        roles = ['seller' if i < seller_count else 'buyer' for i in range(total)]
+        joined = [self.moment() for _ in range(total)]
+        names = [f'{prefix}_{role}_{i}' for i, role in enumerate(roles)]
+        user_ids = self.insert(User, (
+            User(username=name, email=f'{name}@example.com', password=password, date_joined=date_joined)
+            for name, date_joined in zip(names, joined)
+        ))
+        profile_ids = self.insert(Profile, (
+            Profile(
+                user_id=user_id, role=role, location=self.rng.choice(LOCATIONS),
+                phone_number=f'07{self.rng.randint(10000000, 99999999)}',
+                whatsapp_number=f'2547{self.rng.randint(10000000, 99999999)}' if role == 'seller' else None,
+                created_at=date_joined, updated_at=date_joined,
+            )
+            for user_id, role, date_joined in zip(user_ids, roles, joined)
+        ))
+        self.profile_ids = dict(zip(user_ids, profile_ids))
+        buyers = [user_id for user_id, role in zip(user_ids, roles) if role == 'buyer']
+        sellers = [user_id for user_id, role in zip(user_ids, roles) if role == 'seller']
+        return buyers, sellers
+
+    def create_categories(self):
+        prefix, total = self.options['prefix'], self.options['categories']
+        roots = ROOT_CATEGORIES[:max(1, min(len(ROOT_CATEGORIES), total // 3))]
+        levels = []
+        ids = self.insert(Category, (
+            Category(name=f'{prefix} {name}', icon=icon, is_featured=i < 6, created_at=self.moment())
+            for i, (name, icon) in enumerate(roots)
+        ))
+        levels.append(list(zip(ids, (f'{prefix} {name}' for name, _ in roots))))
+
+        # The rest hang under existing categories, at most three levels deep
+        remaining, depth = total - len(ids), 1
+        while remaining > 0 and depth < 3:
+            count = remaining if depth == 2 else (remaining + 1) // 2
+            parents = levels[-1]
+            children = []
+            for i in range(count):
+                parent_id, parent_name = parents[i % len(parents)]
+                word = SUBCATEGORY_WORDS[(i // len(parents)) % len(SUBCATEGORY_WORDS)]
+                children.append((parent_id, f'{parent_name} {word} {i}'))
+            ids = self.insert(Category, (
+                Category(name=name, parent_id=parent_id, created_at=self.moment()) for parent_id, name in children
+            ))
+            levels.append(list(zip(ids, (name for _, name in children))))
+            remaining -= count
+            depth += 1
+        return [category_id for level in levels for category_id, _ in level]
+
+    def create_products(self, sellers, categories):
+        seller_picker = Skewed(sellers, self.rng, exponent=1.1)
+        category_picker = Skewed(categories, self.rng, exponent=0.8)
+        rows = []
+
+        def build():
+            for _ in range(self.options['products']):
+                seller_id = seller_picker.one()
+                title = f'{self.rng.choice(ADJECTIVES)} {self.rng.choice(NOUNS)}'
+                brand = self.rng.choice(BRANDS)
+                if brand:
+                    title = f'{brand} {title.lower()}'
+                price = Decimal(str(round(min(self.rng.lognormvariate(8, 1.2), 9999999), 2)))
+                created = self.moment()
+                product = Product(
+                    seller_id=seller_id, title=title,
+                    slug=f'{slugify(title)}-{uuid.uuid4().hex[:8]}',
+                    description=f'{title}. Located in {self.rng.choice(LOCATIONS)}, '
+                                f'call or WhatsApp for more details. ' * self.rng.randint(1, 4),
+                    price=price,
+                    original_price=(price * Decimal('1.2')).quantize(Decimal('0.01')) if self.rng.random() < 0.2 else None,
+                    category_id=category_picker.one(),
+                    condition=self.rng.choices(*CONDITIONS)[0],
+                    brand=brand,
+                    status=self.rng.choices(*PRODUCT_STATUSES)[0],
+                    location=self.rng.choice(LOCATIONS),
+                    quantity=self.rng.randint(1, 5),
+                    views=int(self.rng.paretovariate(1.2) * 10),
+                    is_negotiable=self.rng.random() < 0.6,
+                    is_featured=self.rng.random() < 0.03,
+                    created_at=created,
+                    updated_at=self.moment(after=created),
+                )
+                rows.append((seller_id, price, created))
+                yield product
+
+        ids = self.insert(Product, build())
+        # Only what later steps need: (pk, seller, price, created_at)
+        return [(pk, *row) for pk, row in zip(ids, rows)]
+
+    def placeholder_images(self):
+        """A handful of small images shared by every generated product"""
+        from PIL import Image
+
+        directory = os.path.join(settings.MEDIA_ROOT, PLACEHOLDER_DIR)
+        os.makedirs(directory, exist_ok=True)
+        names = []
+        for i, color in enumerate(PLACEHOLDER_COLORS):
+            name = f'{PLACEHOLDER_DIR}/placeholder_{i}.jpg'
+            path = os.path.join(settings.MEDIA_ROOT, name)
+            if not os.path.exists(path):
+                Image.new('RGB', (800, 600), color).save(path, 'JPEG', quality=70)
+            names.append(name)
+        return names
+
+    def create_images(self, products):
+        names = self.placeholder_images()
+        self.insert(ProductImage, (
+            ProductImage(
+                product_id=pk, image=self.rng.choice(names), is_primary=(i == 0),
+                alt_text=f'Photo {i + 1}', uploaded_at=self.moment(after=created),
+            )
+            for pk, _, _, created in products
+            for i in range(self.rng.randint(1, self.options['max_images']))
+        ))
+
+    def create_orders(self, buyers, products):
+        buyer_picker = Skewed(buyers, self.rng, exponent=0.9)
+        product_picker = Skewed(products, self.rng, exponent=1.1)
+        completed = []
+
+        def build():
+            for _ in range(self.options['orders']):
+                buyer_id = buyer_picker.one()
+                product_id, seller_id, price, product_created = product_picker.one()
+                status = self.rng.choices(*ORDER_STATUSES)[0]
+                created = self.moment(after=product_created)
+                updated = self.moment(after=created)
+                if status == 'completed' and len(completed) < self.options['reviews'] * 2:
+                    completed.append((buyer_id, seller_id, product_id, created))
+                yield Order(
+                    order_number=f'ORD-{uuid.uuid4().hex[:10].upper()}',
+                    buyer_id=buyer_id, product_id=product_id, seller_id=seller_id,
+                    quantity=1 if self.rng.random() < 0.85 else self.rng.randint(2, 4),
+                    agreed_price=price, status=status,
+                    buyer_contact=f'07{self.rng.randint(10000000, 99999999)}',
+                    whatsapp_contacted=self.rng.random() < 0.5,
+                    meeting_preference=self.rng.choice(['pickup', 'delivery', None]),
+                    created_at=created, updated_at=updated,
+                    completed_at=updated if status == 'completed' else None,
+                )
+
+        self.insert(Order, build())
+        return completed
+
+    def create_reviews(self, completed):
+        seen = set()
+        ratings = defaultdict(list)
+
+        def build():
+            for buyer_id, seller_id, product_id, ordered in completed:
+                if len(seen) >= self.options['reviews'] or (buyer_id, seller_id, product_id) in seen:
+                    continue
+                seen.add((buyer_id, seller_id, product_id))
+                rating = self.rng.choices(*RATINGS)[0]
+                ratings[seller_id].append(rating)
+                created = self.moment(after=ordered)
+                yield Review(
+                    reviewer_id=buyer_id, seller_id=seller_id, product_id=product_id, rating=rating,
+                    title=['Terrible', 'Not great', 'Okay', 'Good deal', 'Excellent seller'][rating - 1],
+                    comment='Generated review. ' * self.rng.randint(1, 5),
+                    is_verified_purchase=True,
+                    helpful_count=int(self.rng.paretovariate(1.5)) - 1,
+                    created_at=created, updated_at=created,
+                )
+
+        self.insert(Review, build())
+        return ratings
+
+    def create_wishlist(self, buyers, products):
+        buyer_picker = Skewed(buyers, self.rng, exponent=0.9)
+        product_picker = Skewed([pk for pk, *_ in products], self.rng, exponent=1.1)
+        seen = set()
+
+        def build():
+            # Popular products saturate quickly, so give up after a bounded number of tries
+            for _ in range(self.options['wishlist'] * 3):
+                if len(seen) >= self.options['wishlist']:
+                    return
+                pair = (buyer_picker.one(), product_picker.one())
+                if pair in seen:
+                    continue
+                seen.add(pair)
+                yield Wishlist(user_id=pair[0], product_id=pair[1], added_at=self.moment())
+
+        self.insert(Wishlist, build())
+
+    def create_notifications(self, users):
+        user_picker = Skewed(users, self.rng, exponent=0.8)
+        unread = Counter()
+
+        def build():
+            for _ in range(self.options['notifications']):
+                user_id = user_picker.one()
+                created = self.moment()
+                # Old notifications have mostly been read
+                is_read = self.rng.random() < (0.95 if created < self.now - timedelta(days=7) else 0.3)
+                if not is_read:
+                    unread[user_id] += 1
+                notification_type = self.rng.choice(NOTIFICATION_TYPES)
+                yield Notification(
+                    user_id=user_id, notification_type=notification_type,
+                    title=notification_type.replace('_', ' ').capitalize(),
+                    message='Generated notification for load testing.',
+                    is_read=is_read, is_important=self.rng.random() < 0.05, created_at=created,
+                )
+
+        self.insert(Notification, build())
+        return unread
+
+    def create_conversations(self, buyers, products):
+        buyer_picker = Skewed(buyers, self.rng, exponent=0.9)
+        product_picker = Skewed(products, self.rng, exponent=1.1)
+        threads = []
+        pairs = set()
+        for _ in range(self.options['conversations']):
+            product_id, seller_id, _, product_created = product_picker.one()
+            buyer_id = buyer_picker.one()
+            # One thread per pair of users, as Conversation.get_or_create_for() keeps it
+            if (buyer_id, seller_id) in pairs:
+                continue
+            pairs.add((buyer_id, seller_id))
+            threads.append((buyer_id, seller_id, product_id, self.moment(after=product_created)))
+
+        ids = self.insert(Conversation, (
+            Conversation(
+                product_id=product_id, participant_key=Conversation.pair_key(buyer_id, seller_id),
+                created_at=created, updated_at=created,
+            )
+            for buyer_id, seller_id, product_id, created in threads
+        ))
+
+        last_messages = []
+        for chunk in batched(zip(ids, threads), self.batch_size):
+            messages, owners, last_senders = [], [], {}
+            for conversation_id, (buyer_id, seller_id, _, created) in chunk:
+                count = max(1, int(self.rng.expovariate(1 / self.options['messages'])))
+                moment = created
+                for i in range(count):
+                    moment = moment + (self.now - moment) * self.rng.random() * 0.2
+                    messages.append(Message(
+                        conversation_id=conversation_id, sender_id=buyer_id if i % 2 == 0 else seller_id,
+                        content=self.rng.choice(['Is this still available?', 'Yes it is.', 'Last price?',
+                                                 'Where are you located?', 'Can you deliver?', 'Deal.']),
+                        # Everything but the latest reply has been read
+                        is_read=i < count - 1, created_at=moment,
+                    ))
+                    owners.append((conversation_id, moment))
+                    last_senders[conversation_id] = messages[-1].sender_id
+            message_ids = self.insert(Message, messages)
+            latest = {}
+            for message_id, (conversation_id, moment) in zip(message_ids, owners):
+                latest[conversation_id] = (message_id, moment)
+            last_messages.extend(
+                Conversation(pk=conversation_id, last_message_id=message_id, updated_at=moment)
+                for conversation_id, (message_id, moment) in latest.items()
+            )
+            # The latest message is unread by whoever didn't send it
+            self.insert(ConversationParticipant, (
+                ConversationParticipant(
+                    conversation_id=conversation_id, user_id=user_id,
+                    unread_count=int(user_id != last_senders[conversation_id]),
+                )
+                for conversation_id, (buyer_id, seller_id, _, _) in chunk
+                for user_id in (buyer_id, seller_id)
+            ))
+        for batch in batched(last_messages, self.batch_size):
+            Conversation.objects.bulk_update(batch, ['last_message', 'updated_at'])
+
+    def update_profiles(self, ratings, unread):
+        """Seller rating histograms and unread counters that Review.save() and Notification.save() would keep"""
+        profiles = []
+        for user_id, profile_id in self.profile_ids.items():
+            scores = ratings.get(user_id, [])
+            stars = Counter(scores)
+            profiles.append(Profile(
+                pk=profile_id,
+                rating=Decimal(sum(scores) / len(scores)).quantize(Decimal('0.01')) if scores else Decimal('0'),
+                total_ratings=len(scores),
+                **{f'ratings_{n}': stars[n] for n in range(1, 6)},
+                unread_notifications=unread.get(user_id, 0),
+            ))
+        fields = ['rating', 'total_ratings', 'unread_notifications'] + [f'ratings_{n}' for n in range(1, 6)]
+        for batch in batched(profiles, self.batch_size):
+            Profile.objects.bulk_update(batch, fields)
@@ -0,0 +1,232 @@
+import logging
+import math
+import random
+import statistics
+import threading
+import time
+from contextlib import ExitStack
+from urllib.error import HTTPError
+from urllib.request import HTTPRedirectHandler, Request, build_opener
+from wsgiref.simple_server import WSGIRequestHandler, make_server
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Count
+from django.test import Client
+from django.urls import reverse
+
+from marketApp.models import Category, Product
+
+QUERY_HEADER = 'X-Query-Count'
+
+SEARCH_TERMS = ['phone', 'sofa', 'samsung', 'laptop', 'solar', 'jacket', 'tank', 'bicycle']
+
+
+class QueryCounter:
+    """Counts the queries run on every database connection of the current thread"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+    def counting(self):
+        self.count = 0
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(self))
+        return stack
+
+
+class CountingWSGIHandler(WSGIHandler):
+    """Reports the queries of each request in a response header"""
+
+    def __call__(self, environ, start_response):
+        counter = QueryCounter()
+
+        def counting_start_response(status, headers, exc_info=None):
+            return start_response(status, headers + [(QUERY_HEADER, str(counter.count))], exc_info)
+
+        with counter.counting():
+            return super().__call__(environ, counting_start_response)
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class NoRedirects(HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Request shop, product pages, dashboards and the JSON APIs as a buyer and a seller '
+        'and report p50/p95/p99 latency and queries per request for each'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50, help='Measured requests per scenario')
+        parser.add_argument('--warmup', type=int, default=3, help='Unmeasured requests per scenario first')
+        parser.add_argument('--buyer', help='Username to browse as (default: the buyer with the most orders)')
+        parser.add_argument('--seller', help='Username to sell as (default: the seller with the most products)')
+        parser.add_argument('--scenario', action='append', dest='scenarios', help='Only run this scenario, can be repeated')
+        parser.add_argument('--server', action='store_true',
+                            help='Go through a local WSGI server over HTTP instead of the test client')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.host = next((h.lstrip('.') for h in settings.ALLOWED_HOSTS if h != '*'), 'localhost')
+        buyer = self.get_user('buyer', options['buyer'], 'orders')
+        seller = self.get_user('seller', options['seller'], 'products')
+
+        scenarios = [s for s in self.scenarios() if not options['scenarios'] or s[0] in options['scenarios']]
+        if not scenarios:
+            raise CommandError('No scenario matches --scenario')
+        clients = {'anonymous': Client(SERVER_NAME=self.host), 'buyer': Client(SERVER_NAME=self.host),
+                   'seller': Client(SERVER_NAME=self.host)}
+        clients['buyer'].force_login(buyer)
+        clients['seller'].force_login(seller)
+
+        server = None
+        if options['server']:
+            server = make_server('127.0.0.1', 0, CountingWSGIHandler(), handler_class=QuietHandler)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            fetch = self.http_fetcher(server.server_port, clients)
+        else:
+            fetch = self.client_fetcher(clients)
+
+        self.stdout.write(f'Browsing as {buyer.username} (buyer) and {seller.username} (seller), '
+                          f"{options['requests']} requests per scenario"
+                          f"{' through a local WSGI server' if server else ''}")
+        self.stdout.write(f"{'scenario':<22}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}"
+                          f"{'queries':>9}{'max q':>7}  status")
+
+        # Views with missing templates would log a traceback per request
+        request_logger = logging.getLogger('django.request')
+        level = request_logger.level
+        request_logger.setLevel(logging.CRITICAL)
+        try:
+            for name, role, make_url in scenarios:
+                self.run_scenario(name, role, make_url, fetch, options)
+        finally:
+            request_logger.setLevel(level)
+            if server:
+                server.shutdown()
+                server.server_close()
+
+    def get_user(self, role, username, ranked_by):
+        users = User.objects.select_related('profile')
+        if username:
+            user = users.filter(username=username).first()
+        else:
+            # The busiest account is the realistic worst case for its dashboards
+            user = users.filter(profile__role=role).annotate(n=Count(ranked_by)).order_by('-n').first()
+        if user is None:
+            raise CommandError(f'No {role} found, pass --{role} or run generate_market_data first')
+        return user
+
+    def scenarios(self):
+        """(name, role, url factory) per scenario; products and categories follow a popularity skew"""
+        product_ids = list(
+            Product.objects.filter(status='active').order_by('-views').values_list('pk', flat=True)[:500]
+        )
+        category_ids = list(Category.objects.values_list('pk', flat=True))
+        rng = self.rng
+
+        def popular(ids):
+            return ids[min(len(ids) - 1, int(rng.paretovariate(1.2)) - 1)]
+
+        scenarios = [
+            ('home', 'anonymous', lambda: reverse('home')),
+            ('shop', 'buyer', lambda: reverse('shop')),
+            ('shop search', 'buyer', lambda: f"{reverse('shop')}?q={rng.choice(SEARCH_TERMS)}"),
+            ('shop sort price', 'buyer', lambda: f"{reverse('shop')}?sort=price"),
+            ('shop sort views', 'buyer', lambda: f"{reverse('shop')}?sort=-views"),
+            ('buyer home', 'buyer', lambda: reverse('buyer_home')),
+            ('my orders', 'buyer', lambda: reverse('my_orders')),
+            ('my wishlist', 'buyer', lambda: reverse('my_wishlist')),
+            ('notifications', 'buyer', lambda: reverse('notifications')),
+            ('api notif count', 'buyer', lambda: reverse('api_notifications_count')),
+            ('check notifications', 'buyer', lambda: reverse('check_notifications')),
+            ('seller home', 'seller', lambda: reverse('seller_home')),
+            ('seller products', 'seller', lambda: reverse('seller_products')),
+            ('seller orders', 'seller', lambda: reverse('seller_orders')),
+            ('seller analytics', 'seller', lambda: reverse('seller_analytics')),
+        ]
+        if category_ids:
+            scenarios.insert(5, ('shop category', 'buyer',
+                                 lambda: f"{reverse('shop')}?category={popular(category_ids)}"))
+        if product_ids:
+            scenarios.insert(5, ('product detail', 'buyer',
+                                 lambda: reverse('product_detail', args=[popular(product_ids)])))
+            scenarios.insert(1, ('product anonymous', 'anonymous',
+                                 lambda: reverse('product_detail', args=[popular(product_ids)])))
+        return scenarios
+
+    def client_fetcher(self, clients):
+        counter = QueryCounter()
+
+        def fetch(role, url):
+            with counter.counting():
+                started = time.perf_counter()
+                response = clients[role].get(url)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                elapsed = time.perf_counter() - started
+            return response.status_code, elapsed, counter.count
+
+        return fetch
+
+    def http_fetcher(self, port, clients):
+        opener = build_opener(NoRedirects)
+        cookies = {
+            role: '; '.join(f'{name}={morsel.value}' for name, morsel in client.cookies.items())
+            for role, client in clients.items()
+        }
+
+        def fetch(role, url):
+            request = Request(f'http://127.0.0.1:{port}{url}', headers={'Host': self.host, 'Cookie': cookies[role]})
+            started = time.perf_counter()
+            try:
+                with opener.open(request) as response:
+                    response.read()
+                    status, headers = response.status, response.headers
+            except HTTPError as error:
+                error.read()
+                status, headers = error.code, error.headers
+            elapsed = time.perf_counter() - started
+            return status, elapsed, int(headers.get(QUERY_HEADER, 0))
+
+        return fetch
+
+    def run_scenario(self, name, role, make_url, fetch, options):
+        for _ in range(options['warmup']):
+            fetch(role, make_url())
+
+        latencies, queries, statuses = [], [], {}
+        for _ in range(options['requests']):
+            status, elapsed, count = fetch(role, make_url())
+            latencies.append(elapsed * 1000)
+            queries.append(count)
+            statuses[status] = statuses.get(status, 0) + 1
+
+        latencies.sort()
+        status = ' '.join(f'{code}x{n}' for code, n in sorted(statuses.items()))
+        line = (f'{name:<22}{percentile(latencies, 50):>9.1f}{percentile(latencies, 95):>9.1f}'
+                f'{percentile(latencies, 99):>9.1f}{latencies[-1]:>9.1f}'
+                f'{statistics.mean(queries):>9.1f}{max(queries):>7}  {status}')
+        self.stdout.write(line if set(statuses) == {200} else self.style.WARNING(line))
+
+
+def percentile(ordered, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from marketApp.cards import rebuild_product_cards
+
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized card fields (image, seller, interest and wishlist counts) of every product'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of products rebuilt per batch')
+
+    def handle(self, *args, **options):
+        total = rebuild_product_cards(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt the card fields of {total} products'))
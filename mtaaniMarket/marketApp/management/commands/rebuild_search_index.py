@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from marketApp.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the product full-text search index from scratch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of products indexed per batch')
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        backend.setup()
+        total = backend.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {total} products with {backend.__class__.__name__}'
+        ))
@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from marketApp.counters import invalidate_user_counts
+from marketApp.models import Notification, Profile
+from marketApp.realtime import bump_notification_version
+
+
+class Command(BaseCommand):
+    help = 'Recount unread notifications and repair drifted Profile.unread_notifications counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of profiles checked per batch')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report drifted counters without fixing them')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        profiles = Profile.objects.order_by('pk').only('pk', 'user_id', 'unread_notifications')
+        checked = fixed = 0
+        last_pk = 0
+
+        while True:
+            batch = list(profiles.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            checked += len(batch)
+
+            actual = dict(
+                Notification.objects.filter(
+                    user_id__in=[profile.user_id for profile in batch], is_read=False
+                ).values_list('user_id').annotate(n=Count('pk')).order_by()
+            )
+            drifted = []
+            for profile in batch:
+                count = actual.get(profile.user_id, 0)
+                if profile.unread_notifications != count:
+                    self.stdout.write(
+                        f'User {profile.user_id}: counter {profile.unread_notifications}, actual {count}'
+                    )
+                    profile.unread_notifications = count
+                    drifted.append(profile)
+
+            fixed += len(drifted)
+            if drifted and not options['dry_run']:
+                Profile.objects.bulk_update(drifted, ['unread_notifications'])
+                user_ids = [profile.user_id for profile in drifted]
+                invalidate_user_counts(*user_ids)
+                bump_notification_version(*user_ids)
+
+        verb = 'Found' if options['dry_run'] else 'Repaired'
+        self.stdout.write(self.style.SUCCESS(
+            f'Checked {checked} profiles. {verb} {fixed} drifted counters.'
+        ))
@@ -0,0 +1,31 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from marketApp.analytics import rollup_analytics
+
+
+def parse_date(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f'Invalid date "{value}", expected YYYY-MM-DD')
+
+
+class Command(BaseCommand):
+    help = 'Roll up per-seller daily Analytics rows for the days since the last run'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=parse_date,
+                            help='Re-process from this day instead of the watermark (YYYY-MM-DD)')
+        parser.add_argument('--until', type=parse_date,
+                            help='Last day to process, defaults to yesterday (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        start, end, written = rollup_analytics(since=options['since'], until=options['until'])
+        if start is None:
+            self.stdout.write(f'Nothing to roll up, analytics are current up to {end}')
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Rolled up {start} to {end}: {written} seller-day rows written'
+        ))
@@ -0,0 +1,61 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from marketApp.routers import get_replicas
+
+
+class Command(BaseCommand):
+    help = (
+        'Copy the primary SQLite database into every SQLite replica in '
+        'MARKET_DATABASE_REPLICAS, optionally every few seconds'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--alias', action='append', dest='aliases',
+                            help='Only sync this replica alias, can be repeated')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep syncing every this many seconds (default: sync once)')
+        parser.add_argument('--pages', type=int, default=1024,
+                            help='Pages copied per backup step, so writers are only paused briefly')
+
+    def handle(self, *args, **options):
+        primary = settings.DATABASES[DEFAULT_DB_ALIAS]
+        if connections[DEFAULT_DB_ALIAS].vendor != 'sqlite':
+            raise CommandError('Only SQLite primaries can be copied, use the database\'s own replication')
+
+        aliases = options['aliases'] or get_replicas()
+        unknown = set(aliases) - set(settings.DATABASES)
+        if unknown:
+            raise CommandError(f"Unknown database aliases: {', '.join(sorted(unknown))}")
+        if not aliases:
+            raise CommandError('No replicas configured in MARKET_DATABASE_REPLICAS')
+
+        while True:
+            for alias in aliases:
+                if connections[alias].vendor != 'sqlite':
+                    self.stdout.write(f'  skip {alias}: not SQLite, replicated by the database server')
+                    continue
+                started = time.perf_counter()
+                self.copy(primary['NAME'], settings.DATABASES[alias]['NAME'], options['pages'])
+                # Drop pooled connections that may still see the old file
+                connections[alias].close()
+                self.stdout.write(self.style.SUCCESS(
+                    f'Synced {alias} in {(time.perf_counter() - started) * 1000:.0f} ms'
+                ))
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def copy(self, source_name, target_name, pages):
+        """Online backup, a consistent snapshot even while the primary takes writes"""
+        source = sqlite3.connect(source_name)
+        target = sqlite3.connect(target_name)
+        try:
+            source.backup(target, pages=pages)
+        finally:
+            target.close()
+            source.close()
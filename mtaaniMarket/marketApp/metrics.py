@@ -0,0 +1,196 @@
+# marketApp/metrics.py
+import bisect
+import heapq
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+
+DEFAULTS = {
+    'ENABLED': False,
+    # Requests slower than this are logged with their worst queries
+    'SLOW_REQUEST_MS': 500,
+    'WORST_QUERIES': 5,
+    # Upper bounds (ms) of the latency histogram buckets, plus one open-ended bucket
+    'BUCKETS_MS': [10, 25, 50, 100, 250, 500, 1000, 2500, 5000],
+    # Histograms cover this many of the most recent minutes
+    'WINDOW_MINUTES': 60,
+}
+
+# Timings of the request being handled, None when it isn't instrumented
+_current = ContextVar('market_request_metrics', default=None)
+
+
+def get_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'MARKET_REQUEST_METRICS', {}))
+    return config
+
+
+class RequestTimings:
+    """SQL and template timings collected while one request runs"""
+
+    def __init__(self, worst_queries):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+        self.worst_queries = worst_queries
+        # Min-heap of (seconds, sql), so the fastest of the worst is dropped first
+        self.worst = []
+
+    def record_query(self, sql, seconds):
+        self.sql_count += 1
+        self.sql_seconds += seconds
+        if len(self.worst) < self.worst_queries:
+            heapq.heappush(self.worst, (seconds, sql))
+        elif self.worst and seconds > self.worst[0][0]:
+            heapq.heapreplace(self.worst, (seconds, sql))
+
+    def __call__(self, execute, sql, params, many, context):
+        """connection.execute_wrapper hook"""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.record_query(sql, time.perf_counter() - started)
+
+    def worst_first(self):
+        return sorted(self.worst, reverse=True)
+
+
+def start_request(worst_queries):
+    timings = RequestTimings(worst_queries)
+    return timings, _current.set(timings)
+
+
+def finish_request(token):
+    _current.reset(token)
+
+
+_instrumented = False
+
+
+def instrument_templates():
+    """
+    Time top-level template renders. Only Django-engine templates rendered
+    through the backend (render(), TemplateResponse, render_to_string) are
+    timed, {% include %}s are part of their parent's time.
+    """
+    global _instrumented
+    if _instrumented:
+        return
+    from django.template.backends.django import Template
+
+    original = Template.render
+
+    def render(self, context=None, request=None):
+        timings = _current.get()
+        if timings is None:
+            return original(self, context, request)
+        started = time.perf_counter()
+        try:
+            return original(self, context, request)
+        finally:
+            timings.template_seconds += time.perf_counter() - started
+
+    Template.render = render
+    _instrumented = True
+
+
+class Histograms:
+    """
+    Per-URL-name latency histograms over a rolling window of one-minute
+    slots. Kept in process memory, so each worker reports its own traffic.
+    """
+
+    def __init__(self, buckets_ms, window_minutes):
+        self.buckets_ms = list(buckets_ms)
+        self.window_minutes = window_minutes
+        self.lock = threading.Lock()
+        # {minute: {name: stats}}
+        self.slots = {}
+
+    def _empty(self):
+        return {
+            'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'sql_count': 0, 'sql_ms': 0.0, 'template_ms': 0.0,
+            'buckets': [0] * (len(self.buckets_ms) + 1),
+        }
+
+    def record(self, name, total_ms, sql_count, sql_ms, template_ms):
+        minute = int(time.time() // 60)
+        with self.lock:
+            slot = self.slots.get(minute)
+            if slot is None:
+                slot = self.slots[minute] = {}
+                oldest = minute - self.window_minutes
+                for stale in [m for m in self.slots if m <= oldest]:
+                    del self.slots[stale]
+            stats = slot.get(name)
+            if stats is None:
+                stats = slot[name] = self._empty()
+            stats['count'] += 1
+            stats['total_ms'] += total_ms
+            stats['max_ms'] = max(stats['max_ms'], total_ms)
+            stats['sql_count'] += sql_count
+            stats['sql_ms'] += sql_ms
+            stats['template_ms'] += template_ms
+            stats['buckets'][bisect.bisect_left(self.buckets_ms, total_ms)] += 1
+
+    def snapshot(self):
+        """Window totals per URL name with mean figures and estimated percentiles"""
+        oldest = int(time.time() // 60) - self.window_minutes
+        merged = {}
+        with self.lock:
+            for minute, slot in self.slots.items():
+                if minute <= oldest:
+                    continue
+                for name, stats in slot.items():
+                    total = merged.setdefault(name, self._empty())
+                    for key in ('count', 'total_ms', 'sql_count', 'sql_ms', 'template_ms'):
+                        total[key] += stats[key]
+                    total['max_ms'] = max(total['max_ms'], stats['max_ms'])
+                    total['buckets'] = [a + b for a, b in zip(total['buckets'], stats['buckets'])]
+
+        labels = [f'<={bound}' for bound in self.buckets_ms] + [f'>{self.buckets_ms[-1]}']
+        report = {}
+        for name, stats in sorted(merged.items()):
+            count = stats['count']
+            report[name] = {
+                'requests': count,
+                'mean_ms': round(stats['total_ms'] / count, 2),
+                'max_ms': round(stats['max_ms'], 2),
+                'p50_ms': self._percentile(stats['buckets'], count, 0.50),
+                'p95_ms': self._percentile(stats['buckets'], count, 0.95),
+                'p99_ms': self._percentile(stats['buckets'], count, 0.99),
+                'mean_queries': round(stats['sql_count'] / count, 2),
+                'mean_sql_ms': round(stats['sql_ms'] / count, 2),
+                'mean_template_ms': round(stats['template_ms'] / count, 2),
+                'histogram': dict(zip(labels, stats['buckets'])),
+            }
+        return report
+
+    def _percentile(self, buckets, count, fraction):
+        """Upper bound of the bucket holding the percentile, None for the open-ended bucket"""
+        rank = fraction * count
+        seen = 0
+        for bound, n in zip(self.buckets_ms, buckets):
+            seen += n
+            if seen >= rank:
+                return bound
+        return None
+
+
+_histograms = None
+_histograms_lock = threading.Lock()
+
+
+def get_histograms():
+    """Histograms shared by every request in this process"""
+    global _histograms
+    with _histograms_lock:
+        if _histograms is None:
+            config = get_config()
+            _histograms = Histograms(config['BUCKETS_MS'], config['WINDOW_MINUTES'])
+        return _histograms
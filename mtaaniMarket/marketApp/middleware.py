@@ -0,0 +1,88 @@
+# marketApp/middleware.py
+import logging
+import time
+from contextlib import ExitStack
+
+from django.contrib.auth import BACKEND_SESSION_KEY
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from .metrics import finish_request, get_config as get_metrics_config, get_histograms, instrument_templates, start_request
+
+logger = logging.getLogger('marketApp.metrics')
+
+PROFILE_BACKEND = 'marketApp.backends.ProfileBackend'
+MODEL_BACKEND = 'django.contrib.auth.backends.ModelBackend'
+
+
+class ProfileMiddleware:
+    """
+    Moves sessions that were logged in through the plain ModelBackend over
+    to ProfileBackend, so existing logins also get the user and profile
+    from one joined query. Must run before AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        session = getattr(request, 'session', None)
+        if session is not None and session.get(BACKEND_SESSION_KEY) == MODEL_BACKEND:
+            session[BACKEND_SESSION_KEY] = PROFILE_BACKEND
+        return self.get_response(request)
+
+
+class RequestMetricsMiddleware:
+    """
+    Times SQL, template rendering and the whole request. Sends them as a
+    Server-Timing header, logs slow requests with their worst queries and
+    feeds the per-URL histograms behind the admin metrics endpoint.
+    Removed from the chain entirely unless MARKET_REQUEST_METRICS['ENABLED'].
+    Goes first in MIDDLEWARE so the total covers the other middleware too.
+    """
+
+    def __init__(self, get_response):
+        self.config = get_metrics_config()
+        if not self.config['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.histograms = get_histograms()
+        instrument_templates()
+
+    def __call__(self, request):
+        timings, token = start_request(self.config['WORST_QUERIES'])
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timings))
+                response = self.get_response(request)
+        finally:
+            finish_request(token)
+
+        total_ms = (time.perf_counter() - timings.started) * 1000
+        sql_ms = timings.sql_seconds * 1000
+        template_ms = timings.template_seconds * 1000
+        app_ms = max(total_ms - sql_ms - template_ms, 0)
+        server_timing = (
+            f'sql;dur={sql_ms:.1f};desc="{timings.sql_count} queries", '
+            f'tpl;dur={template_ms:.1f};desc="templates", '
+            f'app;dur={app_ms:.1f};desc="python", total;dur={total_ms:.1f}'
+        )
+        if response.has_header('Server-Timing'):
+            server_timing = f"{response['Server-Timing']}, {server_timing}"
+        response['Server-Timing'] = server_timing
+
+        match = request.resolver_match
+        name = match.view_name if match else 'unresolved'
+        self.histograms.record(name, total_ms, timings.sql_count, sql_ms, template_ms)
+
+        if total_ms >= self.config['SLOW_REQUEST_MS']:
+            worst = ''.join(
+                f'\n  {seconds * 1000:.1f} ms: {sql[:500]}' for seconds, sql in timings.worst_first()
+            )
+            logger.warning(
+                'Slow request %s %s (%s): %.0f ms total, %d queries in %.0f ms, templates %.0f ms%s',
+                request.method, request.get_full_path(), name, total_ms,
+                timings.sql_count, sql_ms, template_ms, worst,
+            )
+        return response
@@ -0,0 +1,32 @@
+from django.db import migrations
+
+from marketApp.search import SQLiteFTS5Backend
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    backend = SQLiteFTS5Backend()
+    backend.setup(schema_editor.connection)
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {backend.table} (rowid, title, description, brand) "
+            f"SELECT id, title, description, COALESCE(brand, '') FROM marketApp_product"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    SQLiteFTS5Backend().teardown(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketApp', '0002_profile_bio_profile_created_at_profile_is_verified_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
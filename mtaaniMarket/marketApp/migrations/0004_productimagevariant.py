@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketApp', '0003_product_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductImageVariant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('format', models.CharField(choices=[('webp', 'WebP'), ('jpeg', 'JPEG')], max_length=10)),
+                ('width', models.PositiveIntegerField()),
+                ('height', models.PositiveIntegerField()),
+                ('file', models.ImageField(max_length=255, upload_to='product_images/variants/')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('image', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='variants', to='marketApp.productimage')),
+            ],
+            options={
+                'ordering': ['format', 'width'],
+                'unique_together': {('image', 'format', 'width')},
+            },
+        ),
+    ]
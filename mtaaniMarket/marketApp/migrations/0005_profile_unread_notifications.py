@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:00
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_unread_notifications(apps, schema_editor):
+    Profile = apps.get_model('marketApp', 'Profile')
+    Notification = apps.get_model('marketApp', 'Notification')
+    unread = Notification.objects.filter(
+        user_id=OuterRef('user_id'), is_read=False
+    ).values('user_id').annotate(n=Count('pk')).values('n')
+    Profile.objects.update(unread_notifications=Coalesce(Subquery(unread), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketApp', '0004_productimagevariant'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='unread_notifications',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_unread_notifications, migrations.RunPython.noop),
+    ]
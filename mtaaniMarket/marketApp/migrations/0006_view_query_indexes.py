@@ -0,0 +1,95 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:06
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketApp', '0005_profile_unread_notifications'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'created_at'], name='message_conversation_created'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'created_at'], name='notification_user_created'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'notification_type', 'created_at'], name='notification_user_type_created'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'is_read', 'created_at'], name='notification_user_unread'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['buyer', 'status', 'created_at'], name='order_buyer_status_created'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['buyer', 'created_at'], name='order_buyer_created'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['seller', 'status', 'created_at'], name='order_seller_status_created'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['seller', 'created_at'], name='order_seller_created'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'updated_at'], name='order_status_updated'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['status', 'created_at'], name='product_status_created'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['status', 'category', 'created_at'], name='product_status_cat_created'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['status', 'price'], name='product_status_price'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['status', 'views'], name='product_status_views'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['status', 'title'], name='product_status_title'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_featured', 'status', 'created_at'], name='product_featured_created'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['seller', 'status', 'created_at'], name='product_seller_status_created'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['seller', 'created_at'], name='product_seller_created'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['seller', 'created_at'], name='review_seller_created'),
+        ),
+        migrations.AddIndex(
+            model_name='whatsappcontact',
+            index=models.Index(fields=['contact_time'], name='whatsapp_contact_time'),
+        ),
+        migrations.AddIndex(
+            model_name='wishlist',
+            index=models.Index(fields=['user', 'added_at'], name='wishlist_user_added'),
+        ),
+    ]
@@ -0,0 +1,90 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:26
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_card_fields(apps, schema_editor):
+    Product = apps.get_model('marketApp', 'Product')
+    ProductImage = apps.get_model('marketApp', 'ProductImage')
+    ProductImageVariant = apps.get_model('marketApp', 'ProductImageVariant')
+    User = apps.get_model('auth', 'User')
+    Profile = apps.get_model('marketApp', 'Profile')
+    Order = apps.get_model('marketApp', 'Order')
+    Wishlist = apps.get_model('marketApp', 'Wishlist')
+
+    def count(model):
+        return Coalesce(Subquery(
+            model.objects.filter(product=OuterRef('pk')).order_by().values('product').annotate(
+                n=Count('pk')
+            ).values('n')
+        ), 0)
+
+    Product.objects.update(
+        seller_name=Subquery(User.objects.filter(pk=OuterRef('seller_id')).values('username')[:1]),
+        seller_rating=Coalesce(
+            Subquery(Profile.objects.filter(user_id=OuterRef('seller_id')).values('rating')[:1]),
+            Value(Decimal('0')), output_field=models.DecimalField(max_digits=3, decimal_places=2),
+        ),
+        interest_count=count(Order),
+        wishlist_count=count(Wishlist),
+    )
+
+    first = {}
+    for product_id, image_id, name in ProductImage.objects.order_by(
+        'product_id', '-is_primary', 'uploaded_at', 'pk'
+    ).values_list('product_id', 'pk', 'image').iterator():
+        first.setdefault(product_id, (image_id, name))
+    variants = {}
+    for image_id, image_format, width, name in ProductImageVariant.objects.order_by(
+        'format', 'width'
+    ).values_list('image_id', 'format', 'width', 'file').iterator():
+        variants.setdefault(image_id, []).append([image_format, width, name])
+    Product.objects.bulk_update([
+        Product(pk=product_id, card_image=name, card_image_variants=variants.get(image_id, []))
+        for product_id, (image_id, name) in first.items()
+    ], ['card_image', 'card_image_variants'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketApp', '0006_view_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='card_image',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='card_image_variants',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='interest_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='seller_name',
+            field=models.CharField(blank=True, default='', max_length=150),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='seller_rating',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=3),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='wishlist_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_card_fields, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:28
+
+from django.db import migrations, models
+from django.db.models import Count, F, FloatField, OuterRef, Subquery, Value
+from django.db.models.functions import Cast, Coalesce, NullIf, Round
+
+
+def count_ratings(apps, schema_editor):
+    Profile = apps.get_model('marketApp', 'Profile')
+    Review = apps.get_model('marketApp', 'Review')
+
+    def stars(n):
+        reviews = Review.objects.filter(seller_id=OuterRef('user_id'), rating=n).order_by().values(
+            'seller_id'
+        ).annotate(count=Count('pk')).values('count')
+        return Coalesce(Subquery(reviews), 0)
+
+    Profile.objects.update(**{f'ratings_{n}': stars(n) for n in range(1, 6)})
+    total = F('ratings_1') + F('ratings_2') + F('ratings_3') + F('ratings_4') + F('ratings_5')
+    score = F('ratings_1') + 2 * F('ratings_2') + 3 * F('ratings_3') + 4 * F('ratings_4') + 5 * F('ratings_5')
+    Profile.objects.update(
+        total_ratings=total,
+        rating=Coalesce(
+            Round(Cast(score, FloatField()) / NullIf(total, 0), 2), Value(0.0), output_field=FloatField()
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketApp', '0007_product_card_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='ratings_1',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='ratings_2',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='ratings_3',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='ratings_4',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='ratings_5',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_ratings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:34
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_conversation_fields(apps, schema_editor):
+    Conversation = apps.get_model('marketApp', 'Conversation')
+    ConversationParticipant = apps.get_model('marketApp', 'ConversationParticipant')
+    Message = apps.get_model('marketApp', 'Message')
+
+    latest = Message.objects.filter(conversation=OuterRef('pk')).order_by('-created_at', '-pk').values('pk')[:1]
+    Conversation.objects.update(last_message=Subquery(latest))
+
+    unread = Message.objects.filter(
+        conversation=OuterRef('conversation_id'), is_read=False
+    ).filter(~Q(sender=OuterRef('user_id'))).order_by().values('conversation').annotate(n=Count('pk')).values('n')
+    ConversationParticipant.objects.update(unread_count=Coalesce(Subquery(unread), 0))
+
+    # Two-person threads get their pair key; when a pair already has several
+    # threads only the most recently active one does, so the key stays unique
+    members = {}
+    for conversation_id, user_id in ConversationParticipant.objects.values_list('conversation_id', 'user_id'):
+        members.setdefault(conversation_id, []).append(user_id)
+    keyed = []
+    seen = set()
+    for conversation in Conversation.objects.order_by('-updated_at', '-pk').only('pk'):
+        users = members.get(conversation.pk, [])
+        if len(users) != 2:
+            continue
+        low, high = sorted(users)
+        key = f"{low}:{high}"
+        if key in seen:
+            continue
+        seen.add(key)
+        conversation.participant_key = key
+        keyed.append(conversation)
+    Conversation.objects.bulk_update(keyed, ['participant_key'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketApp', '0008_profile_rating_histogram'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # The through model takes over the auto-created table as it is
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='ConversationParticipant',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to='marketApp.conversation')),
+                        ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversation_memberships', to=settings.AUTH_USER_MODEL)),
+                    ],
+                    options={
+                        'db_table': 'marketApp_conversation_participants',
+                        'unique_together': {('conversation', 'user')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='conversation',
+                    name='participants',
+                    field=models.ManyToManyField(related_name='conversations', through='marketApp.ConversationParticipant', to=settings.AUTH_USER_MODEL),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='conversationparticipant',
+            name='unread_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='participant_key',
+            field=models.CharField(blank=True, max_length=50, null=True, unique=True),
+        ),
+        migrations.RunPython(fill_conversation_fields, migrations.RunPython.noop),
+    ]
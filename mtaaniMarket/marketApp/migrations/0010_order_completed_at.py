@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:17
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_completed_at(apps, schema_editor):
+    # The completion time was never stored, the last update is the closest there is
+    Order = apps.get_model('marketApp', 'Order')
+    Order.objects.filter(status='completed').update(completed_at=F('updated_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketApp', '0009_conversation_participant_key'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='order',
+            name='order_status_updated',
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='completed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(fill_completed_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'completed_at'], name='order_status_completed'),
+        ),
+    ]
@@ -1,4 +1,5 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models.functions import Cast, Coalesce, Greatest, NullIf, Round
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
@@ -21,19 +22,78 @@ class Profile(models.Model):
     rating = models.DecimalField(max_digits=3, decimal_places=2, default=0.00, 
                                  validators=[MinValueValidator(0), MaxValueValidator(5)])
     total_ratings = models.IntegerField(default=0)
+    # Reviews received per star count; rating and total_ratings are derived
+    # from them by adjust_ratings(), which Review keeps calling
+    ratings_1 = models.PositiveIntegerField(default=0)
+    ratings_2 = models.PositiveIntegerField(default=0)
+    ratings_3 = models.PositiveIntegerField(default=0)
+    ratings_4 = models.PositiveIntegerField(default=0)
+    ratings_5 = models.PositiveIntegerField(default=0)
     is_verified = models.BooleanField(default=False)
+    # Kept in step with Notification by the model/queryset methods below,
+    # repaired by the reconcile_notification_counts command
+    unread_notifications = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return f"{self.user.username} ({self.get_role_display()})"
     
-    def update_rating(self, new_rating):
-        """Update user rating when new review is added"""
-        total_score = self.rating * self.total_ratings
-        self.total_ratings += 1
-        self.rating = (total_score + new_rating) / self.total_ratings
-        self.save()
+    @classmethod
+    def adjust_ratings(cls, user_id, added=None, removed=None):
+        """
+        Move one review's stars into (`added`) and/or out of (`removed`) a
+        seller's rating histogram and recompute rating and total_ratings from
+        it, all in SQL so concurrent reviews can't overwrite each other.
+        Returns the new rating.
+        """
+        if added == removed:
+            return None
+        changes = {}
+        if added:
+            changes[f'ratings_{added}'] = models.F(f'ratings_{added}') + 1
+        if removed:
+            changes[f'ratings_{removed}'] = Greatest(models.F(f'ratings_{removed}') - 1, 0)
+        
+        total = sum((models.F(f'ratings_{stars}') for stars in range(2, 6)), models.F('ratings_1'))
+        score = sum((stars * models.F(f'ratings_{stars}') for stars in range(2, 6)), models.F('ratings_1'))
+        profiles = cls.objects.filter(user_id=user_id)
+        with transaction.atomic():
+            profiles.update(**changes)
+            # A second UPDATE, so the averages see the histogram just written
+            profiles.update(
+                total_ratings=total,
+                rating=Coalesce(
+                    Round(Cast(score, models.FloatField()) / NullIf(total, 0), 2),
+                    models.Value(0.0), output_field=models.FloatField(),
+                ),
+            )
+            return profiles.values_list('rating', flat=True).first()
+    
+    def rating_distribution(self):
+        """Star counts from 5 down to 1 with their share of all ratings, read from the histogram"""
+        return [
+            {
+                'stars': stars,
+                'count': getattr(self, f'ratings_{stars}'),
+                'percent': round(100 * getattr(self, f'ratings_{stars}') / self.total_ratings) if self.total_ratings else 0,
+            }
+            for stars in range(5, 0, -1)
+        ]
+    
+    @classmethod
+    def adjust_unread_notifications(cls, user_id, delta):
+        """Atomically add `delta` to a user's unread notification counter"""
+        if delta:
+            cls.objects.filter(user_id=user_id).update(
+                unread_notifications=Greatest(models.F('unread_notifications') + delta, 0)
+            )
+    
+    @classmethod
+    def get_unread_notifications(cls, user_id):
+        """Unread notification count of a user, read from the counter row"""
+        count = cls.objects.filter(user_id=user_id).values_list('unread_notifications', flat=True).first()
+        return count or 0
 
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
@@ -53,10 +113,18 @@ class Category(models.Model):
     
     def get_all_products_count(self):
         """Get total products in this category including subcategories"""
-        count = self.products.count()
-        for subcat in self.subcategories.all():
-            count += subcat.get_all_products_count()
-        return count
+        from .categories import get_category_tree
+        node = get_category_tree().get(self.pk)
+        return node.total_products if node else 0
+
+class ProductQuerySet(models.QuerySet):
+    def for_cards(self):
+        """
+        Everything a product card renders. The card fields are denormalized
+        onto the product row (see marketApp.cards), so this is one query on
+        one table with no joins or prefetches.
+        """
+        return self
 
 class Product(models.Model):
     STATUS_CHOICES = (
@@ -95,6 +163,17 @@ class Product(models.Model):
     is_featured = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Card fields, copied from the images, seller, orders and wishlists by the
+    # signal handlers in marketApp.signals, rebuilt by rebuild_product_cards
+    card_image = models.CharField(max_length=255, blank=True, default='')
+    # [[format, width, file name], ...] of the card image's resized variants
+    card_image_variants = models.JSONField(default=list, blank=True)
+    seller_name = models.CharField(max_length=150, blank=True, default='')
+    seller_rating = models.DecimalField(max_digits=3, decimal_places=2, default=0)
+    interest_count = models.PositiveIntegerField(default=0)
+    wishlist_count = models.PositiveIntegerField(default=0)
+    
+    objects = ProductQuerySet.as_manager()
     
     class Meta:
         ordering = ['-created_at']
@@ -102,6 +181,18 @@ class Product(models.Model):
             models.Index(fields=['-created_at']),
             models.Index(fields=['price']),
             models.Index(fields=['status']),
+            # Listing indexes are ascending: scanned backwards they serve both
+            # "-field, -id" and "field, id" keyset orderings.
+            # shop: active products, optionally in one category, per sort key
+            models.Index(fields=['status', 'created_at'], name='product_status_created'),
+            models.Index(fields=['status', 'category', 'created_at'], name='product_status_cat_created'),
+            models.Index(fields=['status', 'price'], name='product_status_price'),
+            models.Index(fields=['status', 'views'], name='product_status_views'),
+            models.Index(fields=['status', 'title'], name='product_status_title'),
+            models.Index(fields=['is_featured', 'status', 'created_at'], name='product_featured_created'),
+            # seller dashboards, optionally filtered by status
+            models.Index(fields=['seller', 'status', 'created_at'], name='product_seller_status_created'),
+            models.Index(fields=['seller', 'created_at'], name='product_seller_created'),
         ]
     
     def __str__(self):
@@ -110,12 +201,21 @@ class Product(models.Model):
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = f"{slugify(self.title)}-{uuid.uuid4().hex[:8]}"
+        if self._state.adding and not self.seller_name:
+            self.copy_seller_snapshot()
         super().save(*args, **kwargs)
     
+    def copy_seller_snapshot(self):
+        """Fill the seller card fields of a new product from its seller"""
+        self.seller_name = self.seller.username
+        profile = getattr(self.seller, 'profile', None)
+        self.seller_rating = profile.rating if profile else 0
+    
     def increment_views(self):
-        """Increment product view count"""
+        """Increment product view count (buffered, written in batches by the view counter)"""
+        from .view_counter import view_counter
+        view_counter.record(self.pk)
         self.views += 1
-        self.save(update_fields=['views'])
     
     def mark_as_sold(self):
         """Mark product as sold"""
@@ -125,6 +225,21 @@ class Product(models.Model):
     def is_available(self):
         """Check if product is available for purchase"""
         return self.status == 'active' and self.quantity > 0
+    
+    @property
+    def primary_image(self):
+        """
+        First image in display order, rebuilt from the card fields without a
+        query. It is an unsaved ProductImage, good for rendering only.
+        """
+        if not self.card_image:
+            return None
+        image = ProductImage(product_id=self.pk, image=self.card_image)
+        image._variant_list = [
+            ProductImageVariant(format=image_format, width=width, height=0, file=name)
+            for image_format, width, name in self.card_image_variants
+        ]
+        return image
 
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
@@ -138,6 +253,57 @@ class ProductImage(models.Model):
     
     def __str__(self):
         return f"Image for {self.product.title}"
+    
+    def get_variants(self, image_format):
+        """Resized variants in the given format, smallest first"""
+        if not hasattr(self, '_variant_list'):
+            self._variant_list = list(self.variants.all())
+        variants = [v for v in self._variant_list if v.format == image_format]
+        return sorted(variants, key=lambda v: v.width)
+    
+    def srcset(self, image_format='jpeg'):
+        """Build an HTML srcset string from the resized variants"""
+        return ', '.join(f"{v.file.url} {v.width}w" for v in self.get_variants(image_format))
+    
+    @property
+    def webp_srcset(self):
+        return self.srcset('webp')
+    
+    @property
+    def jpeg_srcset(self):
+        return self.srcset('jpeg')
+    
+    @property
+    def thumbnail_url(self):
+        """Smallest JPEG variant, falling back to the original upload"""
+        variants = self.get_variants('jpeg')
+        return variants[0].file.url if variants else self.image.url
+
+class ProductImageVariant(models.Model):
+    """Resized copy of a ProductImage, generated by marketApp.images"""
+    FORMAT_CHOICES = (
+        ('webp', 'WebP'),
+        ('jpeg', 'JPEG'),
+    )
+    
+    image = models.ForeignKey(ProductImage, on_delete=models.CASCADE, related_name='variants')
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    file = models.ImageField(upload_to='product_images/variants/', max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        unique_together = ['image', 'format', 'width']
+        ordering = ['format', 'width']
+    
+    def __str__(self):
+        return f"{self.get_format_display()} {self.width}w of image #{self.image_id}"
+
+class OrderQuerySet(models.QuerySet):
+    def for_list(self):
+        """Orders with product, category and buyer/seller profiles preloaded"""
+        return self.select_related('product__category', 'buyer__profile', 'seller__profile')
 
 class Order(models.Model):
     STATUS_CHOICES = (
@@ -164,9 +330,22 @@ class Order(models.Model):
     notes = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # When the order first became completed, the day its sale counts on
+    completed_at = models.DateTimeField(null=True, blank=True, editable=False)
+    
+    objects = OrderQuerySet.as_manager()
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # my_orders and seller_orders, optionally filtered by status
+            models.Index(fields=['buyer', 'status', 'created_at'], name='order_buyer_status_created'),
+            models.Index(fields=['buyer', 'created_at'], name='order_buyer_created'),
+            models.Index(fields=['seller', 'status', 'created_at'], name='order_seller_status_created'),
+            models.Index(fields=['seller', 'created_at'], name='order_seller_created'),
+            # analytics rollup of completed sales
+            models.Index(fields=['status', 'completed_at'], name='order_status_completed'),
+        ]
     
     def __str__(self):
         return f"Order #{self.order_number} - {self.product.title}"
@@ -176,6 +355,11 @@ class Order(models.Model):
             self.order_number = f"ORD-{uuid.uuid4().hex[:10].upper()}"
         if not self.agreed_price and self.product:
             self.agreed_price = self.product.price
+        if self.status == 'completed' and not self.completed_at:
+            # Only set once, later edits don't move the sale to another day
+            self.completed_at = timezone.now()
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'completed_at'}
         super().save(*args, **kwargs)
     
     def get_total_price(self):
@@ -198,6 +382,9 @@ class WhatsAppContact(models.Model):
     
     class Meta:
         ordering = ['-contact_time']
+        indexes = [
+            models.Index(fields=['contact_time'], name='whatsapp_contact_time'),
+        ]
     
     def __str__(self):
         return f"{self.buyer.username} → {self.seller.username} - {self.product.title}"
@@ -237,17 +424,35 @@ class Review(models.Model):
     class Meta:
         unique_together = ['reviewer', 'seller', 'product']
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['seller', 'created_at'], name='review_seller_created'),
+        ]
     
     def __str__(self):
         return f"Review by {self.reviewer.username} - {self.rating} stars"
     
     def save(self, *args, **kwargs):
-        is_new = self.pk is None
-        super().save(*args, **kwargs)
-        
-        # Update seller's rating when new review is added
-        if is_new:
-            self.seller.profile.update_rating(self.rating)
+        with transaction.atomic():
+            previous = None
+            if not self._state.adding:
+                # Locked, so two edits of the same review can't both move the old stars
+                previous = Review.objects.select_for_update().filter(pk=self.pk).values_list(
+                    'seller_id', 'rating'
+                ).first()
+            super().save(*args, **kwargs)
+            
+            # Keep the seller's rating histogram in step (deletes: see signals)
+            if previous is None:
+                changed = {self.seller_id: (self.rating, None)}
+            elif previous[0] != self.seller_id:
+                changed = {self.seller_id: (self.rating, None), previous[0]: (None, previous[1])}
+            else:
+                changed = {self.seller_id: (self.rating, previous[1])}
+            for seller_id, (added, removed) in changed.items():
+                rating = Profile.adjust_ratings(seller_id, added=added, removed=removed)
+                if rating is not None:
+                    from .cards import copy_seller_rating
+                    copy_seller_rating(seller_id, rating)
     
     def mark_helpful(self):
         """Mark review as helpful"""
@@ -267,6 +472,9 @@ class Wishlist(models.Model):
     class Meta:
         unique_together = ['user', 'product']
         ordering = ['-added_at']
+        indexes = [
+            models.Index(fields=['user', 'added_at'], name='wishlist_user_added'),
+        ]
     
     def __str__(self):
         return f"{self.user.username}'s wishlist - {self.product.title}"
@@ -287,6 +495,29 @@ class SearchHistory(models.Model):
     def __str__(self):
         return f"{self.query} - {self.searched_at.strftime('%Y-%m-%d %H:%M')}"
 
+class NotificationQuerySet(models.QuerySet):
+    def _unread_per_user(self):
+        return dict(
+            self.filter(is_read=False).values_list('user_id').annotate(n=models.Count('pk')).order_by()
+        )
+    
+    def mark_read(self):
+        """Mark the notifications as read, updating the owners' unread counters"""
+        marked = 0
+        for user_id in self.filter(is_read=False).values_list('user_id', flat=True).distinct().order_by():
+            # The update count is what was actually flipped, so concurrent calls never double count
+            count = self.filter(user_id=user_id, is_read=False).update(is_read=True)
+            Profile.adjust_unread_notifications(user_id, -count)
+            marked += count
+        return marked
+    
+    def delete(self):
+        unread = self._unread_per_user()
+        result = super().delete()
+        for user_id, count in unread.items():
+            Profile.adjust_unread_notifications(user_id, -count)
+        return result
+
 class Notification(models.Model):
     TYPE_CHOICES = (
         ('new_order', 'New Order'),
@@ -308,22 +539,46 @@ class Notification(models.Model):
     is_important = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    objects = NotificationQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['user', 'is_read']),
+            # notifications page: all, per type tab and the unread tab, newest first
+            models.Index(fields=['user', 'created_at'], name='notification_user_created'),
+            models.Index(fields=['user', 'notification_type', 'created_at'], name='notification_user_type_created'),
+            models.Index(fields=['user', 'is_read', 'created_at'], name='notification_user_unread'),
         ]
     
     def __str__(self):
         return f"{self.get_notification_type_display()} - {self.user.username}"
     
+    def save(self, *args, **kwargs):
+        created = self._state.adding
+        super().save(*args, **kwargs)
+        if created and not self.is_read:
+            Profile.adjust_unread_notifications(self.user_id, 1)
+    
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        if not self.is_read:
+            Profile.adjust_unread_notifications(self.user_id, -1)
+        return result
+    
     def mark_as_read(self):
-        """Mark notification as read"""
+        """Mark notification as read, returns False if it already was"""
+        marked = Notification.objects.filter(pk=self.pk, is_read=False).update(is_read=True)
+        if marked:
+            Profile.adjust_unread_notifications(self.user_id, -1)
         self.is_read = True
-        self.save(update_fields=['is_read'])
+        return bool(marked)
 
 class Conversation(models.Model):
-    participants = models.ManyToManyField(User, related_name='conversations')
+    participants = models.ManyToManyField(User, related_name='conversations', through='ConversationParticipant')
+    # "<lower user id>:<higher user id>" of a two-person thread; unique, so
+    # finding a pair's thread is one index lookup and it can't be created twice
+    participant_key = models.CharField(max_length=50, unique=True, null=True, blank=True)
     product = models.ForeignKey(Product, on_delete=models.CASCADE, null=True, blank=True, 
                                 related_name='conversations')
     order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True, 
@@ -340,6 +595,53 @@ class Conversation(models.Model):
     def get_other_participant(self, user):
         """Get the other participant in the conversation"""
         return self.participants.exclude(id=user.id).first()
+    
+    @staticmethod
+    def pair_key(user_id, other_user_id):
+        low, high = sorted([user_id, other_user_id])
+        return f"{low}:{high}"
+    
+    @classmethod
+    def get_or_create_for(cls, user, other_user):
+        """The thread between two users, created on first contact"""
+        key = cls.pair_key(user.pk, other_user.pk)
+        conversation = cls.objects.filter(participant_key=key).first()
+        if conversation is not None:
+            return conversation
+        try:
+            with transaction.atomic():
+                conversation = cls.objects.create(participant_key=key)
+                conversation.participants.add(user, other_user)
+        except IntegrityError:
+            # Both users started it at the same time, the other request won
+            conversation = cls.objects.get(participant_key=key)
+        return conversation
+
+class ConversationParticipant(models.Model):
+    """A user in a conversation, with their unread message count"""
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='memberships')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conversation_memberships')
+    # Kept by Message.save() and mark_read(), so the inbox needs no per-row counts
+    unread_count = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        # The table of the former auto-created many-to-many
+        db_table = 'marketApp_conversation_participants'
+        unique_together = ['conversation', 'user']
+    
+    def __str__(self):
+        return f"{self.user.username} in conversation #{self.conversation_id}"
+    
+    @classmethod
+    def mark_read(cls, conversation_id, user_id):
+        """Mark a user's incoming messages in a conversation as read"""
+        with transaction.atomic():
+            Message.objects.filter(conversation_id=conversation_id, is_read=False).exclude(
+                sender_id=user_id
+            ).update(is_read=True, read_at=timezone.now())
+            cls.objects.filter(conversation_id=conversation_id, user_id=user_id).exclude(
+                unread_count=0
+            ).update(unread_count=0)
 
 class Message(models.Model):
     conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='messages')
@@ -351,16 +653,36 @@ class Message(models.Model):
     
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['conversation', 'created_at'], name='message_conversation_created'),
+        ]
     
     def __str__(self):
         return f"Message from {self.sender.username} - {self.created_at.strftime('%Y-%m-%d %H:%M')}"
     
+    def save(self, *args, **kwargs):
+        created = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if created:
+                # The thread's preview and everyone else's unread count
+                Conversation.objects.filter(pk=self.conversation_id).update(
+                    last_message=self, updated_at=self.created_at
+                )
+                ConversationParticipant.objects.filter(conversation_id=self.conversation_id).exclude(
+                    user_id=self.sender_id
+                ).update(unread_count=models.F('unread_count') + 1)
+    
     def mark_as_read(self):
         """Mark message as read"""
         if not self.is_read:
+            marked = Message.objects.filter(pk=self.pk, is_read=False).update(is_read=True, read_at=timezone.now())
+            if marked:
+                ConversationParticipant.objects.filter(conversation_id=self.conversation_id).exclude(
+                    user_id=self.sender_id
+                ).update(unread_count=Greatest(models.F('unread_count') - 1, 0))
             self.is_read = True
             self.read_at = timezone.now()
-            self.save(update_fields=['is_read', 'read_at'])
 
 class Report(models.Model):
     TYPE_CHOICES = (
@@ -0,0 +1,200 @@
+# marketApp/notifications.py
+import atexit
+import itertools
+import logging
+import queue
+import threading
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .counters import invalidate_user_counts
+from .models import Notification, Profile
+from .realtime import bump_notification_version
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'CHUNK_SIZE': 1000,         # recipients per bulk_create
+    # A new notification refreshes an unread one of the same type about the
+    # same object (or with the same title) from this many seconds ago instead
+    # of adding another, 0 turns coalescing off
+    'COALESCE_SECONDS': 3600,
+    'ASYNC': True,              # fan out on a background thread, not in the request
+}
+
+
+def get_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'MARKET_NOTIFICATIONS', {}))
+    return config
+
+
+def notify(recipients, notification_type, title, message, related_object_id=None,
+           related_content_type=None, is_important=False):
+    """
+    Notify many users at once. `recipients` is an iterable of user ids, a
+    values_list queryset is only evaluated by the worker. Nothing is
+    written until the current transaction commits, and then only on the
+    dispatcher thread unless MARKET_NOTIFICATIONS['ASYNC'] is off.
+    """
+    job = {
+        'recipients': recipients,
+        'notification_type': notification_type,
+        'title': title,
+        'message': message,
+        'related_object_id': related_object_id,
+        'related_content_type': related_content_type,
+        'is_important': is_important,
+    }
+    transaction.on_commit(lambda: dispatcher.submit(job))
+
+
+def _chunks(values, size):
+    iterator = iter(values)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+def _coalesce_key(notification):
+    """What makes two notifications duplicates: same user and type, same object or else same title"""
+    if notification.related_object_id is None:
+        return (notification.user_id, notification.notification_type, None, None, notification.title)
+    return (notification.user_id, notification.notification_type,
+            notification.related_content_type, notification.related_object_id, None)
+
+
+def write_notifications(notifications, config=None):
+    """
+    Write unsaved Notification instances, any mix of users and types, in
+    one transaction. Each one refreshes an unread duplicate from the last
+    COALESCE_SECONDS when there is one and is bulk_created otherwise.
+    Returns (created, coalesced).
+    """
+    config = config or get_config()
+    # Duplicates within the batch collapse too, the last one wins
+    pending = {_coalesce_key(notification): notification for notification in notifications}
+    if not pending:
+        return 0, 0
+    now = timezone.now()
+
+    with transaction.atomic():
+        refreshed = []
+        if config['COALESCE_SECONDS']:
+            candidates = Notification.objects.filter(
+                user_id__in={key[0] for key in pending},
+                notification_type__in={key[1] for key in pending},
+                is_read=False,
+                created_at__gte=now - timedelta(seconds=config['COALESCE_SECONDS']),
+            ).only('pk', 'user_id', 'notification_type', 'related_object_id', 'related_content_type', 'title')
+            by_text = defaultdict(list)
+            for existing in candidates:
+                notification = pending.pop(_coalesce_key(existing), None)
+                if notification is not None:
+                    refreshed.append(existing)
+                    by_text[notification.title, notification.message].append(existing.pk)
+            # Fan-outs share their text, so this is usually a single UPDATE
+            for (title, message), pks in by_text.items():
+                Notification.objects.filter(pk__in=pks).update(title=title, message=message, created_at=now)
+
+        created = Notification.objects.bulk_create(list(pending.values()))
+        # bulk_create skips Notification.save(), which keeps the unread
+        # counters; one UPDATE per distinct increment
+        by_increment = defaultdict(list)
+        for user_id, count in Counter(n.user_id for n in created if not n.is_read).items():
+            by_increment[count].append(user_id)
+        for count, user_ids in by_increment.items():
+            Profile.objects.filter(user_id__in=user_ids).update(
+                unread_notifications=F('unread_notifications') + count
+            )
+
+    user_ids = {notification.user_id for notification in created + refreshed}
+    invalidate_user_counts(*user_ids)
+    bump_notification_version(*user_ids)
+    return len(created), len(refreshed)
+
+
+def deliver(recipients, notification_type, title, message, related_object_id=None,
+            related_content_type=None, is_important=False, config=None):
+    """Write one fan-out in the calling thread, CHUNK_SIZE recipients at a time; returns (created, coalesced)"""
+    config = config or get_config()
+    created = coalesced = 0
+    # A queryset of ids is read in one go: 50k ids are small, and no read
+    # cursor stays open while the same connection writes
+    for chunk in _chunks(dict.fromkeys(recipients), config['CHUNK_SIZE']):
+        counts = write_notifications([
+            Notification(
+                user_id=user_id, notification_type=notification_type, title=title, message=message,
+                related_object_id=related_object_id, related_content_type=related_content_type,
+                is_important=is_important,
+            )
+            for user_id in chunk
+        ], config)
+        created += counts[0]
+        coalesced += counts[1]
+    return created, coalesced
+
+
+class NotificationDispatcher:
+    """
+    Background fan-out. submit() only queues the job; a worker thread writes
+    it with deliver(), so a request that notifies thousands of users returns
+    as quickly as one that notifies a single user.
+    """
+
+    def __init__(self):
+        self._jobs = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def submit(self, job):
+        config = get_config()
+        if not config['ASYNC']:
+            self._deliver(job, config)
+            return
+        self._jobs.put(job)
+        self._ensure_worker()
+
+    def drain(self):
+        """Deliver every queued job in the calling thread, returns how many there were"""
+        delivered = 0
+        while True:
+            try:
+                job = self._jobs.get_nowait()
+            except queue.Empty:
+                return delivered
+            self._deliver(job, get_config())
+            delivered += 1
+
+    def _deliver(self, job, config):
+        try:
+            deliver(config=config, **job)
+        except Exception:
+            logger.exception('Failed to deliver %s notifications', job['notification_type'])
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(target=self._run, name='notification-dispatch', daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            job = self._jobs.get()
+            try:
+                self._deliver(job, get_config())
+            finally:
+                close_old_connections()
+
+
+dispatcher = NotificationDispatcher()
+
+
+@atexit.register
+def _drain_on_exit():
+    dispatcher.drain()
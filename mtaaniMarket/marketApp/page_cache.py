@@ -0,0 +1,111 @@
+# marketApp/page_cache.py
+import hashlib
+import time
+from datetime import datetime, timezone
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+
+# Seconds a cached page or page data stays cached; changes invalidate it earlier
+DEFAULT_TIMEOUT = 600
+
+
+def _tag_key(tag):
+    return f'pages:tag:{tag}'
+
+
+def _changed_key(tag):
+    return f'pages:tag:{tag}:changed'
+
+
+def get_timeout():
+    return getattr(settings, 'MARKET_PAGE_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+
+
+def invalidate_tags(*tags):
+    """Drop every cached page and page data depending on one of the tags"""
+    for tag in tags:
+        key = _tag_key(tag)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 2, None)
+    cache.set_many({_changed_key(tag): time.time() for tag in tags}, None)
+
+
+def tag_state(*tags):
+    """
+    (versions, changed) of the tags: a tuple of their versions, and when
+    any of them was last invalidated as an aware datetime. Validators for views
+    whose content the tags cover, at the cost of one cache read.
+    """
+    keys = [_tag_key(tag) for tag in tags] + [_changed_key(tag) for tag in tags]
+    values = cache.get_many(keys)
+    versions = tuple(values.get(_tag_key(tag), 1) for tag in tags)
+    changed = [values.get(_changed_key(tag)) for tag in tags]
+    if None in changed:
+        # Never invalidated since the cache was emptied: treat that as a change now
+        now = time.time()
+        for tag in tags:
+            cache.add(_changed_key(tag), now, None)
+        changed = [value if value is not None else now for value in changed]
+    return versions, datetime.fromtimestamp(max(changed), tz=timezone.utc)
+
+
+def page_key(prefix, name, tags, params):
+    """Cache key for a view's parameters, changes whenever one of its tags is invalidated"""
+    versions = cache.get_many([_tag_key(tag) for tag in tags])
+    tagged = [f'{tag}={versions.get(_tag_key(tag), 1)}' for tag in sorted(tags)]
+    digest = hashlib.md5(repr((sorted(params.items()), tagged)).encode()).hexdigest()
+    return f'pages:{prefix}:{name}:{digest}'
+
+
+def cached_page_data(name, tags, compute, **params):
+    """
+    Return compute() cached per view name and parameters until one of the
+    tags is invalidated. Only cache what every visitor sees, per-user state
+    such as wishlist membership belongs outside compute().
+    """
+    timeout = get_timeout()
+    if not timeout:
+        return compute()
+
+    key = page_key('data', name, tags, params)
+    data = cache.get(key)
+    if data is None:
+        data = compute()
+        cache.set(key, data, timeout)
+    return data
+
+
+def cache_public_page(*tags):
+    """
+    Cache the whole rendered response of a view for anonymous visitors.
+
+    Tags may use the view's URL kwargs, e.g. 'reviews:{pk}'. Responses that
+    carry a CSRF token, set cookies or show flash messages are never cached.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            timeout = get_timeout()
+            if (not timeout or request.method not in ('GET', 'HEAD')
+                    or request.user.is_authenticated or len(messages.get_messages(request))):
+                return view_func(request, *args, **kwargs)
+
+            params = dict(kwargs, query=sorted(request.GET.lists()))
+            view_tags = [tag.format(**kwargs) for tag in tags]
+            key = page_key('response', view_func.__name__, view_tags, params)
+            response = cache.get(key)
+            if response is not None:
+                return response
+
+            response = view_func(request, *args, **kwargs)
+            if (response.status_code == 200 and not response.streaming and not response.cookies
+                    and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE')):
+                cache.set(key, response, timeout)
+            return response
+        return wrapper
+    return decorator
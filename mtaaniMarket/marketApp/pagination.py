@@ -0,0 +1,178 @@
+# marketApp/pagination.py
+import hashlib
+from collections.abc import Sequence
+from datetime import date, datetime
+from decimal import Decimal
+from functools import cached_property
+
+from django.core import signing
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db.models import Q
+from django.utils.dateparse import parse_date, parse_datetime
+
+# Seconds an estimated total stays cached
+DEFAULT_COUNT_TIMEOUT = 60
+
+CURSOR_SALT = 'marketApp.pagination.cursor'
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return ['dt', value.isoformat()]
+    if isinstance(value, date):
+        return ['d', value.isoformat()]
+    if isinstance(value, Decimal):
+        return ['dec', str(value)]
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, list):
+        kind, raw = value
+        if kind == 'dt':
+            return parse_datetime(raw)
+        if kind == 'd':
+            return parse_date(raw)
+        if kind == 'dec':
+            return Decimal(raw)
+        raise ValueError(f'Unknown cursor value type {kind!r}')
+    return value
+
+
+class CursorPage(Sequence):
+    """One page of a CursorPaginator, quacks enough like a Paginator page for templates"""
+
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f'<CursorPage of {len(self.object_list)} items>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """
+    Keyset pagination: pages are fetched with WHERE (sort key) > (last row)
+    instead of OFFSET, so every page costs the same and no COUNT(*) runs.
+
+    `ordering` defaults to the queryset's ordering; the primary key is
+    appended as a tie-breaker. Ordering fields must be non-null model
+    fields or annotations. Cursors are opaque signed tokens.
+    """
+
+    def __init__(self, queryset, per_page, ordering=None, count_timeout=DEFAULT_COUNT_TIMEOUT):
+        ordering = list(ordering or queryset.query.order_by or queryset.model._meta.ordering)
+        if not ordering:
+            raise ValueError('CursorPaginator needs an ordered queryset')
+        if ordering[-1].lstrip('-') not in ('pk', 'id'):
+            ordering.append('-pk' if ordering[0].startswith('-') else 'pk')
+
+        self.queryset = queryset
+        self.per_page = per_page
+        self.count_timeout = count_timeout
+        self.fields = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+
+    def _ordering(self, backwards):
+        return [
+            f"{'-' if descending != backwards else ''}{name}"
+            for name, descending in self.fields
+        ]
+
+    def _position_filter(self, values, backwards):
+        """Rows strictly after (or before, when backwards) the given sort key"""
+        condition = Q()
+        equal = {}
+        for (name, descending), value in zip(self.fields, values):
+            lookup = 'lt' if descending != backwards else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def _values(self, obj):
+        values = []
+        for name, _ in self.fields:
+            value = obj
+            for attr in name.split('__'):
+                value = getattr(value, attr)
+            values.append(value)
+        return values
+
+    def encode_cursor(self, obj, backwards=False):
+        payload = {'v': [_encode_value(value) for value in self._values(obj)]}
+        if backwards:
+            payload['b'] = 1
+        return signing.dumps(payload, salt=CURSOR_SALT, compress=True)
+
+    def decode_cursor(self, cursor):
+        """Return (values, backwards), or None for a missing, stale or tampered cursor"""
+        if not cursor:
+            return None
+        try:
+            payload = signing.loads(cursor, salt=CURSOR_SALT)
+            values = [_decode_value(value) for value in payload['v']]
+        except (signing.BadSignature, KeyError, TypeError, ValueError):
+            return None
+        if len(values) != len(self.fields):
+            return None
+        return values, bool(payload.get('b'))
+
+    def get_page(self, cursor=None):
+        """The page after (or before) `cursor`; the first page for an invalid cursor"""
+        position = self.decode_cursor(cursor)
+        backwards = bool(position and position[1])
+
+        queryset = self.queryset.order_by(*self._ordering(backwards))
+        if position:
+            queryset = queryset.filter(self._position_filter(position[0], backwards))
+
+        # One extra row tells whether there is another page in this direction
+        items = list(queryset[:self.per_page + 1])
+        has_more = len(items) > self.per_page
+        items = items[:self.per_page]
+        if backwards:
+            items.reverse()
+
+        has_next = has_more if not backwards else True
+        has_previous = has_more if backwards else position is not None
+
+        page = CursorPage(items, self)
+        if items and has_next:
+            page.next_cursor = self.encode_cursor(items[-1])
+        if items and has_previous:
+            page.previous_cursor = self.encode_cursor(items[0], backwards=True)
+        return page
+
+    @cached_property
+    def estimated_count(self):
+        """Total number of rows, cached briefly so it isn't recounted on every page"""
+        if not self.count_timeout:
+            return self.queryset.count()
+        try:
+            sql = str(self.queryset.order_by().query)
+        except EmptyResultSet:
+            # A .none() queryset, e.g. a search without terms
+            return 0
+        key = f'pagination:count:{hashlib.md5(sql.encode()).hexdigest()}'
+        count = cache.get(key)
+        if count is None:
+            count = self.queryset.count()
+            cache.set(key, count, self.count_timeout)
+        return count
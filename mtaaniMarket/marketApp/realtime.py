@@ -0,0 +1,167 @@
+# marketApp/realtime.py
+import asyncio
+import json
+import time
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Max
+
+from .models import Notification, Profile
+
+DEFAULTS = {
+    # Hold connections open for the SSE stream and long-polls. Only honoured
+    # for ASGI requests with a cache shared by every worker process: a WSGI
+    # worker would be tied up for the whole wait, and a per-process cache
+    # never sees bumps made by the other workers. Otherwise both answer at once.
+    'PUSH': False,
+    'POLL_INTERVAL': 1.0,       # seconds between checks of a user's version
+    'LONG_POLL_TIMEOUT': 25,    # seconds a long-poll waits before answering 304
+    'POLL_RETRY': 30,           # seconds clients wait between polls answered at once
+    'STREAM_MAX_AGE': 300,      # streams close after this, EventSource reconnects
+    'KEEPALIVE_INTERVAL': 15,
+}
+
+# Cache backends whose data lives in one process
+PROCESS_LOCAL_CACHES = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+def get_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'MARKET_REALTIME', {}))
+    return config
+
+
+def shared_cache():
+    """Whether the default cache, where the versions live, is seen by every worker process"""
+    return settings.CACHES[DEFAULT_CACHE_ALIAS]['BACKEND'] not in PROCESS_LOCAL_CACHES
+
+
+def push_enabled(request):
+    """Whether this request may hold its connection open waiting for changes"""
+    return get_config()['PUSH'] and isinstance(request, ASGIRequest) and shared_cache()
+
+
+@checks.register()
+def check_push_cache(app_configs, **kwargs):
+    if get_config()['PUSH'] and not shared_cache():
+        return [checks.Warning(
+            "MARKET_REALTIME['PUSH'] is on but the default cache is process-local",
+            hint='Configure a shared cache (file-based, Redis, Memcached); until then '
+                 'streams and long-polls answer immediately.',
+            id='marketApp.W001',
+        )]
+    return []
+
+
+def _version_key(user_id):
+    return f'notifications:version:{user_id}'
+
+
+def get_notification_version(user_id):
+    """Current notification version of a user, changes whenever their notifications change"""
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        cache.add(_version_key(user_id), 1, None)
+        version = cache.get(_version_key(user_id), 1)
+    return version
+
+
+async def aget_notification_version(user_id):
+    version = await cache.aget(_version_key(user_id))
+    if version is None:
+        await cache.aadd(_version_key(user_id), 1, None)
+        version = await cache.aget(_version_key(user_id), 1)
+    return version
+
+
+def bump_notification_version(*user_ids):
+    """Wake up streams and long-polls of the given users"""
+    for user_id in user_ids:
+        key = _version_key(user_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 2, None)
+
+
+def notification_etag(user_id, version):
+    return f'"notifications-{user_id}-{version}"'
+
+
+async def wait_for_change(user_id, version, timeout):
+    """Sleep until the user's version differs from `version`, returns the latest version"""
+    interval = get_config()['POLL_INTERVAL']
+    deadline = time.monotonic() + timeout
+    current = await aget_notification_version(user_id)
+    while current == version and time.monotonic() < deadline:
+        await asyncio.sleep(interval)
+        current = await aget_notification_version(user_id)
+    return current
+
+
+async def unread_count(user):
+    count = await Profile.objects.filter(user_id=user.pk).values_list(
+        'unread_notifications', flat=True
+    ).afirst()
+    return count or 0
+
+
+async def latest_notification_id(user):
+    result = await Notification.objects.filter(user=user).aaggregate(last=Max('id'))
+    return result['last'] or 0
+
+
+def sse_event(event, data, event_id=None):
+    """Format one Server-Sent Event"""
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+def serialize_notification(notification):
+    return {
+        'id': notification.id,
+        'type': notification.notification_type,
+        'title': notification.title,
+        'message': notification.message,
+        'is_important': notification.is_important,
+        'created_at': notification.created_at.isoformat(),
+    }
+
+
+async def event_stream(user, last_id):
+    """
+    Push the unread count whenever the user's notifications change, and
+    every notification newer than `last_id`. Event ids are notification
+    ids, so a reconnecting EventSource resumes via Last-Event-ID.
+    """
+    config = get_config()
+    yield 'retry: 3000\n\n'
+    version = None
+    started = last_sent = time.monotonic()
+
+    while time.monotonic() - started < config['STREAM_MAX_AGE']:
+        current = await aget_notification_version(user.pk)
+        if current != version:
+            version = current
+            new_notifications = Notification.objects.filter(
+                user=user, id__gt=last_id
+            ).order_by('id')[:20]
+            async for notification in new_notifications:
+                last_id = notification.id
+                yield sse_event('notification', serialize_notification(notification), event_id=last_id)
+            yield sse_event('count', {'unread_count': await unread_count(user)})
+            last_sent = time.monotonic()
+        elif time.monotonic() - last_sent >= config['KEEPALIVE_INTERVAL']:
+            yield ': keep-alive\n\n'
+            last_sent = time.monotonic()
+        await asyncio.sleep(config['POLL_INTERVAL'])
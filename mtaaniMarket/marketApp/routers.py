@@ -0,0 +1,103 @@
+# marketApp/routers.py
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+DEFAULTS = {
+    'ALIASES': [],          # database aliases that replicate 'default'
+    'STICKY_SECONDS': 5,    # reads stay on the primary this long after a session writes
+}
+
+# Only marketApp reads go to replicas: sessions and users must always see
+# the row that was just written at login/registration
+ROUTED_APPS = {'marketApp'}
+
+SESSION_KEY = '_replica_pinned_until'
+
+# Per-request routing state, a dict so writes made inside sync_to_async
+# threads (which run in a copied context) are still seen by the middleware
+_request_state = ContextVar('market_replica_state', default=None)
+
+
+def get_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'MARKET_DATABASE_REPLICAS', {}))
+    return config
+
+
+def get_replicas():
+    return [alias for alias in get_config()['ALIASES'] if alias in settings.DATABASES]
+
+
+class ReplicaRouter:
+    """
+    Send marketApp reads to a random replica, and everything else, every
+    write and every read of a request that writes or follows a recent
+    write of the same session to 'default'.
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label not in ROUTED_APPS:
+            return DEFAULT_DB_ALIAS
+        state = _request_state.get()
+        # Outside a request (commands, background threads) read the primary
+        if state is None or state['primary']:
+            return DEFAULT_DB_ALIAS
+        # Inside a transaction the replica can't see its uncommitted writes
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        replicas = get_replicas()
+        return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            state['primary'] = state['wrote'] = True
+        # Explicit, otherwise Django writes to the database the instance was read from
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        pool = {DEFAULT_DB_ALIAS, *get_replicas()}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary (sync_replicas or the database's own replication)
+        if db in get_replicas():
+            return False
+        return None
+
+
+class ReplicaMiddleware:
+    """
+    Pins a request to the primary when it isn't a safe method or its
+    session wrote within the last STICKY_SECONDS, and starts that window
+    after any request that wrote. Must come after SessionMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not get_replicas():
+            return self.get_response(request)
+
+        session = getattr(request, 'session', None)
+        pinned = request.method not in ('GET', 'HEAD', 'OPTIONS')
+        if not pinned and session is not None and session.session_key:
+            pinned = session.get(SESSION_KEY, 0) > time.time()
+
+        state = {'primary': pinned, 'wrote': False}
+        token = _request_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_state.reset(token)
+
+        if session is not None and (state['wrote'] or request.method not in ('GET', 'HEAD', 'OPTIONS')):
+            session[SESSION_KEY] = time.time() + get_config()['STICKY_SECONDS']
+        return response
@@ -0,0 +1,173 @@
+# marketApp/search.py
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+# Words are matched as prefixes, so "sams" finds "samsung"
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(query):
+    """Split a free-text query into lowercase search terms"""
+    return [token.lower() for token in TOKEN_RE.findall(query or '')][:10]
+
+
+class BaseSearchBackend:
+    """
+    Interface every product search backend implements.
+    Backends are selected with settings.MARKET_SEARCH_BACKEND.
+    """
+
+    def setup(self, conn=None):
+        """Create whatever storage the backend needs"""
+
+    def teardown(self, conn=None):
+        """Drop the storage created by setup()"""
+
+    def index_products(self, products):
+        """Add or refresh the given products in the index"""
+
+    def remove_products(self, product_ids):
+        """Remove products from the index"""
+
+    def rebuild(self, batch_size=1000):
+        """Re-index every product, returns the number indexed"""
+        return 0
+
+    def search(self, queryset, query, rank=True):
+        """
+        Restrict a Product queryset to products matching `query`.
+        When `rank` is True the results are annotated with `search_rank`
+        (lower is better) so callers can order_by('search_rank').
+        """
+        raise NotImplementedError
+
+    def no_matches(self, queryset, rank=True):
+        """An empty result that still carries `search_rank`, for queries with no terms"""
+        queryset = queryset.none()
+        if rank:
+            queryset = queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+        return queryset
+
+    def matching_ids(self, query):
+        """Return something usable in `pk__in=` for the products matching `query`"""
+        from .models import Product
+        return self.search(Product.objects.all(), query, rank=False).values('pk')
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """Portable fallback using icontains, for databases without a full-text index"""
+
+    def search(self, queryset, query, rank=True):
+        terms = tokenize(query)
+        if not terms:
+            return self.no_matches(queryset, rank)
+        for term in terms:
+            queryset = queryset.filter(
+                Q(title__icontains=term) |
+                Q(description__icontains=term) |
+                Q(brand__icontains=term)
+            )
+        if rank:
+            # No relevance here, every match ranks the same and the
+            # caller's secondary ordering decides
+            queryset = queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+        return queryset
+
+
+class SQLiteFTS5Backend(BaseSearchBackend):
+    """
+    Full-text search on an FTS5 virtual table whose rowid is the product id.
+    Ranking uses bm25() with the title weighted above brand and description.
+    """
+    table = 'marketApp_product_fts'
+    weights = (10.0, 1.0, 4.0)  # title, description, brand
+
+    def _cursor(self, conn=None):
+        return (conn or connection).cursor()
+
+    def setup(self, conn=None):
+        with self._cursor(conn) as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5("
+                f"title, description, brand, "
+                f"tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+            )
+
+    def teardown(self, conn=None):
+        with self._cursor(conn) as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {self.table}")
+
+    def index_products(self, products):
+        rows = [(p.pk, p.title or '', p.description or '', p.brand or '') for p in products]
+        if not rows:
+            return
+        with self._cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {self.table} WHERE rowid = %s", [(row[0],) for row in rows])
+            cursor.executemany(
+                f"INSERT INTO {self.table} (rowid, title, description, brand) VALUES (%s, %s, %s, %s)",
+                rows
+            )
+
+    def remove_products(self, product_ids):
+        with self._cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {self.table} WHERE rowid = %s", [(pk,) for pk in product_ids])
+
+    def rebuild(self, batch_size=1000):
+        from .models import Product
+
+        with self._cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table}")
+
+        total = 0
+        batch = []
+        products = Product.objects.only('id', 'title', 'description', 'brand').order_by()
+        for product in products.iterator(chunk_size=batch_size):
+            batch.append(product)
+            if len(batch) >= batch_size:
+                self.index_products(batch)
+                total += len(batch)
+                batch = []
+        self.index_products(batch)
+        total += len(batch)
+
+        with self._cursor() as cursor:
+            cursor.execute(f"INSERT INTO {self.table} ({self.table}) VALUES ('optimize')")
+        return total
+
+    def match_expression(self, query):
+        """Build an FTS5 MATCH expression: every term must match, as a prefix"""
+        return ' '.join(f'"{term}"*' for term in tokenize(query))
+
+    def search(self, queryset, query, rank=True):
+        expression = self.match_expression(query)
+        if not expression:
+            return self.no_matches(queryset, rank)
+
+        table = queryset.model._meta.db_table
+        queryset = queryset.filter(pk__in=RawSQL(
+            f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s",
+            [expression]
+        ))
+        if rank:
+            weights = ', '.join(str(w) for w in self.weights)
+            queryset = queryset.annotate(search_rank=RawSQL(
+                f"SELECT bm25({self.table}, {weights}) FROM {self.table} "
+                f"WHERE {self.table} MATCH %s AND rowid = {table}.id",
+                [expression]
+            ))
+        return queryset
+
+
+def get_search_backend():
+    """Return the configured search backend, picking one for the database by default"""
+    path = getattr(settings, 'MARKET_SEARCH_BACKEND', None)
+    if path:
+        return import_string(path)()
+    if connection.vendor == 'sqlite':
+        return SQLiteFTS5Backend()
+    return DatabaseSearchBackend()
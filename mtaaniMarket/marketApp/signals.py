@@ -0,0 +1,182 @@
+# marketApp/signals.py
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+
+from .alerts import WATCHED_FIELDS, alert_matcher, get_config as get_alert_config, product_alerts
+from .cards import (
+    copy_seller_name, copy_seller_rating, refresh_card_images, refresh_interest_counts, refresh_wishlist_counts
+)
+from .categories import invalidate_category_tree
+from .counters import invalidate_user_counts
+from .images import schedule_variants
+from .models import (
+    Category, Notification, Order, Product, ProductImage, ProductImageVariant, Profile, Review, Wishlist
+)
+from .page_cache import invalidate_tags
+from .realtime import bump_notification_version
+from .search import get_search_backend
+
+# Fields copied into the search index
+SEARCH_FIELDS = {'title', 'description', 'brand'}
+
+# Product fields the category tree counts depend on
+CATEGORY_TREE_FIELDS = {'category', 'category_id', 'status'}
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, update_fields=None, **kwargs):
+    """Keep the search index in sync when a product is saved"""
+    if update_fields and not SEARCH_FIELDS.intersection(update_fields):
+        return
+    get_search_backend().index_products([instance])
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    """Remove deleted products from the search index"""
+    get_search_backend().remove_products([instance.pk])
+
+
+@receiver(post_save, sender=ProductImage)
+def create_image_variants(sender, instance, created, raw=False, **kwargs):
+    """Queue thumbnail/WebP generation for newly uploaded images"""
+    if created and not raw and instance.image:
+        schedule_variants(instance)
+
+
+@receiver(post_delete, sender=ProductImageVariant)
+def delete_variant_file(sender, instance, **kwargs):
+    """Remove the resized file along with its row"""
+    if instance.file:
+        instance.file.delete(save=False)
+
+
+@receiver([post_save, post_delete], sender=Order)
+def invalidate_order_counts(sender, instance, **kwargs):
+    invalidate_user_counts(instance.buyer_id, instance.seller_id)
+
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_product_counts(sender, instance, **kwargs):
+    invalidate_user_counts(instance.seller_id)
+
+
+@receiver([post_save, post_delete], sender=Notification)
+@receiver([post_save, post_delete], sender=Wishlist)
+def invalidate_owner_counts(sender, instance, **kwargs):
+    invalidate_user_counts(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=Notification)
+def push_notification_change(sender, instance, **kwargs):
+    """Wake up the user's notification stream and long-polls"""
+    bump_notification_version(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_categories(sender, instance, **kwargs):
+    invalidate_category_tree()
+
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_category_counts(sender, instance, update_fields=None, **kwargs):
+    """Product counts per category change when a product moves, changes status or goes away"""
+    if update_fields and not CATEGORY_TREE_FIELDS.intersection(update_fields):
+        return
+    invalidate_category_tree()
+
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=ProductImage)
+@receiver([post_save, post_delete], sender=ProductImageVariant)
+def invalidate_product_pages(sender, instance, **kwargs):
+    """Product lists show up on every cached public page"""
+    invalidate_tags('products')
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_category_pages(sender, instance, **kwargs):
+    invalidate_tags('categories')
+
+
+@receiver([post_save, post_delete], sender=Review)
+def invalidate_review_pages(sender, instance, **kwargs):
+    if instance.product_id:
+        invalidate_tags(f'reviews:{instance.product_id}')
+
+
+@receiver([post_save, post_delete], sender=ProductImage)
+def refresh_product_card_image(sender, instance, raw=False, **kwargs):
+    """A new, removed or re-flagged image can change which one the card shows"""
+    if not raw:
+        refresh_card_images(instance.product_id)
+
+
+@receiver(post_save, sender=Profile)
+def refresh_seller_rating_on_cards(sender, instance, created, raw=False, **kwargs):
+    # Review keeps them current itself, this covers profiles saved by hand
+    if not created and not raw:
+        copy_seller_rating(instance.user_id, instance.rating)
+
+
+@receiver(post_save, sender=User)
+def refresh_seller_name_on_cards(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # Logins save last_login only
+    if created or raw or (update_fields and 'username' not in update_fields):
+        return
+    copy_seller_name(instance.pk, instance.username)
+
+
+@receiver(post_save, sender=Order)
+def count_new_interest(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        refresh_interest_counts(instance.product_id)
+
+
+@receiver(post_delete, sender=Order)
+def count_removed_interest(sender, instance, **kwargs):
+    refresh_interest_counts(instance.product_id)
+
+
+@receiver(post_save, sender=Wishlist)
+def count_new_wishlist_item(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        refresh_wishlist_counts(instance.product_id)
+
+
+@receiver(post_delete, sender=Wishlist)
+def count_removed_wishlist_item(sender, instance, **kwargs):
+    refresh_wishlist_counts(instance.product_id)
+
+
+@receiver(post_delete, sender=Review)
+def remove_review_rating(sender, instance, **kwargs):
+    """Take a deleted review's stars out of its seller's histogram, cascades included"""
+    rating = Profile.adjust_ratings(instance.seller_id, removed=instance.rating)
+    if rating is not None:
+        copy_seller_rating(instance.seller_id, rating)
+
+
+@receiver(pre_save, sender=Product)
+def remember_alert_fields(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Read the stored price/status/quantity so post_save can diff them"""
+    instance._alert_previous = None
+    if raw or instance._state.adding or not get_alert_config()['ENABLED']:
+        return
+    if update_fields and not set(WATCHED_FIELDS).intersection(update_fields):
+        return
+    instance._alert_previous = Product.objects.filter(pk=instance.pk).values(*WATCHED_FIELDS).first()
+
+
+@receiver(post_save, sender=Product)
+def queue_wishlist_alerts(sender, instance, **kwargs):
+    previous = getattr(instance, '_alert_previous', None)
+    if previous is None:
+        return
+    instance._alert_previous = None
+    alerts = product_alerts(previous, instance)
+    if alerts:
+        # Matched off the request by the alert matcher, and only if the change commits
+        transaction.on_commit(lambda: alert_matcher.record(alerts))
@@ -0,0 +1,20 @@
+# marketApp/templatetags/market_images.py
+from django import template
+
+register = template.Library()
+
+
+@register.inclusion_tag('marketApp/includes/product_picture.html')
+def product_picture(image, alt='', css_class='', style='', sizes='200px'):
+    """
+    Render a <picture> for a ProductImage with WebP and JPEG srcsets,
+    falling back to the original upload when no variants exist yet.
+    Usage: {% product_picture image alt=product.title css_class="card-img-top" %}
+    """
+    return {
+        'image': image,
+        'alt': alt,
+        'css_class': css_class,
+        'style': style,
+        'sizes': sizes,
+    }
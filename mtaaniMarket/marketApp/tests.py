@@ -1,2 +1,1140 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import mock
 
+from django.contrib.auth import BACKEND_SESSION_KEY
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.cache import SessionStore
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.db.models import Q
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .alerts import match_alerts, product_alerts
+from .analytics import rollup_analytics
+from .backends import ProfileBackend
+from .categories import get_category_tree
+from .counters import cached_user_counts, status_counts
+from .database import apply_pragmas, pragma_statements
+from .imports import (
+    ImageAttacher, ProductImporter, get_config as get_import_config, image_attacher, read_image, read_rows,
+    remove_stale_archives
+)
+from .metrics import get_histograms
+from .models import (
+    Analytics, Category, Conversation, ConversationParticipant, Message, Notification, Order, Product, ProductImage,
+    Profile, Review, Wishlist
+)
+from .notifications import deliver, notify, write_notifications
+from .page_cache import cached_page_data, invalidate_tags, tag_state
+from .pagination import CursorPaginator
+from .realtime import bump_notification_version, check_push_cache
+from .routers import ReplicaMiddleware, ReplicaRouter
+from .search import DatabaseSearchBackend, SQLiteFTS5Backend
+from .view_counter import ViewCounter
+
+
+def make_user(username, role='buyer'):
+    user = User.objects.create_user(username=username, password='pass12345')
+    Profile.objects.create(user=user, role=role)
+    return user
+
+
+def make_product(seller, title, **fields):
+    fields.setdefault('description', 'Barely used')
+    fields.setdefault('price', Decimal('1000.00'))
+    fields.setdefault('location', 'Nairobi')
+    return Product.objects.create(seller=seller, title=title, **fields)
+
+
+def png_bytes():
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new('RGB', (8, 8), 'red').save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class MarketTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+
+
+class SearchTests(MarketTestCase):
+    def setUp(self):
+        super().setUp()
+        self.seller = make_user('mama_mboga', role='seller')
+        self.buyer = make_user('wanjiku')
+        self.phone = make_product(self.seller, 'Samsung Galaxy phone', brand='Samsung')
+        self.case = make_product(self.seller, 'Phone case', description='Fits a Samsung Galaxy')
+        self.client.force_login(self.buyer)
+
+    def test_fts_ranks_title_matches_first(self):
+        results = SQLiteFTS5Backend().search(Product.objects.all(), 'samsung').order_by('search_rank', '-created_at')
+        self.assertEqual(list(results), [self.phone, self.case])
+
+    def test_fts_matches_prefixes(self):
+        results = SQLiteFTS5Backend().search(Product.objects.all(), 'gal', rank=False)
+        self.assertEqual(set(results), {self.phone, self.case})
+
+    def test_query_without_terms_matches_nothing(self):
+        for backend in (SQLiteFTS5Backend(), DatabaseSearchBackend()):
+            results = backend.search(Product.objects.all(), '!!!')
+            self.assertEqual(list(results.order_by('search_rank')), [])
+
+    def test_shop_search_with_only_punctuation(self):
+        response = self.client.get(reverse('shop'), {'q': '!!!'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['page_obj']), [])
+
+    @override_settings(MARKET_SEARCH_BACKEND='marketApp.search.DatabaseSearchBackend')
+    def test_shop_search_with_database_backend(self):
+        response = self.client.get(reverse('shop'), {'q': 'samsung'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.context['page_obj']), {self.phone, self.case})
+
+    def test_my_orders_matches_partial_order_number_and_seller(self):
+        order = Order.objects.create(buyer=self.buyer, seller=self.seller, product=self.phone)
+        for search in (order.order_number[:6], 'mboga', 'galaxy'):
+            response = self.client.get(reverse('my_orders'), {'search': search})
+            self.assertEqual(list(response.context['orders']), [order], search)
+
+
+class ViewCounterTests(MarketTestCase):
+    def setUp(self):
+        super().setUp()
+        seller = make_user('duka_la_vitu', role='seller')
+        self.products = [make_product(seller, f'Kitu {i}') for i in range(3)]
+        self.counter = ViewCounter()
+        # No flush thread, the tests flush by hand
+        worker = mock.patch.object(ViewCounter, '_ensure_worker')
+        worker.start()
+        self.addCleanup(worker.stop)
+
+    def views(self):
+        return [Product.objects.get(pk=product.pk).views for product in self.products]
+
+    def test_views_are_buffered_until_flushed(self):
+        self.counter.record(self.products[0].pk)
+        self.counter.record(self.products[0].pk)
+        self.assertEqual(self.counter.pending(self.products[0].pk), 2)
+        self.assertEqual(self.views(), [0, 0, 0])
+        self.assertEqual(self.counter.flush(), 2)
+        self.assertEqual(self.views(), [2, 0, 0])
+        self.assertEqual((self.counter.pending(), self.counter.flush()), (0, 0))
+
+    @override_settings(MARKET_VIEW_COUNTER={'FLUSH_THRESHOLD': 3})
+    def test_threshold_wakes_the_worker(self):
+        self.counter.record(self.products[0].pk, 2)
+        self.assertFalse(self.counter._wakeup.is_set())
+        self.counter.record(self.products[1].pk)
+        self.assertTrue(self.counter._wakeup.is_set())
+
+    def test_one_update_per_distinct_increment(self):
+        for product, count in zip(self.products, (2, 2, 5)):
+            self.counter.record(product.pk, count)
+        with CaptureQueriesContext(connection) as queries:
+            self.counter.flush()
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('UPDATE')]), 2)
+        self.assertEqual(self.views(), [2, 2, 5])
+
+    def test_failed_write_is_requeued(self):
+        self.counter.record(self.products[0].pk, 3)
+        with mock.patch.object(ViewCounter, '_write', side_effect=DatabaseError('database is locked')):
+            with self.assertRaises(DatabaseError):
+                self.counter.flush()
+        self.counter.record(self.products[0].pk)
+        self.assertEqual(self.counter.pending(self.products[0].pk), 4)
+        self.counter.flush()
+        self.assertEqual(self.views(), [4, 0, 0])
+
+    @override_settings(MARKET_VIEW_COUNTER={'ENABLED': False})
+    def test_disabled_counter_writes_inline(self):
+        self.counter.record(self.products[0].pk)
+        self.assertEqual((self.counter.pending(), self.views()), (0, [1, 0, 0]))
+
+
+class ImageVariantTests(MarketTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = make_product(make_user('picha', role='seller'), 'Camera')
+
+    def add_missing_image(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = ProductImage.objects.create(product=self.product, image='product_images/missing.jpg')
+        return image
+
+    @override_settings(MARKET_IMAGE_VARIANTS={'ASYNC': False, 'WIDTHS': [4, 400]})
+    def test_variants_are_rendered_and_recorded(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        with self.settings(MEDIA_ROOT=media_root), self.captureOnCommitCallbacks(execute=True):
+            image = ProductImage.objects.create(
+                product=self.product, image=SimpleUploadedFile('camera.png', png_bytes())
+            )
+        # 400 is wider than the 8px original, so it collapses to 8
+        variants = list(image.variants.order_by('format', 'width'))
+        self.assertEqual([(variant.format, variant.width) for variant in variants],
+                         [('jpeg', 4), ('jpeg', 8), ('webp', 4), ('webp', 8)])
+        for variant in variants:
+            self.assertTrue(os.path.exists(os.path.join(media_root, variant.file.name)))
+
+        image = ProductImage.objects.get(pk=image.pk)
+        self.assertEqual(image.thumbnail_url, variants[0].file.url)
+        self.assertEqual(image.webp_srcset, f'{variants[2].file.url} 4w, {variants[3].file.url} 8w')
+        # The card fields pick the variants up without a query per card
+        card = Product.objects.get(pk=self.product.pk).primary_image
+        self.assertEqual((card.thumbnail_url, card.webp_srcset), (image.thumbnail_url, image.webp_srcset))
+
+    @override_settings(MARKET_IMAGE_VARIANTS={'ASYNC': False})
+    def test_missing_original_is_logged_inline(self):
+        with self.assertLogs('marketApp.images', 'ERROR'):
+            image = self.add_missing_image()
+        self.assertFalse(image.variants.exists())
+
+    @override_settings(MARKET_IMAGE_VARIANTS={'ASYNC': True})
+    def test_unreadable_original_is_logged_before_submit(self):
+        with mock.patch('marketApp.images._render_args', side_effect=OSError('unreadable')), \
+                mock.patch('marketApp.images.get_executor') as executor, \
+                self.assertLogs('marketApp.images', 'ERROR'):
+            self.add_missing_image()
+        executor.return_value.submit.assert_not_called()
+
+
+class ListingQueryTests(MarketTestCase):
+    def setUp(self):
+        super().setUp()
+        self.seller = make_user('jua_kali', role='seller')
+        self.buyer = make_user('mwangi')
+        self.category = Category.objects.create(name='Tools')
+
+    def add_products(self, count):
+        for _ in range(count):
+            product = make_product(self.seller, f'Tool {Product.objects.count()}', category=self.category)
+            ProductImage.objects.create(product=product, image='product_images/tool.jpg', is_primary=True)
+            Order.objects.create(buyer=self.buyer, seller=self.seller, product=product)
+
+    def assertQueriesDoNotGrow(self, user, url):
+        self.client.force_login(user)
+        self.add_products(2)
+        with CaptureQueriesContext(connection) as few:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.add_products(3)
+        with CaptureQueriesContext(connection) as more:
+            self.client.get(url)
+        self.assertLessEqual(len(more), len(few))
+
+    def test_shop(self):
+        self.assertQueriesDoNotGrow(self.buyer, reverse('shop'))
+
+    def test_my_orders(self):
+        self.assertQueriesDoNotGrow(self.buyer, reverse('my_orders'))
+
+    def test_seller_products(self):
+        self.assertQueriesDoNotGrow(self.seller, reverse('seller_products'))
+
+
+class DashboardCountTests(MarketTestCase):
+    def setUp(self):
+        super().setUp()
+        self.seller = make_user('wakala', role='seller')
+        self.buyer = make_user('halima')
+        product = make_product(self.seller, 'Redio')
+        self.orders = [
+            Order.objects.create(buyer=self.buyer, seller=self.seller, product=product, status=status)
+            for status in ('interested', 'interested', 'completed')
+        ]
+
+    def test_counts_in_one_query(self):
+        with self.assertNumQueries(1):
+            counts = status_counts(
+                Order.objects.filter(buyer=self.buyer), pending=~Q(status__in=['completed', 'cancelled'])
+            )
+        self.assertEqual(
+            [counts[key] for key in ('total', 'interested', 'completed', 'cancelled', 'pending')], [3, 2, 1, 0, 2]
+        )
+
+    def test_cached_until_an_order_changes(self):
+        compute = mock.Mock(side_effect=lambda: status_counts(Order.objects.filter(buyer=self.buyer)))
+        self.assertEqual(cached_user_counts(self.buyer, 'orders', compute)['total'], 3)
+        self.assertEqual(cached_user_counts(self.buyer, 'orders', compute)['total'], 3)
+        self.assertEqual(compute.call_count, 1)
+        self.orders[0].delete()
+        self.assertEqual(cached_user_counts(self.buyer, 'orders', compute)['total'], 2)
+        # Other users keep their cached counts
+        self.assertEqual(cached_user_counts(self.seller, 'orders', lambda: 'cached'), 'cached')
+
+
+class AnalyticsRollupTests(MarketTestCase):
+    def setUp(self):
+        super().setUp()
+        self.seller = make_user('mkulima', role='seller')
+        self.buyer = make_user('mnunuzi_mkubwa')
+        self.product = make_product(self.seller, 'Mahindi')
+        self.today = timezone.localdate()
+
+    def order(self, status='interested'):
+        return Order.objects.create(
+            buyer=self.buyer, seller=self.seller, product=self.product, status=status,
+            agreed_price=Decimal('250.00'), quantity=2,
+        )
+
+    def assertRollup(self, **expected):
+        row = Analytics.objects.get(seller=self.seller, date=self.today)
+        self.assertEqual({field: getattr(row, field) for field in expected}, expected)
+
+    def test_rollup_and_rerun(self):
+        self.order('completed')
+        self.order()
+        Product.objects.filter(pk=self.product.pk).update(views=7)
+        self.assertEqual(rollup_analytics(until=self.today), (self.today, self.today, 1))
+        expected = {
+            'products_sold': 1, 'total_revenue': Decimal('500.00'), 'products_viewed': 7,
+            'conversion_rate': Decimal('50.00'),
+        }
+        self.assertRollup(**expected)
+        # Nothing left after the watermark, and re-running a range rewrites the same rows
+        self.assertEqual(rollup_analytics(until=self.today)[2], 0)
+        rollup_analytics(since=self.today, until=self.today)
+        self.assertRollup(**expected)
+
+    def test_resaved_sale_counts_on_its_completion_day_only(self):
+        order = self.order('completed')
+        completed = order.completed_at - timedelta(days=2)
+        Order.objects.filter(pk=order.pk).update(completed_at=completed, updated_at=completed)
+        order.refresh_from_db()
+        order.notes = 'Delivered'
+        order.save()
+        order.refresh_from_db()
+        self.assertEqual(order.completed_at, completed)
+        rollup_analytics(since=self.today - timedelta(days=2), until=self.today)
+        sold = dict(Analytics.objects.filter(seller=self.seller).values_list('date', 'products_sold'))
+        self.assertEqual(sold[timezone.localdate(completed)], 1)
+        self.assertEqual(sum(sold.values()), 1)
+
+    def test_seller_analytics_series(self):
+        yesterday = self.today - timedelta(days=1)
+        Analytics.objects.create(seller=self.seller, date=yesterday, products_sold=2, total_revenue=Decimal('300'))
+        Analytics.objects.create(seller=self.seller, date=yesterday - timedelta(days=10), products_sold=1)
+        self.client.force_login(self.seller)
+        response = self.client.get(reverse('seller_analytics'), {'days': '7'})
+        chart = response.context['chart_data']
+        self.assertEqual(len(chart['labels']), 7)
+        self.assertEqual(chart['sales'], [0, 0, 0, 0, 0, 0, 2])
+        self.assertEqual(chart['revenue'][-1], 300.0)
+        self.assertEqual((response.context['period']['sales'], response.context['total_sales']), (2, 3))
+
+
+class NotificationPollTests(MarketTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user('otieno')
+        self.client.force_login(self.user)
+
+    def poll(self, **headers):
+        return self.client.get(reverse('poll_notifications'), {'wait': '25'}, headers=headers)
+
+    @override_settings(MARKET_REALTIME={'PUSH': True})
+    def test_wsgi_poll_answers_immediately(self):
+        etag = self.poll()['ETag']
+        started = time.monotonic()
+        response = self.poll(if_none_match=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_poll_sees_changes(self):
+        etag = self.poll()['ETag']
+        bump_notification_version(self.user.pk)
+        response = self.poll(if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_poll_without_push_tells_client_when_to_retry(self):
+        response = self.poll()
+        self.assertEqual(response['Retry-After'], '30')
+        with self.settings(MARKET_REALTIME={'POLL_RETRY': 60}):
+            response = self.poll(if_none_match=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['Retry-After'], '60')
+
+    def test_wsgi_stream_falls_back_to_polling(self):
+        response = self.client.get(reverse('notification_stream'))
+        self.assertIn(b'event: fallback', b''.join(response.streaming_content))
+
+    @override_settings(MARKET_REALTIME={'PUSH': True})
+    def test_push_with_process_local_cache_warns(self):
+        self.assertEqual([warning.id for warning in check_push_cache(None)], ['marketApp.W001'])
+        with self.settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': '/tmp/market-cache',
+        }}):
+            self.assertEqual(check_push_cache(None), [])
+
+
+class UnreadNotificationCounterTests(MarketTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user('akinyi')
+        self.notifications = [
+            Notification.objects.create(user=self.user, notification_type='system', title=f'Notice {i}', message='-')
+            for i in range(3)
+        ]
+
+    def assertUnread(self, count):
+        self.assertEqual(Profile.get_unread_notifications(self.user.pk), count)
+        self.assertEqual(Notification.objects.filter(user=self.user, is_read=False).count(), count)
+
+    def test_create_counts_only_unread(self):
+        Notification.objects.create(user=self.user, notification_type='system', title='Read', message='-', is_read=True)
+        self.assertUnread(3)
+
+    def test_mark_as_read_once(self):
+        notification = self.notifications[0]
+        self.assertTrue(notification.mark_as_read())
+        self.assertFalse(Notification.objects.get(pk=notification.pk).mark_as_read())
+        self.assertUnread(2)
+
+    def test_queryset_mark_read(self):
+        self.notifications[0].mark_as_read()
+        self.assertEqual(Notification.objects.filter(user=self.user).mark_read(), 2)
+        self.assertUnread(0)
+
+    def test_delete_read_and_unread(self):
+        self.notifications[0].mark_as_read()
+        self.notifications[0].delete()
+        self.notifications[1].delete()
+        self.assertUnread(1)
+        Notification.objects.filter(user=self.user).delete()
+        self.assertUnread(0)
+
+    def test_views_read_the_profile_loaded_with_the_user(self):
+        self.client.force_login(self.user)
+        for name, key in (('api_notifications_count', 'count'), ('check_notifications', 'unread_count')):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse(name))
+            self.assertEqual(response.json()[key], 3)
+            self.assertFalse([q for q in queries if q['sql'].startswith('SELECT "marketApp_profile"')])
+
+
+class CursorPaginatorTests(MarketTestCase):
+    def setUp(self):
+        super().setUp()
+        seller = make_user('duka', role='seller')
+        # Equal prices make the pk tie-breaker matter
+        self.products = [
+            make_product(seller, f'Item {i}', price=Decimal(100 + i // 2)) for i in range(7)
+        ]
+
+    def test_pages_forwards_and_back_without_gaps(self):
+        paginator = CursorPaginator(Product.objects.order_by('price'), 3)
+        first = paginator.get_page()
+        second = paginator.get_page(first.next_cursor)
+        third = paginator.get_page(second.next_cursor)
+        self.assertEqual(list(first) + list(second) + list(third), self.products)
+        self.assertFalse(third.has_next())
+        self.assertEqual(list(paginator.get_page(second.previous_cursor)), list(first))
+        self.assertFalse(first.has_previous())
+
+    def test_invalid_cursor_gives_first_page(self):
+        paginator = CursorPaginator(Product.objects.order_by('-price'), 3)
+        self.assertEqual(list(paginator.get_page('not-a-cursor')), list(paginator.get_page()))
+
+    def test_estimated_count(self):
+        self.assertEqual(CursorPaginator(Product.objects.order_by('pk'), 3).estimated_count, 7)
+        self.assertEqual(CursorPaginator(Product.objects.none().order_by('pk'), 3).estimated_count, 0)
+
+
+class CategoryTreeTests(MarketTestCase):
+    def setUp(self):
+        super().setUp()
+        self.seller = make_user('fundi_mbao', role='seller')
+        self.furniture = Category.objects.create(name='Furniture')
+        self.chairs = Category.objects.create(name='Chairs', parent=self.furniture)
+        make_product(self.seller, 'Kiti', category=self.chairs)
+        make_product(self.seller, 'Meza', category=self.furniture, status='sold')
+
+    def test_counts_roll_up_to_parents(self):
+        with self.assertNumQueries(1):
+            tree = get_category_tree()
+        furniture, chairs = tree.get(self.furniture.pk), tree.get(self.chairs.pk)
+        self.assertEqual((furniture.total_products, furniture.active_products), (2, 1))
+        self.assertEqual((chairs.depth, chairs.total_products), (1, 1))
+        self.assertEqual(tree.choices(), [(self.furniture.pk, 'Furniture'), (self.chairs.pk, '— Chairs')])
+
+    def test_cached_until_a_product_changes(self):
+        get_category_tree()
+        with self.assertNumQueries(0):
+            get_category_tree()
+        make_product(self.seller, 'Kabati', category=self.chairs)
+        self.assertEqual(get_category_tree().get(self.furniture.pk).total_products, 3)
+
+
+class ProfileBackendTests(MarketTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user('kamau')
+
+    def test_user_and_profile_in_one_query(self):
+        with self.assertNumQueries(1):
+            user = ProfileBackend().get_user(self.user.pk)
+            self.assertEqual(user.profile.role, 'buyer')
+
+    def test_model_backend_sessions_move_over(self):
+        self.client.force_login(self.user, backend='django.contrib.auth.backends.ModelBackend')
+        self.assertEqual(self.client.get(reverse('shop')).status_code, 200)
+        self.assertEqual(self.client.session[BACKEND_SESSION_KEY], 'marketApp.backends.ProfileBackend')
+
+
+class QueryPlanTests(MarketTestCase):
+    def test_hot_queries_use_indexes(self):
+        seller = make_user('mchuuzi', role='seller')
+        buyer = make_user('mteja_mkuu')
+        product = make_product(seller, 'Taa')
+        Order.objects.create(buyer=buyer, seller=seller, product=product)
+        out = io.StringIO()
+        call_command('explain_hot_queries', urls=['shop', 'my_orders', 'seller_orders', 'seller_products'],
+                     stdout=out)
+        self.assertRegex(out.getvalue(), r'Explained [1-9]\d* distinct queries: 0 with full table scans')
+
+
+class SQLitePragmaTests(MarketTestCase):
+    def test_connections_are_tuned(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+
+    def journal_mode(self, **settings):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        raw = sqlite3.connect(os.path.join(directory, 'market.sqlite3'))
+        self.addCleanup(raw.close)
+        with self.settings(MARKET_SQLITE_PRAGMAS=settings):
+            apply_pragmas(raw)
+        return raw.execute('PRAGMA journal_mode').fetchone()[0], sorted(os.listdir(directory))
+
+    def test_file_database_keeps_its_journal_by_default(self):
+        self.assertEqual(self.journal_mode(), ('delete', ['market.sqlite3']))
+
+    def test_wal_is_opt_in(self):
+        self.assertEqual(self.journal_mode(JOURNAL_MODE='WAL')[0], 'wal')
+
+    def test_none_keeps_the_sqlite_default(self):
+        statements = pragma_statements({
+            'JOURNAL_MODE': None, 'BUSY_TIMEOUT': 100, 'SYNCHRONOUS': None, 'MMAP_SIZE': None,
+            'CACHE_SIZE': None, 'TEMP_STORE': None,
+        })
+        self.assertEqual(statements, ['PRAGMA busy_timeout = 100'])
+
+
+# The router is checked outside a test transaction, inside one it always picks the primary
+@mock.patch('marketApp.routers.get_replicas', return_value=['replica'])
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.session = SessionStore()
+        self.session.create()
+
+    def read_db(self, method='GET', write=False, session=None):
+        """The database a marketApp read picks during one request"""
+        router = ReplicaRouter()
+        picked = []
+
+        def view(request):
+            if write:
+                router.db_for_write(Product)
+            picked.append(router.db_for_read(Product))
+            return HttpResponse()
+
+        request = RequestFactory().generic(method, '/')
+        request.session = session or self.session
+        ReplicaMiddleware(view)(request)
+        return picked[0]
+
+    def test_reads_go_to_a_replica(self, get_replicas):
+        self.assertEqual(self.read_db(), 'replica')
+        self.assertEqual(ReplicaRouter().db_for_read(User), 'default')
+        # Outside a request (commands, workers) reads stay on the primary
+        self.assertEqual(ReplicaRouter().db_for_read(Product), 'default')
+
+    def test_session_sticks_to_the_primary_after_a_write(self, get_replicas):
+        self.assertEqual(self.read_db(write=True), 'default')
+        self.assertEqual(self.read_db(), 'default')
+        other = SessionStore()
+        other.create()
+        self.assertEqual(self.read_db(session=other), 'replica')
+        # Once the window has passed reads go back to the replicas
+        self.session['_replica_pinned_until'] = time.time() - 1
+        self.assertEqual(self.read_db(), 'replica')
+
+    def test_unsafe_methods_pin_the_request(self, get_replicas):
+        self.assertEqual(self.read_db(method='POST'), 'default')
+        self.assertEqual(self.read_db(), 'default')
+
+
+class PageCacheTests(MarketTestCase):
+    def setUp(self):
+        super().setUp()
+        self.seller = make_user('mpishi', role='seller')
+        make_product(self.seller, 'Sufuria')
+
+    def test_page_data_is_cached_per_tag_version(self):
+        compute = mock.Mock(side_effect=lambda: list(Product.objects.values_list('title', flat=True)))
+        self.assertEqual(cached_page_data('test', ['products'], compute, page=1), ['Sufuria'])
+        cached_page_data('test', ['products'], compute, page=1)
+        self.assertEqual(compute.call_count, 1)
+        cached_page_data('test', ['products'], compute, page=2)
+        self.assertEqual(compute.call_count, 2)
+        invalidate_tags('products')
+        cached_page_data('test', ['products'], compute, page=1)
+        self.assertEqual(compute.call_count, 3)
+
+    def test_anonymous_home_is_cached_until_products_change(self):
+        self.client.get(reverse('home'))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(reverse('home')).status_code, 200)
+        make_product(self.seller, 'Birika')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('home'))
+        self.assertTrue(queries)
+
+    def test_logged_in_pages_are_not_cached(self):
+        self.client.force_login(self.seller)
+        self.client.get(reverse('home'))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('home'))
+        self.assertTrue(queries)
+
+
+# Views are written inline, the flush thread can't use the test database
+@override_settings(MARKET_VIEW_COUNTER={'ENABLED': False})
+class ConditionalGetTests(MarketTestCase):
+    def setUp(self):
+        super().setUp()
+        self.seller = make_user('fundi', role='seller')
+        self.product = make_product(self.seller, 'Jiko')
+        self.client.force_login(make_user('njeri'))
+
+    def revalidate(self, url):
+        etag = self.client.get(url)['ETag']
+        return etag, self.client.get(url, headers={'if_none_match': etag})
+
+    def test_shop_304_without_counting_the_listing(self):
+        etag = self.client.get(reverse('shop'))['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('shop'), headers={'if_none_match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse([q['sql'] for q in queries if q['sql'].startswith(('SELECT COUNT(', 'SELECT MAX('))])
+
+    def test_shop_changes_with_products(self):
+        etag, _ = self.revalidate(reverse('shop'))
+        make_product(self.seller, 'Sufuria')
+        response = self.client.get(reverse('shop'), headers={'if_none_match': etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_shop_changes_when_a_product_leaves_the_page(self):
+        etag, _ = self.revalidate(reverse('shop'))
+        self.product.status = 'sold'
+        self.product.save()
+        response = self.client.get(reverse('shop'), headers={'if_none_match': etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_product_detail_304(self):
+        url = reverse('product_detail', args=[self.product.pk])
+        etag, response = self.revalidate(url)
+        self.assertEqual(response.status_code, 304)
+        # The revisit still counts as a view
+        self.assertEqual(Product.objects.get(pk=self.product.pk).views, 2)
+        self.product.price = Decimal('900.00')
+        self.product.save()
+        self.assertEqual(self.client.get(url, headers={'if_none_match': etag}).status_code, 200)
+
+
+class ProductImportTests(MarketTestCase):
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media_root, MARKET_IMAGE_VARIANTS={'ASYNC': False})
+        media.enable()
+        self.addCleanup(media.disable)
+        self.seller = make_user('muuzaji', role='seller')
+        self.category = Category.objects.create(name='Electronics')
+
+    def csv_upload(self, *lines):
+        header = 'title,description,price,category,condition,location,quantity,images'
+        return SimpleUploadedFile('products.csv', '\n'.join((header,) + lines).encode())
+
+    def zip_upload(self, *names):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as archive:
+            for name in names:
+                archive.writestr(name, png_bytes())
+        return SimpleUploadedFile('images.zip', buffer.getvalue())
+
+    def archives(self):
+        directory = os.path.join(self.media_root, 'imports')
+        return os.listdir(directory) if os.path.isdir(directory) else []
+
+    def test_rows_are_validated(self):
+        upload = self.csv_upload(
+            'Radio,Works,1500,Electronics,good,Nakuru,1,',
+            'Kettle,Works,cheap,Electronics,good,Nakuru,1,',
+            'Sofa,Works,9000,Furniture,good,Nakuru,1,',
+            'Lamp,Works,800,Electronics,good,Nakuru,1,lamp.jpg',
+        )
+        result = ProductImporter(self.seller).run(read_rows(upload, 'csv'))
+        self.assertEqual(result.created, 1)
+        self.assertEqual([error['line'] for error in result.errors], [3, 4, 5])
+        self.assertTrue(any(message.startswith('price:') for message in result.errors[0]['messages']))
+        self.assertIn('lamp.jpg', result.errors[2]['messages'][0])
+        self.assertEqual(list(Product.objects.values_list('title', 'seller_name')), [('Radio', 'muuzaji')])
+
+    def test_jsonl_bad_lines(self):
+        upload = SimpleUploadedFile('products.jsonl', b'not json\n[1]\n')
+        result = ProductImporter(self.seller).run(read_rows(upload, 'jsonl'))
+        self.assertEqual(result.created, 0)
+        self.assertEqual([error['line'] for error in result.errors], [1, 2])
+
+    @override_settings(MARKET_PRODUCT_IMPORT={'ASYNC': True})
+    def test_queued_images_and_zip_are_kept_until_drained(self):
+        upload = self.csv_upload('Radio,Works,1500,Electronics,good,Nakuru,1,front.png|back.png')
+        with mock.patch.object(ImageAttacher, '_ensure_worker'):
+            ProductImporter(self.seller, self.zip_upload('front.png', 'back.png')).run(read_rows(upload, 'csv'))
+            self.assertEqual(len(self.archives()), 1)
+            self.assertEqual(image_attacher.drain(), 2)
+        product = Product.objects.get()
+        self.assertEqual(product.images.count(), 2)
+        self.assertTrue(product.images.get(is_primary=True).image.name.startswith('product_images/front'))
+        self.assertEqual(self.archives(), [])
+
+    def serve(self, status, headers=()):
+        """A local HTTP server answering every GET with `status`, returns its port and the requests it got"""
+        requests = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                requests.append((self.path, self.headers['Host']))
+                body = png_bytes() if status == 200 else b''
+                self.send_response(status)
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = HTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server.server_port, requests
+
+    def test_download_connects_to_the_checked_address(self):
+        port, requests = self.serve(200)
+        # The name doesn't resolve, only the pinned address can be reached
+        with mock.patch('marketApp.imports.public_address', return_value='127.0.0.1'):
+            data, name = read_image(f'http://images.example.test:{port}/radio.png?v=2', None, get_import_config())
+        self.assertEqual((data, name), (png_bytes(), 'radio.png'))
+        self.assertEqual(requests, [('/radio.png?v=2', f'images.example.test:{port}')])
+
+    def test_redirects_are_not_followed(self):
+        port, requests = self.serve(302, [('Location', '/internal.png')])
+        with mock.patch('marketApp.imports.public_address', return_value='127.0.0.1'):
+            with self.assertRaisesMessage(ValueError, 'answered 302'):
+                read_image(f'http://images.example.test:{port}/radio.png', None, get_import_config())
+        self.assertEqual(len(requests), 1)
+
+    def test_private_addresses_are_refused(self):
+        addresses = [(2, 1, 6, '', ('93.184.216.34', 0)), (2, 1, 6, '', ('10.0.0.5', 0))]
+        with mock.patch('marketApp.imports.socket.getaddrinfo', return_value=addresses) as getaddrinfo:
+            with self.assertRaisesMessage(ValueError, 'is not a public address'):
+                read_image('http://images.example.test/radio.png', None, get_import_config())
+        getaddrinfo.assert_called_once()
+
+    def test_remove_stale_archives(self):
+        directory = os.path.join(self.media_root, 'imports')
+        os.makedirs(directory)
+        for name, age_hours in (('old.zip', 30), ('fresh.zip', 1)):
+            path = os.path.join(directory, name)
+            open(path, 'wb').close()
+            stamp = time.time() - age_hours * 3600
+            os.utime(path, (stamp, stamp))
+        self.assertEqual(remove_stale_archives(24), 1)
+        self.assertEqual(self.archives(), ['fresh.zip'])
+
+
+class OrderExportTests(MarketTestCase):
+    def setUp(self):
+        super().setUp()
+        self.seller = make_user('msambazaji', role='seller')
+        self.order = Order.objects.create(
+            buyer=make_user('mteja_wa_kwanza'), seller=self.seller, product=make_product(self.seller, 'Godoro'),
+            quantity=2, agreed_price=Decimal('4500.00'),
+        )
+        self.client.force_login(self.seller)
+
+    def export(self, **params):
+        response = self.client.get(reverse('export_seller_orders'), params)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_csv(self):
+        response, content = self.export()
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('attachment; filename="orders-', response['Content-Disposition'])
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual([(row['order_number'], row['buyer'], row['total_price']) for row in rows],
+                         [(self.order.order_number, 'mteja_wa_kwanza', '9000.00')])
+
+    def test_jsonl_with_filters(self):
+        response, content = self.export(format='jsonl', status='interested')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        record = json.loads(content)
+        self.assertEqual((record['product'], record['agreed_price']), ('Godoro', '4500.00'))
+        self.assertEqual(self.export(format='jsonl', status='completed')[1], '')
+
+    def test_other_sellers_orders_are_left_out(self):
+        self.client.force_login(make_user('mshindani', role='seller'))
+        self.assertEqual(self.export()[1].splitlines()[1:], [])
+
+    def test_unknown_format(self):
+        self.assertEqual(self.client.get(reverse('export_seller_orders'), {'format': 'xml'}).status_code, 400)
+
+
+# load_test requests product pages, their views are written inline
+@override_settings(MARKET_VIEW_COUNTER={'ENABLED': False})
+class LoadTestCommandTests(MarketTestCase):
+    def test_generate_then_load_test(self):
+        out = io.StringIO()
+        call_command(
+            'generate_market_data', users=20, categories=6, products=30, max_images=1, orders=40, reviews=5,
+            wishlist=10, notifications=20, conversations=4, messages=2, days=10, stdout=out,
+        )
+        self.assertEqual(Product.objects.filter(seller__username__startswith='load').count(), 30)
+        self.assertEqual(Order.objects.count(), 40)
+        self.assertEqual(Category.objects.filter(name__startswith='load').count(), 6)
+
+        call_command('load_test', requests=2, warmup=0, scenarios=['home', 'shop', 'product detail'], stdout=out)
+        lines = out.getvalue().splitlines()
+        for scenario in ('home', 'shop', 'product detail'):
+            self.assertTrue(any(line.startswith(scenario) and line.endswith('200x2') for line in lines), scenario)
+
+
+@override_settings(MARKET_REQUEST_METRICS={'ENABLED': True})
+class RequestMetricsTests(MarketTestCase):
+    def test_server_timing_header(self):
+        self.client.force_login(make_user('mpimaji'))
+        response = self.client.get(reverse('shop'))
+        self.assertRegex(
+            response['Server-Timing'],
+            r'^sql;dur=\d+\.\d;desc="\d+ queries", tpl;dur=\d+\.\d;desc="templates", '
+            r'app;dur=\d+\.\d;desc="python", total;dur=\d+\.\d$'
+        )
+        queries = int(response['Server-Timing'].split('desc="')[1].split(' ')[0])
+        self.assertGreater(queries, 0)
+        self.assertGreaterEqual(get_histograms().snapshot()['shop']['requests'], 1)
+
+    def test_disabled_by_default(self):
+        with self.settings(MARKET_REQUEST_METRICS={}):
+            response = self.client.get(reverse('home'))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+
+class ProductCardTests(MarketTestCase):
+    def setUp(self):
+        super().setUp()
+        self.seller = make_user('kibanda', role='seller')
+        self.buyer = make_user('mnunuzi')
+        self.product = make_product(self.seller, 'Mkeka')
+
+    def cached_card(self):
+        return cached_page_data('test-cards', ['products'], lambda: Product.objects.values(
+            'seller_name', 'seller_rating', 'wishlist_count', 'interest_count'
+        ).get(pk=self.product.pk))
+
+    def assertCardRefreshed(self, change, **expected):
+        self.cached_card()
+        versions = tag_state('products')[0]
+        change()
+        self.assertNotEqual(tag_state('products')[0], versions)
+        card = self.cached_card()
+        for field, value in expected.items():
+            self.assertEqual(card[field], value)
+
+    def test_seller_snapshot_on_create(self):
+        self.assertEqual(self.product.seller_name, 'kibanda')
+
+    def test_wishlist_count(self):
+        self.assertCardRefreshed(lambda: Wishlist.objects.create(user=self.buyer, product=self.product), wishlist_count=1)
+        self.assertCardRefreshed(lambda: Wishlist.objects.all().delete(), wishlist_count=0)
+
+    def test_interest_count(self):
+        self.assertCardRefreshed(
+            lambda: Order.objects.create(buyer=self.buyer, seller=self.seller, product=self.product), interest_count=1
+        )
+
+    def test_seller_name(self):
+        def rename():
+            self.seller.username = 'kibanda_bora'
+            self.seller.save()
+        self.assertCardRefreshed(rename, seller_name='kibanda_bora')
+
+    def test_seller_rating(self):
+        def rate():
+            profile = self.seller.profile
+            profile.rating = Decimal('4.50')
+            profile.save()
+        self.assertCardRefreshed(rate, seller_rating=Decimal('4.50'))
+
+
+class RatingHistogramTests(MarketTestCase):
+    def setUp(self):
+        super().setUp()
+        self.seller = make_user('fundi_viatu', role='seller')
+        self.product = make_product(self.seller, 'Viatu')
+
+    def review(self, rating, seller=None):
+        return Review.objects.create(
+            reviewer=make_user(f'reviewer{Review.objects.count()}'), seller=seller or self.seller,
+            product=self.product, rating=rating, comment='-'
+        )
+
+    def assertRatings(self, histogram, rating, seller=None):
+        seller = seller or self.seller
+        profile = Profile.objects.get(user=seller)
+        self.assertEqual([profile.ratings_1, profile.ratings_2, profile.ratings_3, profile.ratings_4, profile.ratings_5],
+                         histogram)
+        self.assertEqual(profile.total_ratings, sum(histogram))
+        self.assertEqual(profile.rating, Decimal(rating))
+        self.assertEqual(Product.objects.filter(seller=seller).values_list('seller_rating', flat=True).first(),
+                         Decimal(rating))
+
+    def test_new_reviews(self):
+        self.review(5)
+        self.review(4)
+        self.review(4)
+        self.assertRatings([0, 0, 0, 2, 1], '4.33')
+
+    def test_update_moves_the_stars(self):
+        review = self.review(5)
+        self.review(3)
+        review.rating = 1
+        review.save()
+        self.assertRatings([1, 0, 1, 0, 0], '2.00')
+
+    def test_saving_without_a_rating_change(self):
+        review = self.review(4)
+        review.mark_helpful()
+        self.assertRatings([0, 0, 0, 1, 0], '4.00')
+
+    def test_moving_a_review_to_another_seller(self):
+        other = make_user('fundi_nguo', role='seller')
+        make_product(other, 'Shati')
+        review = self.review(2)
+        review.seller = other
+        review.save()
+        self.assertRatings([0, 0, 0, 0, 0], '0.00')
+        self.assertRatings([0, 1, 0, 0, 0], '2.00', seller=other)
+
+    def test_delete(self):
+        self.review(5)
+        self.review(2).delete()
+        self.assertRatings([0, 0, 0, 0, 1], '5.00')
+        Review.objects.all().delete()
+        self.assertRatings([0, 0, 0, 0, 0], '0.00')
+
+    def test_distribution(self):
+        for rating in (5, 5, 5, 1):
+            self.review(rating)
+        distribution = Profile.objects.get(user=self.seller).rating_distribution()
+        self.assertEqual([(row['stars'], row['count'], row['percent']) for row in distribution],
+                         [(5, 3, 75), (4, 0, 0), (3, 0, 0), (2, 0, 0), (1, 1, 25)])
+
+
+@override_settings(MARKET_NOTIFICATIONS={'ASYNC': False, 'CHUNK_SIZE': 2})
+class NotificationFanOutTests(MarketTestCase):
+    def setUp(self):
+        super().setUp()
+        self.users = [make_user(f'mteja{i}') for i in range(5)]
+        self.user_ids = [user.pk for user in self.users]
+
+    def unread(self):
+        return [Profile.get_unread_notifications(user_id) for user_id in self.user_ids]
+
+    def test_fan_out_in_chunks(self):
+        self.assertEqual(deliver(self.user_ids + self.user_ids[:2], 'system', 'Hi', 'Karibu'), (5, 0))
+        self.assertEqual(Notification.objects.count(), 5)
+        self.assertEqual(self.unread(), [1] * 5)
+
+    def test_notify_waits_for_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            notify(self.user_ids, 'system', 'Hi', 'Karibu')
+            self.assertEqual(Notification.objects.count(), 0)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(Notification.objects.count(), 5)
+
+    def test_unread_duplicates_are_refreshed(self):
+        deliver(self.user_ids, 'order_update', 'Order updated', 'Confirmed', related_object_id=7,
+                related_content_type='order')
+        Notification.objects.filter(user_id=self.user_ids[0]).mark_read()
+        created, coalesced = deliver(self.user_ids, 'order_update', 'Order updated', 'Completed',
+                                     related_object_id=7, related_content_type='order')
+        self.assertEqual((created, coalesced), (1, 4))
+        self.assertEqual(self.unread(), [1] * 5)
+        self.assertEqual(
+            Notification.objects.filter(is_read=False, message='Completed').count(), 5
+        )
+
+    def test_different_objects_are_not_coalesced(self):
+        deliver(self.user_ids[:1], 'order_update', 'Order updated', 'Confirmed', related_object_id=7)
+        self.assertEqual(deliver(self.user_ids[:1], 'order_update', 'Order updated', 'Confirmed',
+                                 related_object_id=8), (1, 0))
+
+    def test_duplicates_within_a_batch_collapse(self):
+        notifications = [
+            Notification(user_id=self.user_ids[0], notification_type='system', title='Hi', message=str(i))
+            for i in range(3)
+        ]
+        self.assertEqual(write_notifications(notifications), (1, 0))
+        self.assertEqual(Notification.objects.get().message, '2')
+
+    @override_settings(MARKET_NOTIFICATIONS={'COALESCE_SECONDS': 0})
+    def test_coalescing_off(self):
+        deliver(self.user_ids, 'system', 'Hi', 'Karibu')
+        self.assertEqual(deliver(self.user_ids, 'system', 'Hi', 'Karibu'), (5, 0))
+        self.assertEqual(self.unread(), [2] * 5)
+
+
+@override_settings(MARKET_WISHLIST_ALERTS={'ASYNC': False, 'MAX_PER_USER': 2},
+                   MARKET_NOTIFICATIONS={'ASYNC': False})
+class WishlistAlertTests(MarketTestCase):
+    def setUp(self):
+        super().setUp()
+        seller = make_user('soko', role='seller')
+        self.products = [make_product(seller, f'Bidhaa {i}') for i in range(3)]
+        self.buyers = [make_user(f'mpenzi{i}') for i in range(2)]
+        for buyer in self.buyers:
+            for product in self.products:
+                Wishlist.objects.create(user=buyer, product=product)
+
+    def change(self, product, **values):
+        with self.captureOnCommitCallbacks(execute=True):
+            for field, value in values.items():
+                setattr(product, field, value)
+            product.save()
+
+    def alerts(self, buyer=None):
+        return list(Notification.objects.filter(
+            user=buyer or self.buyers[0], notification_type__in=['price_drop', 'wishlist_available']
+        ).values_list('notification_type', 'related_object_id', 'message'))
+
+    def test_price_drop(self):
+        self.change(self.products[0], price=Decimal('900.00'))
+        self.assertEqual(self.alerts(), [
+            ('price_drop', self.products[0].pk, 'Bidhaa 0 dropped from Ksh 1000.00 to Ksh 900.00')
+        ])
+        self.assertEqual(len(self.alerts(self.buyers[1])), 1)
+
+    def test_price_rise_and_unwatched_fields_are_quiet(self):
+        self.change(self.products[0], price=Decimal('1100.00'))
+        self.change(self.products[0], description='Mpya')
+        self.assertEqual(self.alerts(), [])
+
+    def test_back_in_stock(self):
+        self.change(self.products[0], status='sold')
+        self.change(self.products[0], status='active')
+        self.assertEqual([alert[0] for alert in self.alerts()], ['wishlist_available'])
+
+    def test_second_drop_refreshes_the_unread_alert(self):
+        self.change(self.products[0], price=Decimal('900.00'))
+        self.change(self.products[0], price=Decimal('800.00'))
+        alerts = self.alerts()
+        self.assertEqual(len(alerts), 1)
+        self.assertIn('to Ksh 800.00', alerts[0][2])
+        self.assertEqual(Profile.get_unread_notifications(self.buyers[0].pk), 1)
+
+    def test_rate_limit_per_user(self):
+        for product in self.products:
+            self.change(product, price=Decimal('900.00'))
+        self.assertEqual(len(self.alerts()), 2)
+        self.assertEqual(len(self.alerts(self.buyers[1])), 2)
+
+    def test_match_totals(self):
+        previous = {'price': Decimal('1000.00'), 'status': 'active', 'quantity': 1}
+        alerts = []
+        for product in self.products:
+            product.price = Decimal('500.00')
+            alerts += product_alerts(previous, product)
+        self.assertEqual(match_alerts(alerts), {'notified': 4, 'coalesced': 0, 'rate_limited': 2})
+
+    @override_settings(MARKET_WISHLIST_ALERTS={'ASYNC': False, 'MIN_DROP_PERCENT': 20})
+    def test_small_drops_are_ignored(self):
+        self.change(self.products[0], price=Decimal('900.00'))
+        self.assertEqual(self.alerts(), [])
+
+
+class ConversationTests(MarketTestCase):
+    def setUp(self):
+        super().setUp()
+        self.buyer = make_user('baraka')
+        self.seller = make_user('zawadi', role='seller')
+
+    def unread(self, conversation, user):
+        return ConversationParticipant.objects.get(conversation=conversation, user=user).unread_count
+
+    def test_one_thread_per_pair(self):
+        conversation = Conversation.get_or_create_for(self.buyer, self.seller)
+        self.assertEqual(Conversation.get_or_create_for(self.seller, self.buyer), conversation)
+        self.assertEqual(conversation.participant_key, Conversation.pair_key(self.seller.pk, self.buyer.pk))
+        self.assertEqual(set(conversation.participants.all()), {self.buyer, self.seller})
+
+    def test_losing_the_creation_race_returns_the_winner(self):
+        winner = Conversation.get_or_create_for(self.seller, self.buyer)
+        # The lookup ran before the other request's insert committed
+        with mock.patch.object(Conversation.objects, 'filter', return_value=Conversation.objects.none()):
+            conversation = Conversation.get_or_create_for(self.buyer, self.seller)
+        self.assertEqual(conversation, winner)
+        self.assertEqual(Conversation.objects.count(), 1)
+        self.assertEqual(ConversationParticipant.objects.count(), 2)
+
+    def test_start_conversation_view(self):
+        self.client.force_login(self.buyer)
+        for _ in range(2):
+            response = self.client.get(reverse('start_conversation', args=[self.seller.pk]))
+        conversation = Conversation.objects.get()
+        self.assertRedirects(response, reverse('conversation_detail', args=[conversation.pk]),
+                             fetch_redirect_response=False)
+
+    def test_messages_keep_last_message_and_unread_counts(self):
+        conversation = Conversation.get_or_create_for(self.buyer, self.seller)
+        Message.objects.create(conversation=conversation, sender=self.buyer, content='Bado iko?')
+        last = Message.objects.create(conversation=conversation, sender=self.buyer, content='Bei gani?')
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.last_message, last)
+        self.assertEqual(conversation.updated_at, last.created_at)
+        self.assertEqual((self.unread(conversation, self.seller), self.unread(conversation, self.buyer)), (2, 0))
+
+        last.mark_as_read()
+        last.mark_as_read()
+        self.assertEqual(self.unread(conversation, self.seller), 1)
+
+        ConversationParticipant.mark_read(conversation.pk, self.seller.pk)
+        self.assertEqual(self.unread(conversation, self.seller), 0)
+        self.assertFalse(Message.objects.filter(is_read=False).exists())
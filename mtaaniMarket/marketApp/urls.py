@@ -32,9 +32,11 @@ urlpatterns = [
     path('seller/home/', views.seller_home, name='seller_home'),
     path('seller/products/', views.seller_products, name='seller_products'),
     path('seller/orders/', views.seller_orders, name='seller_orders'),
+    path('seller/orders/export/', views.export_seller_orders, name='export_seller_orders'),
     path('seller/reviews/', views.seller_reviews, name='seller_reviews'),
     path('seller/analytics/', views.seller_analytics, name='seller_analytics'),
     path('add-product/', views.add_product, name='add_product'),
+    path('seller/products/import/', views.bulk_import_products, name='bulk_import_products'),
     path('edit-product/<int:product_id>/', views.edit_product, name='edit_product'),
     path('delete-product/<int:product_id>/', views.delete_product, name='delete_product'),
     path('update-order-status/<int:order_id>/', views.update_order_status, name='update_order_status'),
@@ -50,6 +52,8 @@ urlpatterns = [
     path('notifications/delete/<int:notification_id>/', views.delete_notification, name='delete_notification'),
     path('notifications/clear/', views.clear_notifications, name='clear_notifications'),
     path('check-notifications/', views.check_notifications, name='check_notifications'),
+    path('notifications/stream/', views.notification_stream, name='notification_stream'),
+    path('notifications/poll/', views.poll_notifications, name='poll_notifications'),
     path('api/mark-notification-read/<int:notification_id>/', views.mark_notification_read, name='mark_notification_read'),
 
 # To this:
@@ -58,6 +62,10 @@ path('api/mark-notification-read/<int:notification_id>/', views.mark_as_read, na
     # Admin
     path('admin/dashboard/', views.admin_dashboard, name='admin_dashboard'),
     path('admin/reports/', views.admin_reports, name='admin_reports'),
+    path('admin/metrics/', views.admin_metrics, name='admin_metrics'),
+    path('admin/export/orders/', views.admin_export, {'dataset': 'orders'}, name='admin_export_orders'),
+    path('admin/export/whatsapp-contacts/', views.admin_export, {'dataset': 'whatsapp-contacts'},
+         name='admin_export_contacts'),
     path('admin/report/<int:report_id>/', views.admin_update_report, name='admin_update_report'),
     
     # Reports
@@ -0,0 +1,120 @@
+# marketApp/view_counter.py
+import atexit
+import logging
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    'FLUSH_INTERVAL': 10,     # seconds between background flushes
+    'FLUSH_THRESHOLD': 500,   # pending views that trigger an early flush
+}
+
+
+def get_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'MARKET_VIEW_COUNTER', {}))
+    return config
+
+
+class ViewCounter:
+    """
+    Write-behind product view counter.
+
+    record() only bumps an in-memory counter. A background worker thread
+    flushes the buffered increments every FLUSH_INTERVAL seconds, or sooner
+    once FLUSH_THRESHOLD views are pending, with one
+    UPDATE ... SET views = views + n per distinct n.
+    """
+
+    def __init__(self):
+        self._pending = Counter()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._worker = None
+
+    def record(self, product_id, count=1):
+        """Buffer `count` views for a product"""
+        config = get_config()
+        if not config['ENABLED']:
+            self._write({product_id: count})
+            return
+
+        with self._lock:
+            self._pending[product_id] += count
+            pending_total = sum(self._pending.values())
+        self._ensure_worker(config)
+        if pending_total >= config['FLUSH_THRESHOLD']:
+            self._wakeup.set()
+
+    def pending(self, product_id=None):
+        """Views recorded but not yet written to the database"""
+        with self._lock:
+            if product_id is None:
+                return sum(self._pending.values())
+            return self._pending.get(product_id, 0)
+
+    def flush(self):
+        """Write every buffered increment to the database, returns the number of views written"""
+        with self._lock:
+            batch, self._pending = self._pending, Counter()
+        if not batch:
+            return 0
+        try:
+            self._write(batch)
+        except Exception:
+            # Put the counts back so the next flush retries them
+            with self._lock:
+                self._pending.update(batch)
+            raise
+        return sum(batch.values())
+
+    def _write(self, batch):
+        from .models import Product
+
+        # Group products by increment so each distinct n costs one UPDATE
+        by_increment = defaultdict(list)
+        for product_id, count in batch.items():
+            by_increment[count].append(product_id)
+        for count, product_ids in by_increment.items():
+            Product.objects.filter(pk__in=product_ids).update(views=F('views') + count)
+
+    def _ensure_worker(self, config):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(
+                target=self._run, args=(config['FLUSH_INTERVAL'],),
+                name='view-counter-flush', daemon=True
+            )
+            self._worker.start()
+
+    def _run(self, interval):
+        while True:
+            self._wakeup.wait(interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Failed to flush product view counts')
+            finally:
+                close_old_connections()
+
+
+view_counter = ViewCounter()
+
+
+@atexit.register
+def _flush_on_exit():
+    try:
+        view_counter.flush()
+    except Exception:
+        logger.exception('Failed to flush product view counts on exit')
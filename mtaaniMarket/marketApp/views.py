@@ -1,27 +1,44 @@
 # views.py
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib.auth.models import User
 from django.contrib.auth import logout, authenticate, login
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Q, Count, Avg, Sum  # Added Sum
-from django.core.paginator import Paginator
-from django.http import JsonResponse, HttpResponseForbidden
+from django.db.models import Q
+from django.http import Http404, JsonResponse, HttpResponseBadRequest, HttpResponseForbidden, HttpResponseNotModified, StreamingHttpResponse
 from django.views.decorators.http import require_POST
 import json
 from urllib.parse import quote
 import re  # Added for WhatsApp number formatting
-from .decorators import role_required, buyer_required, seller_required, admin_required
+from .decorators import get_profile, role_required, buyer_required, seller_required, admin_required
+from .search import get_search_backend
+from .view_counter import view_counter
+from .pagination import CursorPaginator
+from .metrics import get_config as get_metrics_config, get_histograms
+from .notifications import notify
+from .exports import FORMATS as EXPORT_FORMATS, order_export, contact_export, export_response
+from .imports import ProductImporter, read_rows, IMAGES_COLUMN, IMAGE_SEPARATOR, get_config as get_import_config
+from .categories import get_category_tree, get_category_version
+from .conditional import make_etag, not_modified, product_validators, set_validators
+from .page_cache import cache_public_page, cached_page_data, tag_state
+from .counters import status_counts, cached_user_counts, invalidate_user_counts
+from .analytics import seller_time_series, seller_totals, get_watermark
+from .realtime import (
+    get_notification_version, aget_notification_version, bump_notification_version,
+    notification_etag, wait_for_change, unread_count, latest_notification_id,
+    event_stream, sse_event, push_enabled, get_config as get_realtime_config
+)
 
 from .forms import (
     SignupForm, ProductForm, ProfileForm, ReviewForm, 
     ExpressInterestForm, SearchForm, MessageForm, ReportForm,
-    OrderStatusForm, OrderFilterForm
+    OrderStatusForm, OrderFilterForm, ProductImportForm, BulkProductImportForm
 )
 from .models import (
     Profile, Product, ProductImage, Category, Order, 
     WhatsAppContact, Review, Wishlist, SearchHistory,
-    Notification, Conversation, Message, Report, Analytics
+    Notification, Conversation, ConversationParticipant, Message, Report, Analytics
 )
 
 # ==================== AUTHENTICATION VIEWS ====================
@@ -93,30 +110,29 @@ def logoutUser(request):
 
 # ==================== PUBLIC VIEWS ====================
 
+@cache_public_page('products', 'categories')
 def home(request):
-    # Featured products
-    featured_products = Product.objects.filter(
-        status='active', 
-        is_featured=True
-    ).order_by('-created_at')[:8]
-    
-    # New arrivals
-    new_products = Product.objects.filter(
-        status='active'
-    ).order_by('-created_at')[:8]
-    
-    # Popular categories
-    popular_categories = Category.objects.filter(
-        is_featured=True
-    )[:6]
-    
-    context = {
-        'featured_products': featured_products,
-        'new_products': new_products,
-        'popular_categories': popular_categories,
-    }
+    def compute():
+        return {
+            # Featured products
+            'featured_products': list(Product.objects.for_cards().filter(
+                status='active', 
+                is_featured=True
+            ).order_by('-created_at')[:8]),
+            # New arrivals
+            'new_products': list(Product.objects.for_cards().filter(
+                status='active'
+            ).order_by('-created_at')[:8]),
+            # Popular categories
+            'popular_categories': list(Category.objects.filter(
+                is_featured=True
+            )[:6]),
+        }
+    
+    context = cached_page_data('home', ['products', 'categories'], compute)
     return render(request, 'marketApp/home.html', context)
 
+@cache_public_page()
 def about(request):
     context = {}
     return render(request, 'marketApp/about.html', context)
@@ -130,9 +146,11 @@ def shop(request):
     condition = request.GET.get('condition')
     location = request.GET.get('location')
     is_negotiable = request.GET.get('negotiable') == 'true'
-    sort_by = request.GET.get('sort', '-created_at')
+    # Searches default to best match, plain browsing to newest first
+    default_sort = 'relevance' if search_query else '-created_at'
+    sort_by = request.GET.get('sort') or default_sort
     
-    products = Product.objects.filter(status='active')
+    products = Product.objects.for_cards().filter(status='active')
     
     # Apply filters
     if category_id:
@@ -145,10 +163,8 @@ def shop(request):
         products = products.filter(price__lte=max_price)
     
     if search_query:
-        products = products.filter(
-            Q(title__icontains=search_query) |
-            Q(description__icontains=search_query) |
-            Q(brand__icontains=search_query)
+        products = get_search_backend().search(
+            products, search_query, rank=(sort_by == 'relevance')
         )
     
     if condition:
@@ -161,13 +177,16 @@ def shop(request):
         products = products.filter(is_negotiable=True)
     
     # Get sort parameter
-    if sort_by in ['price', '-price', '-created_at', '-views', 'title', '-title']:
+    if sort_by == 'relevance' and search_query:
+        products = products.order_by('search_rank', '-created_at')
+    elif sort_by in ['price', '-price', '-created_at', '-views', 'title', '-title']:
         products = products.order_by(sort_by)
+    else:
+        products = products.order_by('-created_at')
     
-    # Pagination
-    paginator = Paginator(products, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Keyset pagination on the active sort key
+    paginator = CursorPaginator(products, 12)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
     
     # Get user's wishlist product IDs
     user_wishlist_ids = []
@@ -180,11 +199,24 @@ def shop(request):
     # Check if any filter is active
     any_filter_active = any([
         search_query, category_id, min_price, max_price, 
-        condition, location, is_negotiable, sort_by != '-created_at'
+        condition, location, is_negotiable, sort_by != default_sort
     ])
     
     # Get categories for dropdown
-    categories = Category.objects.all()
+    categories = get_category_tree()
+    
+    # Validators from the page cache tags, which every product change bumps,
+    # and the rows already fetched for this page; no query over the whole set.
+    # The rows catch reorders (e.g. by views) that don't touch updated_at
+    versions, changed = tag_state('products', 'categories')
+    rows = [(p.pk, p.updated_at, p.views) for p in page_obj]
+    last_modified = max([changed] + [p.updated_at for p in page_obj])
+    etag = make_etag(
+        request.get_full_path(), versions, rows, request.user.pk, user_wishlist_ids, get_category_version()
+    )
+    response = not_modified(request, etag, last_modified)
+    if response:
+        return response
     
     context = {
         'page_obj': page_obj,
@@ -200,56 +232,72 @@ def shop(request):
         'any_filter_active': any_filter_active,
         'user_wishlist_ids': user_wishlist_ids,
     }
-    return render(request, 'marketApp/shop.html', context)
+    return set_validators(render(request, 'marketApp/shop.html', context), etag, last_modified)
 def product_detail(request, pk):
-    product = get_object_or_404(Product, pk=pk)
-    
-    # Increment view count
-    product.increment_views()
-    
-    # Get related products
-    related_products = Product.objects.filter(
-        category=product.category,
-        status='active'
-    ).exclude(pk=product.pk)[:4]
-    
-    # Get seller's other products
-    seller_products = Product.objects.filter(
-        seller=product.seller,
-        status='active'
-    ).exclude(pk=product.pk)[:4]
-    
-    # Get reviews for this product
-    reviews = Review.objects.filter(product=product)[:10]
+    validators = product_validators(pk)
+    if validators is None:
+        raise Http404('No Product matches the given query.')
+    fingerprint, last_modified = validators
     
     # Check if product is in user's wishlist
     in_wishlist = False
     if request.user.is_authenticated:
         in_wishlist = Wishlist.objects.filter(
             user=request.user,
-            product=product
+            product_id=pk
         ).exists()
     
-    context = {
-        'product': product,
-        'related_products': related_products,
-        'seller_products': seller_products,
-        'reviews': reviews,
-        'in_wishlist': in_wishlist,
-    }
-    return render(request, 'marketApp/product_detail.html', context)
+    etag = make_etag(fingerprint, request.user.pk, in_wishlist)
+    response = not_modified(request, etag, last_modified)
+    if response:
+        # A revisit still counts as a view
+        view_counter.record(pk)
+        return response
+    
+    # Not cache_public_page: the view count has to go up on every request
+    def compute():
+        product = get_object_or_404(
+            Product.objects.select_related('seller__profile', 'category').prefetch_related('images'),
+            pk=pk
+        )
+        return {
+            'product': product,
+            # Get related products
+            'related_products': list(Product.objects.for_cards().filter(
+                category=product.category,
+                status='active'
+            ).exclude(pk=product.pk)[:4]),
+            # Get seller's other products
+            'seller_products': list(Product.objects.for_cards().filter(
+                seller=product.seller,
+                status='active'
+            ).exclude(pk=product.pk)[:4]),
+            # Get reviews for this product
+            'reviews': list(Review.objects.filter(product=product).select_related('reviewer')[:10]),
+        }
+    
+    context = cached_page_data('product_detail', ['products', 'categories', f'reviews:{pk}'], compute, pk=pk)
+    product = context['product']
+    
+    # Increment view count
+    product.increment_views()
+    
+    context = dict(context, in_wishlist=in_wishlist)
+    return set_validators(render(request, 'marketApp/product_detail.html', context), etag, last_modified)
 
+@cache_public_page('products', 'categories')
 def category_products(request, category_id):
-    category = get_object_or_404(Category, pk=category_id)
-    products = Product.objects.filter(
-        category=category,
-        status='active'
-    ).order_by('-created_at')
-    
-    context = {
-        'category': category,
-        'products': products,
-    }
+    def compute():
+        category = get_object_or_404(Category, pk=category_id)
+        return {
+            'category': category,
+            'products': list(Product.objects.for_cards().filter(
+                category=category,
+                status='active'
+            ).order_by('-created_at')),
+        }
+    
+    context = cached_page_data('category_products', ['products', 'categories'], compute, category_id=category_id)
     return render(request, 'marketApp/category_products.html', context)
 
 # ==================== BUYER VIEWS ====================
@@ -258,28 +306,16 @@ def category_products(request, category_id):
 @role_required(allowed_roles=['buyer'])
 
 def buyer_home(request):
-    # Order statistics
     orders = Order.objects.filter(buyer=request.user)
-    total_orders = orders.count()
     
-    # Count orders by status
-    interested_orders = orders.filter(status='interested').count()
-    contacted_orders = orders.filter(status='contacted').count()
-    confirmed_orders = orders.filter(status='confirmed').count()
-    completed_orders = orders.filter(status='completed').count()
-    cancelled_orders = orders.filter(status='cancelled').count()
+    def compute_counts():
+        # Order counts by status in one query; pending is everything
+        # except completed and cancelled
+        counts = status_counts(orders, pending=~Q(status__in=['completed', 'cancelled']))
+        counts['wishlist'] = Wishlist.objects.filter(user=request.user).count()
+        return counts
     
-    # Pending orders (all statuses except completed and cancelled)
-    pending_orders = orders.exclude(status__in=['completed', 'cancelled']).count()
-    
-    # Wishlist count
-    wishlist_count = Wishlist.objects.filter(user=request.user).count()
-    
-    # Notification count
-    unread_notifications = Notification.objects.filter(
-        user=request.user,
-        is_read=False
-    ).count()
+    counts = cached_user_counts(request.user, 'buyer_home', compute_counts)
     
     # Unread messages count (if you have a Message model)
     unread_messages = 0  # Set to 0 for now or implement if you have messaging
@@ -290,12 +326,12 @@ def buyer_home(request):
     # ).count()
     
     # Recent orders (last 5)
-    recent_orders = orders.order_by('-created_at')[:5]
+    recent_orders = orders.for_list().order_by('-created_at')[:5]
     
     # Recent wishlist items (last 4)
     wishlist_items = Wishlist.objects.filter(
         user=request.user
-    ).order_by('-added_at')[:4]
+    ).select_related('product').order_by('-added_at')[:4]
     
     # Recent notifications (last 5)
     recent_notifications = Notification.objects.filter(
@@ -303,7 +339,7 @@ def buyer_home(request):
     ).order_by('-created_at')[:5]
     
     # Recommended products (you can implement your own logic here)
-    recommended_products = Product.objects.filter(
+    recommended_products = Product.objects.for_cards().filter(
         status='active'
     ).order_by('-views', '-created_at')[:6]
     
@@ -313,17 +349,17 @@ def buyer_home(request):
     
     context = {
         # Order counts
-        'total_orders': total_orders,
-        'pending_orders': pending_orders,
-        'interested_orders': interested_orders,
-        'contacted_orders': contacted_orders,  # Added this
-        'confirmed_orders': confirmed_orders,
-        'completed_orders': completed_orders,
-        'cancelled_orders': cancelled_orders,  # Added this
+        'total_orders': counts['total'],
+        'pending_orders': counts['pending'],
+        'interested_orders': counts['interested'],
+        'contacted_orders': counts['contacted'],
+        'confirmed_orders': counts['confirmed'],
+        'completed_orders': counts['completed'],
+        'cancelled_orders': counts['cancelled'],
         
         # Other counts
-        'wishlist_count': wishlist_count,
-        'unread_notifications': unread_notifications,
+        'wishlist_count': counts['wishlist'],
+        'unread_notifications': request.user.profile.unread_notifications,
         'unread_messages': unread_messages,
         
         # Recent items
@@ -355,9 +391,9 @@ def express_interest(request, product_id):
             status='interested'
         )
         
-        # Create notification for seller
-        Notification.objects.create(
-            user=product.seller,
+        # Notify the seller, written by the dispatcher after the response
+        notify(
+            [product.seller_id],
             notification_type='order',
             title='New Interest in Your Product',
             message=f"{request.user.username} is interested in your product: {product.title}",
@@ -411,11 +447,6 @@ def contact_via_whatsapp(request, product_id):
     encoded_message = quote(default_message)
     whatsapp_url = f"https://wa.me/{phone_number}?text={encoded_message}"
     
-    # Log for debugging
-    print(f"DEBUG: Original phone: {product.seller.profile.phone_number}")
-    print(f"DEBUG: Formatted for WhatsApp: {phone_number}")
-    print(f"DEBUG: WhatsApp URL: {whatsapp_url}")
-    
     return redirect(whatsapp_url)
 
 @login_required
@@ -426,7 +457,7 @@ def my_orders(request):
     search_query = request.GET.get('search', '')
     
     # Base queryset
-    orders = Order.objects.filter(buyer=request.user).order_by('-created_at')
+    orders = Order.objects.for_list().filter(buyer=request.user).order_by('-created_at')
     
     # Apply filters
     if status_filter:
@@ -435,35 +466,34 @@ def my_orders(request):
     if search_query:
         orders = orders.filter(
             Q(order_number__icontains=search_query) |
-            Q(product__title__icontains=search_query) |
-            Q(product__description__icontains=search_query) |
-            Q(seller__username__icontains=search_query)
+            Q(seller__username__icontains=search_query) |
+            Q(product__in=get_search_backend().matching_ids(search_query))
         )
     
     # Get counts for each status
-    total_count = Order.objects.filter(buyer=request.user).count()
-    interested_count = Order.objects.filter(buyer=request.user, status='interested').count()
-    contacted_count = Order.objects.filter(buyer=request.user, status='contacted').count()
-    confirmed_count = Order.objects.filter(buyer=request.user, status='confirmed').count()
-    completed_count = Order.objects.filter(buyer=request.user, status='completed').count()
-    cancelled_count = Order.objects.filter(buyer=request.user, status='cancelled').count()
+    counts = cached_user_counts(
+        request.user, 'buyer_orders',
+        lambda: status_counts(Order.objects.filter(buyer=request.user))
+    )
+    
+    orders_page = CursorPaginator(orders, 20).get_page(request.GET.get('cursor'))
     
     context = {
-        'orders': orders,
+        'orders': orders_page,
         'status_filter': status_filter,
         'search_query': search_query,
-        'total_orders': total_count,
-        'interested_count': interested_count,
-        'contacted_count': contacted_count,
-        'confirmed_count': confirmed_count,
-        'completed_count': completed_count,
-        'cancelled_count': cancelled_count,
+        'total_orders': counts['total'],
+        'interested_count': counts['interested'],
+        'contacted_count': counts['contacted'],
+        'confirmed_count': counts['confirmed'],
+        'completed_count': counts['completed'],
+        'cancelled_count': counts['cancelled'],
     }
     return render(request, 'marketApp/my_orders.html', context)
 @login_required
 @role_required(allowed_roles=['buyer'])
 def order_detail(request, order_id):
-    order = get_object_or_404(Order, pk=order_id, buyer=request.user)
+    order = get_object_or_404(Order.objects.for_list(), pk=order_id, buyer=request.user)
     context = {
         'order': order,
     }
@@ -472,7 +502,9 @@ def order_detail(request, order_id):
 @login_required
 @role_required(allowed_roles=['buyer'])
 def my_wishlist(request):
-    wishlist_items = Wishlist.objects.filter(user=request.user).order_by('-added_at')
+    wishlist_items = Wishlist.objects.filter(user=request.user).select_related(
+        'product__seller__profile'
+    ).order_by('-added_at')
     context = {
         'wishlist_items': wishlist_items,
     }
@@ -542,40 +574,37 @@ def leave_review(request, order_id):
 @role_required(allowed_roles=['seller'])
 def seller_home(request):
     # Get seller's statistics
-    total_products = Product.objects.filter(seller=request.user).count()
-    active_products = Product.objects.filter(seller=request.user, status='active').count()
-    total_orders = Order.objects.filter(seller=request.user).count()
-    pending_orders = Order.objects.filter(seller=request.user, status='interested').count()
+    def compute_counts():
+        return {
+            'products': status_counts(Product.objects.filter(seller=request.user)),
+            'orders': status_counts(Order.objects.filter(seller=request.user)),
+        }
+    
+    counts = cached_user_counts(request.user, 'seller_home', compute_counts)
     
     # Recent orders
-    recent_orders = Order.objects.filter(seller=request.user).order_by('-created_at')[:5]
+    recent_orders = Order.objects.for_list().filter(seller=request.user).order_by('-created_at')[:5]
     
     # Recent notifications (last 3)
     recent_notifications = Notification.objects.filter(
         user=request.user
     ).order_by('-created_at')[:3]
     
-    # Unread notifications count
-    unread_notifications = Notification.objects.filter(
-        user=request.user,
-        is_read=False
-    ).count()
-    
     context = {
-        'total_products': total_products,
-        'active_products': active_products,
-        'total_orders': total_orders,
-        'pending_orders': pending_orders,
+        'total_products': counts['products']['total'],
+        'active_products': counts['products']['active'],
+        'total_orders': counts['orders']['total'],
+        'pending_orders': counts['orders']['interested'],
         'recent_orders': recent_orders,
         'recent_notifications': recent_notifications,
-        'unread_notifications': unread_notifications,
+        'unread_notifications': request.user.profile.unread_notifications,
     }
     return render(request, 'marketApp/seller_home.html', context)
 
 @login_required
 @role_required(allowed_roles=['seller'])
 def seller_products(request):
-    products = Product.objects.filter(seller=request.user).order_by('-created_at')
+    products = Product.objects.for_cards().filter(seller=request.user).order_by('-created_at')
     
     # Filter by status if provided
     status_filter = request.GET.get('status')
@@ -583,18 +612,18 @@ def seller_products(request):
         products = products.filter(status=status_filter)
     
     # Get counts for tabs
-    total_count = Product.objects.filter(seller=request.user).count()
-    active_count = Product.objects.filter(seller=request.user, status='active').count()
-    sold_count = Product.objects.filter(seller=request.user, status='sold').count()
-    inactive_count = Product.objects.filter(seller=request.user, status='inactive').count()
+    counts = cached_user_counts(
+        request.user, 'seller_products',
+        lambda: status_counts(Product.objects.filter(seller=request.user))
+    )
     
     context = {
         'products': products,
         'status_filter': status_filter,
-        'total_count': total_count,
-        'active_count': active_count,
-        'sold_count': sold_count,
-        'inactive_count': inactive_count,
+        'total_count': counts['total'],
+        'active_count': counts['active'],
+        'sold_count': counts['sold'],
+        'inactive_count': counts['inactive'],
     }
     return render(request, 'marketApp/seller_products.html', context)
 
@@ -608,14 +637,10 @@ def add_product(request):
             product.seller = request.user
             product.save()
             
-            # Debug: Print uploaded files
-            print("FILES received:", request.FILES)
             images = request.FILES.getlist('images')
-            print(f"Number of images: {len(images)}")
             
             # Handle multiple images
             for i, image in enumerate(images):
-                print(f"Saving image {i+1}: {image.name}, size: {image.size}")
                 ProductImage.objects.create(
                     product=product,
                     image=image,
@@ -624,12 +649,10 @@ def add_product(request):
             
             messages.success(request, 'Product added successfully!')
             return redirect('seller_products')
-        else:
-            print("Form errors:", form.errors)
     else:
         form = ProductForm()
     
-    categories = Category.objects.all()
+    categories = get_category_tree()
     
     context = {
         'form': form,
@@ -637,6 +660,28 @@ def add_product(request):
     }
     return render(request, 'marketApp/add_product.html', context)
 
+@login_required
+@role_required(allowed_roles=['seller'])
+def bulk_import_products(request):
+    result = None
+    if request.method == 'POST':
+        form = BulkProductImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            importer = ProductImporter(request.user, form.cleaned_data['images_zip'])
+            # Rows are read and inserted chunk by chunk straight from the upload
+            result = importer.run(read_rows(form.cleaned_data['file'], form.cleaned_data['file_format']))
+    else:
+        form = BulkProductImportForm()
+    
+    context = {
+        'form': form,
+        'result': result,
+        'columns': ProductImportForm.Meta.fields + [IMAGES_COLUMN],
+        'image_separator': IMAGE_SEPARATOR,
+        'import_config': get_import_config(),
+    }
+    return render(request, 'marketApp/bulk_import_products.html', context)
+
 @login_required
 @role_required(allowed_roles=['seller'])
 def edit_product(request, product_id):
@@ -678,19 +723,43 @@ def delete_product(request, product_id):
 @login_required
 @role_required(allowed_roles=['seller'])
 def seller_orders(request):
-    orders = Order.objects.filter(seller=request.user).order_by('-created_at')
+    orders = Order.objects.for_list().filter(seller=request.user).order_by('-created_at')
     
     # Filter by status if provided
     status_filter = request.GET.get('status')
     if status_filter:
         orders = orders.filter(status=status_filter)
     
+    # Get counts for tabs
+    counts = cached_user_counts(
+        request.user, 'seller_orders',
+        lambda: status_counts(Order.objects.filter(seller=request.user))
+    )
+    
+    orders_page = CursorPaginator(orders, 20).get_page(request.GET.get('cursor'))
+    
     context = {
-        'orders': orders,
+        'orders': orders_page,
+        'orders_count': counts[status_filter] if status_filter in counts else counts['total'],
         'status_filter': status_filter,
+        'total_count': counts['total'],
+        'new_count': counts['interested'],
+        'confirmed_count': counts['confirmed'],
+        'completed_count': counts['completed'],
     }
     return render(request, 'marketApp/seller_orders.html', context)
 
+@login_required
+@role_required(allowed_roles=['seller'])
+def export_seller_orders(request):
+    form = OrderFilterForm(request.GET)
+    file_format = request.GET.get('format', 'csv')
+    if not form.is_valid() or file_format not in EXPORT_FORMATS:
+        return HttpResponseBadRequest('Invalid export filters')
+    
+    orders, columns = order_export(form.cleaned_data, seller=request.user)
+    return export_response(orders, columns, file_format, 'orders')
+
 @login_required
 @role_required(allowed_roles=['seller'])
 def update_order_status(request, order_id):
@@ -706,9 +775,9 @@ def update_order_status(request, order_id):
             order.notes = notes
             order.save()
             
-            # Create notification for buyer
-            Notification.objects.create(
-                user=order.buyer,
+            # Notify the buyer, written by the dispatcher after the response
+            notify(
+                [order.buyer_id],
                 notification_type='order',
                 title='Order Status Updated',
                 message=f"Your order #{order.order_number} status changed from {old_status} to {new_status}",
@@ -722,34 +791,50 @@ def update_order_status(request, order_id):
 @login_required
 @role_required(allowed_roles=['seller'])
 def seller_reviews(request):
-    reviews = Review.objects.filter(seller=request.user).order_by('-created_at')
+    reviews = Review.objects.filter(seller=request.user).select_related(
+        'reviewer', 'product'
+    ).order_by('-created_at')
     
-    # Calculate average rating
-    avg_rating = reviews.aggregate(Avg('rating'))['rating__avg'] or 0
+    # Average and distribution come from the profile's rating histogram
+    profile = request.user.profile
     
     context = {
         'reviews': reviews,
-        'avg_rating': avg_rating,
-        'total_reviews': reviews.count(),
+        'avg_rating': profile.rating,
+        'total_reviews': profile.total_ratings,
+        'rating_distribution': profile.rating_distribution(),
     }
     return render(request, 'marketApp/seller_reviews.html', context)
 
 @login_required
 @role_required(allowed_roles=['seller'])
 def seller_analytics(request):
-    # You would typically implement more complex analytics here
-    # This is a basic implementation
+    # Served from the daily Analytics rollups (see rollup_analytics command)
+    days = request.GET.get('days', '30')
+    days = int(days) if days in ['7', '30', '90'] else 30
+    
+    series = seller_time_series(request.user, days=days)
+    lifetime = seller_totals(request.user)
+    period = seller_totals(request.user, since=series[0].date)
+    
+    chart_data = {
+        'labels': [day.date.strftime('%b %d') for day in series],
+        'views': [day.products_viewed for day in series],
+        'sales': [day.products_sold for day in series],
+        'revenue': [float(day.total_revenue) for day in series],
+        'contacts': [day.whatsapp_contacts for day in series],
+    }
     
-    # Fix: Use Sum instead of models.Sum
     context = {
-        'total_sales': Order.objects.filter(seller=request.user, status='completed').count(),
-        'total_revenue': Order.objects.filter(
-            seller=request.user, 
-            status='completed'
-        ).aggregate(Sum('agreed_price'))['agreed_price__sum'] or 0,
-        'total_views': Product.objects.filter(
-            seller=request.user
-        ).aggregate(Sum('views'))['views__sum'] or 0,
+        'days': days,
+        'series': series,
+        'chart_data': chart_data,
+        'period': period,
+        'total_sales': lifetime['sales'],
+        'total_revenue': lifetime['revenue'],
+        'total_views': lifetime['views'],
+        'total_contacts': lifetime['contacts'],
+        'last_rollup': get_watermark(),
     }
     return render(request, 'marketApp/seller_analytics.html', context)
 
@@ -782,19 +867,20 @@ def view_profile(request, username):
     # Get user's products if they are a seller
     products = None
     if profile.role == 'seller':
-        products = Product.objects.filter(
+        products = Product.objects.for_cards().filter(
             seller=user,
             status='active'
         ).order_by('-created_at')[:6]
     
     # Get user's reviews
-    reviews = Review.objects.filter(seller=user).order_by('-created_at')[:5]
+    reviews = Review.objects.filter(seller=user).select_related('reviewer').order_by('-created_at')[:5]
     
     context = {
         'viewed_user': user,
         'viewed_profile': profile,
         'products': products,
         'reviews': reviews,
+        'rating_distribution': profile.rating_distribution(),
     }
     return render(request, 'marketApp/view_profile.html', context)
 
@@ -819,31 +905,34 @@ def notifications(request):
         notifications_qs = notifications_qs.filter(notification_type='system')
     
     # Counts for tabs
-    total_count = Notification.objects.filter(user=request.user).count()
-    unread_count = Notification.objects.filter(user=request.user, is_read=False).count()
-    order_count = Notification.objects.filter(user=request.user, notification_type='order').count()
-    message_count = Notification.objects.filter(user=request.user, notification_type='message').count()
-    system_count = Notification.objects.filter(user=request.user, notification_type='system').count()
+    counts = cached_user_counts(
+        request.user, 'notifications',
+        lambda: status_counts(
+            Notification.objects.filter(user=request.user),
+            field='notification_type',
+            values=['order', 'message', 'system'],
+        )
+    )
     
     # Pagination
-    paginator = Paginator(notifications_qs, 20)
-    page_number = request.GET.get('page')
-    notifications_page = paginator.get_page(page_number)
+    paginator = CursorPaginator(notifications_qs, 20)
+    notifications_page = paginator.get_page(request.GET.get('cursor'))
     
     context = {
         'notifications': notifications_page,
         'active_tab': active_tab,
-        'total_count': total_count,
-        'unread_count': unread_count,
-        'order_count': order_count,
-        'message_count': message_count,
-        'system_count': system_count,
+        'total_count': counts['total'],
+        'unread_count': unread_notifications(request),
+        'order_count': counts['order'],
+        'message_count': counts['message'],
+        'system_count': counts['system'],
     }
     return render(request, 'marketApp/notifications.html', context)
 
 @login_required
 def mark_all_read(request):
-    Notification.objects.filter(user=request.user, is_read=False).update(is_read=True)
+    Notification.objects.filter(user=request.user).mark_read()
+    notifications_changed(request.user.pk)
     messages.success(request, 'All notifications marked as read.')
     return redirect('notifications')
 
@@ -856,28 +945,111 @@ def delete_notification(request, notification_id):
 
 @login_required
 def clear_notifications(request):
+    # Queryset delete, so the unread counter is adjusted once rather than per row
     Notification.objects.filter(user=request.user).delete()
     messages.success(request, 'All notifications cleared.')
     return redirect('notifications')
 
+def notifications_changed(user_id):
+    """Refresh cached counts and wake up streams after an update() on notifications"""
+    invalidate_user_counts(user_id)
+    bump_notification_version(user_id)
+
+def not_modified_since_last_poll(request):
+    """Return a 304 response when the client's ETag still matches, otherwise (None, etag)"""
+    etag = notification_etag(request.user.pk, get_notification_version(request.user.pk))
+    if request.headers.get('If-None-Match') == etag:
+        return HttpResponseNotModified(headers={'ETag': etag}), etag
+    return None, etag
+
+def unread_notifications(request):
+    """The counter on the profile ProfileBackend loaded with the user, no extra query"""
+    profile = get_profile(request)
+    return profile.unread_notifications if profile else 0
+
 @login_required
 def check_notifications(request):
-    unread_count = Notification.objects.filter(user=request.user, is_read=False).count()
-    return JsonResponse({'unread_count': unread_count})
+    not_modified, etag = not_modified_since_last_poll(request)
+    if not_modified:
+        return not_modified
+    unread_count = unread_notifications(request)
+    return JsonResponse({'unread_count': unread_count}, headers={'ETag': etag})
+
+@login_required
+async def notification_stream(request):
+    """Server-Sent Events stream of unread counts and new notifications (ASGI only)"""
+    user = await request.auser()
+    
+    if not push_enabled(request):
+        # A WSGI worker can't hold the connection open, tell the client to poll instead
+        return StreamingHttpResponse(
+            iter([sse_event('fallback', {'poll_url': reverse('poll_notifications')})]),
+            content_type='text/event-stream'
+        )
+    
+    last_id = request.headers.get('Last-Event-ID', '')
+    last_id = int(last_id) if last_id.isdigit() else await latest_notification_id(user)
+    
+    response = StreamingHttpResponse(event_stream(user, last_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+@login_required
+async def poll_notifications(request):
+    """
+    Long-poll fallback for the notification stream. A request whose
+    If-None-Match matches the current ETag waits up to `wait` seconds
+    for a change and gets a 304 if nothing happened. Without push (see
+    realtime.push_enabled) it is a plain conditional GET answered at once,
+    with a Retry-After telling the client how long to wait before the next.
+    """
+    user = await request.auser()
+    version = await aget_notification_version(user.pk)
+    config = get_realtime_config()
+    push = push_enabled(request)
+    headers = {} if push else {'Retry-After': str(config['POLL_RETRY'])}
+    
+    if request.headers.get('If-None-Match') == notification_etag(user.pk, version):
+        if push:
+            timeout = config['LONG_POLL_TIMEOUT']
+            wait = request.GET.get('wait', str(timeout))
+            wait = min(int(wait), timeout) if wait.isdigit() else timeout
+            version = await wait_for_change(user.pk, version, wait)
+        etag = notification_etag(user.pk, version)
+        if request.headers.get('If-None-Match') == etag:
+            return HttpResponseNotModified(headers={'ETag': etag, **headers})
+    
+    count = await unread_count(user)
+    headers['ETag'] = notification_etag(user.pk, version)
+    return JsonResponse({'unread_count': count}, headers=headers)
 
 @require_POST
 @login_required
 def mark_as_read(request, notification_id):
     notification = get_object_or_404(Notification, id=notification_id, user=request.user)
-    notification.is_read = True
-    notification.save()
+    if notification.mark_as_read():
+        notifications_changed(request.user.pk)
     return JsonResponse({'success': True})
 
 # ==================== MESSAGING VIEWS ====================
 
 @login_required
 def messages_list(request):
-    conversations = Conversation.objects.filter(participants=request.user).order_by('-updated_at')
+    # One row per thread with its preview and this user's unread count,
+    # plus one query for the other participants
+    memberships = ConversationParticipant.objects.filter(user=request.user).select_related(
+        'conversation__last_message__sender', 'conversation__product'
+    ).prefetch_related('conversation__participants').order_by('-conversation__updated_at')
+    
+    conversations = []
+    for membership in memberships:
+        conversation = membership.conversation
+        conversation.unread_count = membership.unread_count
+        conversation.other_user = next(
+            (user for user in conversation.participants.all() if user.pk != request.user.pk), None
+        )
+        conversations.append(conversation)
     
     context = {
         'conversations': conversations,
@@ -889,22 +1061,30 @@ def conversation_detail(request, conversation_id):
     conversation = get_object_or_404(Conversation, pk=conversation_id, participants=request.user)
     
     # Mark all messages as read
-    conversation.messages.filter(is_read=False).exclude(sender=request.user).update(is_read=True)
+    ConversationParticipant.mark_read(conversation.pk, request.user.pk)
     
     if request.method == 'POST':
         content = request.POST.get('content', '').strip()
         if content:
+            # Message.save() updates the thread's last_message and unread counts
             Message.objects.create(
                 conversation=conversation,
                 sender=request.user,
                 content=content
             )
-            conversation.save()  # Update updated_at
             return redirect('conversation_detail', conversation_id=conversation_id)
     
+    # Newest messages first, "next" pages go back in time
+    paginator = CursorPaginator(
+        conversation.messages.select_related('sender').order_by('-created_at'), 30
+    )
+    messages_page = paginator.get_page(request.GET.get('cursor'))
+    
     context = {
         'conversation': conversation,
         'other_user': conversation.get_other_participant(request.user),
+        'messages_page': messages_page,
+        'thread_messages': list(reversed(messages_page.object_list)),
     }
     return render(request, 'marketApp/conversation_detail.html', context)
 
@@ -912,12 +1092,8 @@ def conversation_detail(request, conversation_id):
 def start_conversation(request, user_id):
     other_user = get_object_or_404(User, pk=user_id)
     
-    # Check if conversation already exists
-    conversation = Conversation.objects.filter(participants=request.user).filter(participants=other_user).first()
-    
-    if not conversation:
-        conversation = Conversation.objects.create()
-        conversation.participants.add(request.user, other_user)
+    # One lookup on the participant-pair key, created on first contact
+    conversation = Conversation.get_or_create_for(request.user, other_user)
     
     return redirect('conversation_detail', conversation_id=conversation.id)
 
@@ -994,8 +1170,11 @@ def api_toggle_wishlist(request):
 
 @login_required
 def api_notifications_count(request):
-    count = Notification.objects.filter(user=request.user, is_read=False).count()
-    return JsonResponse({'count': count})
+    not_modified, etag = not_modified_since_last_poll(request)
+    if not_modified:
+        return not_modified
+    count = unread_notifications(request)
+    return JsonResponse({'count': count}, headers={'ETag': etag})
 
 # ==================== ADMIN VIEWS ====================
 
@@ -1032,6 +1211,31 @@ def admin_reports(request):
     }
     return render(request, 'marketApp/admin_reports.html', context)
 
+@login_required
+@role_required(allowed_roles=['admin'])
+def admin_export(request, dataset):
+    form = OrderFilterForm(request.GET)
+    file_format = request.GET.get('format', 'csv')
+    if not form.is_valid() or file_format not in EXPORT_FORMATS:
+        return HttpResponseBadRequest('Invalid export filters')
+    
+    if dataset == 'orders':
+        queryset, columns = order_export(form.cleaned_data)
+    else:
+        queryset, columns = contact_export(form.cleaned_data)
+    return export_response(queryset, columns, file_format, dataset)
+
+@login_required
+@role_required(allowed_roles=['admin'])
+def admin_metrics(request):
+    """Per-URL latency and query histograms of this process over the rolling window"""
+    config = get_metrics_config()
+    return JsonResponse({
+        'enabled': config['ENABLED'],
+        'window_minutes': config['WINDOW_MINUTES'],
+        'views': get_histograms().snapshot() if config['ENABLED'] else {},
+    })
+
 @login_required
 @role_required(allowed_roles=['admin'])
 def admin_update_report(request, report_id):
@@ -1054,8 +1258,8 @@ def admin_update_report(request, report_id):
 def mark_notification_read(request, notification_id):
     """Mark a specific notification as read"""
     notification = get_object_or_404(Notification, id=notification_id, user=request.user)
-    notification.is_read = True
-    notification.save()
+    if notification.mark_as_read():
+        notifications_changed(request.user.pk)
     return JsonResponse({'success': True})
 @login_required
 @require_POST
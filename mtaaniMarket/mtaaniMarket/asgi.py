@@ -2,6 +2,8 @@
 ASGI config for mtaaniMarket project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+The live notification stream (notifications/stream/) needs an ASGI server
+such as uvicorn or daphne; under WSGI clients fall back to long-polling.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
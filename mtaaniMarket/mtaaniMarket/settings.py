@@ -29,15 +29,23 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'marketApp.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'marketApp.routers.ReplicaMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
+    'marketApp.middleware.ProfileMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Loads request.user and its profile in a single query
+AUTHENTICATION_BACKENDS = [
+    'marketApp.backends.ProfileBackend',
+]
+
 ROOT_URLCONF = 'mtaaniMarket.urls'
 
 TEMPLATES = [
@@ -50,6 +58,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'marketApp.context_processors.categories_processor',
             ],
         },
     },
@@ -64,9 +73,24 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Take the write lock when a transaction starts instead of failing
+            # with "database is locked" when a read transaction later writes
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
+# Read replicas, e.g. a copy of the SQLite file kept fresh with
+# `manage.py sync_replicas`, listed in MARKET_DATABASE_REPLICAS['ALIASES']:
+# DATABASES['replica'] = {
+#     'ENGINE': 'django.db.backends.sqlite3',
+#     'NAME': BASE_DIR / 'db-replica.sqlite3',
+#     'TEST': {'MIRROR': 'default'},
+# }
+
+DATABASE_ROUTERS = ['marketApp.routers.ReplicaRouter']
+
 
 
 
@@ -100,3 +124,104 @@ MEDIA_ROOT = BASE_DIR / 'media'
 
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Product views are buffered in memory and written in batches
+MARKET_VIEW_COUNTER = {
+    'ENABLED': True,
+    'FLUSH_INTERVAL': 10,
+    'FLUSH_THRESHOLD': 500,
+}
+
+# Resized product image variants (see marketApp/images.py)
+MARKET_IMAGE_VARIANTS = {
+    'WIDTHS': [200, 400, 800],
+    'FORMATS': ['webp', 'jpeg'],
+    'QUALITY': 80,
+    'WORKERS': 2,
+    'ASYNC': True,
+}
+
+# Seconds per-user dashboard counts are cached (0 disables the cache)
+MARKET_COUNTER_CACHE_TIMEOUT = 300
+
+# Seconds the category tree is cached, it is also rebuilt on any change (0 disables the cache)
+MARKET_CATEGORY_CACHE_TIMEOUT = 3600
+
+# Seconds public pages (home, about, category and product pages) are cached,
+# Product, ProductImage, Category and Review changes invalidate them earlier (0 disables the cache).
+# Any cache backend works; use a shared one (file-based, ...) when running several processes,
+# e.g. CACHES = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+#                            'LOCATION': BASE_DIR / 'cache'}}
+MARKET_PAGE_CACHE_TIMEOUT = 600
+
+# Pragmas run on every new SQLite connection (see marketApp/database.py).
+# Production databases should set 'JOURNAL_MODE': 'WAL' with 'SYNCHRONOUS':
+# 'NORMAL'; the committed dev db.sqlite3 keeps its rollback journal.
+MARKET_SQLITE_PRAGMAS = {
+    'ENABLED': True,
+    'JOURNAL_MODE': None,
+    'BUSY_TIMEOUT': 5000,
+    'SYNCHRONOUS': None,
+    'MMAP_SIZE': 134217728,
+    'CACHE_SIZE': -64000,
+    'TEMP_STORE': 'MEMORY',
+}
+
+# Database aliases marketApp reads are spread over (see marketApp/routers.py),
+# a session reads the primary for STICKY_SECONDS after it writes
+MARKET_DATABASE_REPLICAS = {
+    'ALIASES': [],
+    'STICKY_SECONDS': 5,
+}
+
+# Seller bulk product import (see marketApp/imports.py)
+MARKET_PRODUCT_IMPORT = {
+    'CHUNK_SIZE': 200,
+    'MAX_ERRORS': 100,
+    'MAX_IMAGES_PER_ROW': 10,
+    'MAX_IMAGE_BYTES': 5242880,
+    'DOWNLOAD_TIMEOUT': 10,
+    'ASYNC': True,
+    'ARCHIVE_MAX_AGE_HOURS': 24,
+}
+
+# Notification stream and long-poll (see marketApp/realtime.py). PUSH holds
+# connections open, which needs an ASGI server and a shared CACHES backend;
+# under WSGI or with the default per-process cache clients poll every
+# POLL_RETRY seconds.
+MARKET_REALTIME = {
+    'PUSH': False,
+    'LONG_POLL_TIMEOUT': 25,
+    'POLL_RETRY': 30,
+}
+
+# Per-request SQL/template/total timings as Server-Timing headers, slow request
+# logging and per-URL histograms at /marketApp/admin/metrics/ (see marketApp/metrics.py).
+# When disabled the middleware removes itself from the chain.
+MARKET_REQUEST_METRICS = {
+    'ENABLED': DEBUG,
+    'SLOW_REQUEST_MS': 500,
+    'WORST_QUERIES': 5,
+    'BUCKETS_MS': [10, 25, 50, 100, 250, 500, 1000, 2500, 5000],
+    'WINDOW_MINUTES': 60,
+}
+
+# Notification fan-out (see marketApp/notifications.py): recipients are written
+# with bulk_create in chunks on a background thread after the request commits
+MARKET_NOTIFICATIONS = {
+    'CHUNK_SIZE': 1000,
+    'COALESCE_SECONDS': 3600,
+    'ASYNC': True,
+}
+
+# Price-drop and back-in-stock alerts for wishlists (see marketApp/alerts.py)
+MARKET_WISHLIST_ALERTS = {
+    'ENABLED': True,
+    'ASYNC': True,
+    'FLUSH_INTERVAL': 2,
+    'MIN_DROP_PERCENT': 0,
+    'PRODUCT_BATCH': 200,
+    'MAX_PER_USER': 5,
+    'RATE_WINDOW_HOURS': 24,
+}